@@ -0,0 +1,411 @@
+"""Benchmarks of the topology generator, the policy rendering and the transforms.
+
+Each scenario synthesizes a topology by scaling the spines and leaves of
+TEMPLATE_TOPOLOGY, builds it with the bootstrap scripts against the in-memory
+stand-in of tests/standin and measures the number of requests and mutations,
+the wall time and the peak memory of every stage:
+
+    python -m benchmarks.run --scenario 2x4 --scenario 4x32
+    python -m benchmarks.run --update  # records the results as the new baselines
+
+The requests, the mutations and the peak memory, which barely depend on the
+machine, are compared to the baselines. The counts can't grow, the peak memory
+has a tolerance. The wall time is reported for information, the peak memory is
+traced with tracemalloc and the wall times include its overhead. A stage that
+fails, or a topology planned with errors, is never recorded as a baseline.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from unittest import mock
+
+from infrahub_sdk import Config, InfrahubClient
+from infrahub_sdk.node import InfrahubNode
+from infrahub_sdk.template import Jinja2Template
+
+PROJECT_DIRECTORY = Path(__file__).parent.parent
+sys.path.append(str(PROJECT_DIRECTORY))
+sys.path.append(str(PROJECT_DIRECTORY / "bootstrap"))
+
+import create_basic  # noqa: E402
+import create_location  # noqa: E402
+import create_security_nodes  # noqa: E402
+import create_topology  # noqa: E402
+import generate_topology  # noqa: E402
+
+from generators.render_security_policy import (  # noqa: E402
+    LocationHierarchy,
+    find_device_policies,
+    render_policy_for_device,
+)
+from tests.standin.backend import MemoryBackend, StoredNode  # noqa: E402
+from tests.standin.requester import StandInRequester  # noqa: E402
+from tests.standin.schema import SchemaRegistry  # noqa: E402
+from transforms.openconfig import OCInterfaces  # noqa: E402
+
+LOG = logging.getLogger("benchmarks")
+
+BASELINES_FILE = PROJECT_DIRECTORY / "benchmarks" / "baselines.json"
+
+# Topology whose elements are scaled, with its location and strategy
+TEMPLATE_TOPOLOGY = "fra05-pod1"
+
+# Spines x leaves of each scenario, with the spine device type when the one of
+# TEMPLATE_TOPOLOGY does not have enough ports for the leaves
+SCENARIOS = {
+    "2x4": (2, 4, None),
+    "4x32": (4, 32, None),
+    "8x128": (8, 128, "DCS-7816R3"),
+    "16x512": (16, 512, "DCS-7816R3"),
+}
+DEFAULT_SCENARIOS = ["2x4", "4x32"]
+
+# Length of the prefixes allocated from the location supernets, a /18 per role
+# gives the loopbacks and the /31 interconnects of 16 spines and 512 leaves
+LOCATION_PREFIX_LENGTH = 18
+
+# Metrics compared to the baselines with the increase they are allowed, as a
+# fraction. The counts are deterministic against the stand-in, the peak memory
+# varies slightly with the Python version and the installed packages.
+THRESHOLDS = {"requests": 0.0, "mutations": 0.0, "peak_memory": 0.1}
+
+# Startup configurations rendered per platform group, as in .infrahub.yml
+TEMPLATES = {
+    "arista_devices": (
+        "templates/device_info.gql",
+        "templates/device_arista_config.tpl.j2",
+    ),
+    "cisco_devices": (
+        "templates/device_info.gql",
+        "templates/device_cisco_config.tpl.j2",
+    ),
+    "firewall_devices": (
+        "templates/juniper_srx_config.gql",
+        "templates/juniper_srx_config.j2",
+    ),
+}
+OC_INTERFACES_QUERY = "transforms/oc_interfaces.gql"
+
+
+def topology_name(scenario: str) -> str:
+    return f"bench-{scenario}"
+
+
+def scaled_topology(scenario: str) -> Tuple[Tuple, List[Tuple]]:
+    """Returns the TOPOLOGY entry and the TOPOLOGY_ELEMENTS of a scenario."""
+    spines, leaves, spine_device_type = SCENARIOS[scenario]
+    _, description, location, strategy = next(
+        topology
+        for topology in create_topology.TOPOLOGY
+        if topology[0] == TEMPLATE_TOPOLOGY
+    )
+    elements = [
+        (spines, role, spine_device_type or device_type, *element)
+        if role == "spine"
+        else (leaves, role, device_type, *element)
+        for _, role, device_type, *element in create_topology.TOPOLOGY_ELEMENTS[
+            TEMPLATE_TOPOLOGY
+        ]
+    ]
+    return (
+        topology_name(scenario),
+        f"{description} ({spines} spines, {leaves} leaves)",
+        location,
+        strategy,
+    ), elements
+
+
+class ScaledBackend(MemoryBackend):
+    """Stand-in allocating LOCATION_PREFIX_LENGTH prefixes from the location pools."""
+
+    def _allocate_prefix(self, data: Dict[str, Any]) -> StoredNode:
+        pool = self.nodes[data["id"]]
+        if self._attr_value(pool, "name").startswith("supernet-"):
+            data = {**data, "prefix_length": LOCATION_PREFIX_LENGTH}
+        return super()._allocate_prefix(data)
+
+
+class ErrorRecords(logging.Handler):
+    """Keeps the errors logged by the bootstrap scripts."""
+
+    def __init__(self) -> None:
+        super().__init__(level=logging.ERROR)
+        self.messages: List[str] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.messages.append(record.getMessage())
+
+
+class Benchmark:
+    """Builds the topology of a scenario and measures its stages."""
+
+    def __init__(self, scenario: str, latency: float = 0.0) -> None:
+        self.scenario = scenario
+        self.topology = topology_name(scenario)
+        self.backend = ScaledBackend(SchemaRegistry([PROJECT_DIRECTORY / "schemas"]))
+        self.requester = StandInRequester(backend=self.backend)
+        self.latency = latency
+        self.client = InfrahubClient(
+            config=Config(
+                address="http://standin", requester=self.requester, api_token="x"
+            )
+        )
+        # The bootstrap scripts are quiet, only the results are logged
+        self.log = logging.getLogger("benchmarks.bootstrap")
+
+    async def setup(self) -> None:
+        # The locations are built with random values
+        random.seed(0)
+        topology, elements = scaled_topology(self.scenario)
+        with (
+            mock.patch.object(create_topology, "TOPOLOGY", (topology,)),
+            mock.patch.dict(
+                create_topology.TOPOLOGY_ELEMENTS, {self.topology: elements}
+            ),
+        ):
+            for module in (
+                create_basic,
+                create_location,
+                create_topology,
+                create_security_nodes,
+            ):
+                await module.run(client=self.client, log=self.log, branch="main")
+        self.requester.latency = self.latency
+
+    async def measure(self, stage: Callable[[], Awaitable[Any]]) -> Dict[str, float]:
+        requests = len(self.requester.requests)
+        mutations = self.backend.stats["mutation"]
+        tracemalloc.reset_peak()
+        start = time.perf_counter()
+        await stage()
+        wall_time = time.perf_counter() - start
+        _, peak_memory = tracemalloc.get_traced_memory()
+        return {
+            "wall_time": round(wall_time, 3),
+            "requests": len(self.requester.requests) - requests,
+            "mutations": self.backend.stats["mutation"] - mutations,
+            "peak_memory": peak_memory,
+        }
+
+    async def generate_topology(self) -> None:
+        errors = ErrorRecords()
+        self.log.addHandler(errors)
+        try:
+            await generate_topology.run(
+                client=self.client, log=self.log, branch="main", topology=self.topology
+            )
+        finally:
+            self.log.removeHandler(errors)
+        # The plan errors are logged, the topology is then only partially built
+        if errors.messages:
+            raise RuntimeError(f"Incomplete topology: {errors.messages[0]}")
+
+    async def render_policies(self) -> None:
+        hierarchy = LocationHierarchy(client=self.client)
+        for firewall in await self.client.all(kind="SecurityFirewall"):
+            policies = await find_device_policies(firewall, hierarchy)
+            await render_policy_for_device(self.client, firewall, policies)
+
+    async def oc_interfaces(self) -> None:
+        query = (PROJECT_DIRECTORY / OC_INTERFACES_QUERY).read_text()
+        transform = OCInterfaces(client=self.client, infrahub_node=InfrahubNode)
+        for device in await self.devices():
+            data = await self.client.execute_graphql(
+                query=query, variables={"device": device.name.value}
+            )
+            await transform.transform(data=data)
+
+    async def templates(self) -> None:
+        devices = [
+            (
+                device,
+                f"{device.platform.peer.name.value.lower().split(' ', 1)[0]}_devices",
+            )
+            for device in await self.devices()
+        ]
+        devices.extend(
+            (firewall, "firewall_devices")
+            for firewall in await self.client.all(kind="SecurityFirewall")
+        )
+        templates: Dict[str, Jinja2Template] = {}
+        for device, group in devices:
+            query_file, template_file = TEMPLATES[group]
+            if template_file not in templates:
+                templates[template_file] = Jinja2Template(
+                    template=Path(template_file), template_directory=PROJECT_DIRECTORY
+                )
+            data = await self.client.execute_graphql(
+                query=(PROJECT_DIRECTORY / query_file).read_text(),
+                variables={"device": device.name.value},
+            )
+            await templates[template_file].render(variables={"data": data})
+
+    async def devices(self) -> List[InfrahubNode]:
+        return await self.client.filters(
+            kind="InfraDevice",
+            topology__name__value=self.topology,
+            prefetch_relationships=True,
+        )
+
+    async def run(self) -> Dict[str, Dict[str, Any]]:
+        await self.setup()
+        results: Dict[str, Dict[str, Any]] = {}
+        for name, stage in (
+            ("generate_topology", self.generate_topology),
+            ("render_policy", self.render_policies),
+            ("oc_interfaces", self.oc_interfaces),
+            ("templates", self.templates),
+        ):
+            try:
+                results[name] = await self.measure(stage)
+            except Exception as exc:
+                # The next stages depend on this one
+                results[name] = {"error": f"{type(exc).__name__}: {exc}"}
+                break
+            LOG.info(
+                f"{self.scenario:<8} {name:<18} {results[name]['wall_time']:>8.2f}s"
+                f" {results[name]['requests']:>7} requests"
+                f" {results[name]['mutations']:>7} mutations"
+                f" {results[name]['peak_memory'] / 2**20:>8.1f}MiB"
+            )
+        return results
+
+
+def compare(
+    results: Dict[str, Dict[str, Dict[str, Any]]],
+    baselines: Dict[str, Dict[str, Dict[str, Any]]],
+    thresholds: Optional[Dict[str, float]] = None,
+) -> List[str]:
+    """Returns the regressions of the results over the baselines.
+
+    A gated metric missing from the baseline of a stage is a regression as well,
+    the baselines have to be recorded again.
+    """
+    thresholds = thresholds or THRESHOLDS
+    regressions = []
+    for scenario, stages in results.items():
+        for stage, metrics in stages.items():
+            # A failed stage is a regression, with or without a baseline
+            if "error" in metrics:
+                regressions.append(f"{scenario} {stage}: {metrics['error']}")
+                continue
+            baseline = baselines.get(scenario, {}).get(stage)
+            if baseline is None:
+                continue
+            for metric, threshold in thresholds.items():
+                if metric not in baseline:
+                    regressions.append(
+                        f"{scenario} {stage}: no baseline for {metric},"
+                        " record the baselines with --update"
+                    )
+                    continue
+                value = metrics[metric]
+                if value > baseline[metric] * (1 + threshold):
+                    regressions.append(
+                        f"{scenario} {stage}: {metric} {value}"
+                        f" over the baseline {baseline[metric]}"
+                    )
+    return regressions
+
+
+async def run_scenarios(
+    scenarios: List[str], latency: float
+) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    tracemalloc.start()
+    try:
+        return {
+            scenario: await Benchmark(scenario=scenario, latency=latency).run()
+            for scenario in scenarios
+        }
+    finally:
+        tracemalloc.stop()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=list(SCENARIOS),
+        help="Scenario to run, can be repeated"
+        f" (default: {', '.join(DEFAULT_SCENARIOS)})",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="Latency (in seconds) added to each request of the measured stages",
+    )
+    parser.add_argument(
+        "--memory-threshold",
+        type=float,
+        default=THRESHOLDS["peak_memory"],
+        help="Allowed increase of the peak memory over the baselines, as a fraction",
+    )
+    parser.add_argument(
+        "--baselines", type=Path, default=BASELINES_FILE, help="Baselines JSON file"
+    )
+    parser.add_argument(
+        "--update", action="store_true", help="Record the results as the baselines"
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    logging.getLogger("benchmarks.bootstrap").setLevel(logging.WARNING)
+
+    results = asyncio.run(
+        run_scenarios(
+            scenarios=args.scenario or DEFAULT_SCENARIOS, latency=args.latency
+        )
+    )
+    failures = [
+        f"{scenario:<8} {stage:<18} {metrics['error']}"
+        for scenario, stages in results.items()
+        for stage, metrics in stages.items()
+        if "error" in metrics
+    ]
+    for failure in failures:
+        LOG.error(failure)
+
+    baselines = (
+        json.loads(args.baselines.read_text()) if args.baselines.exists() else {}
+    )
+    if args.update:
+        if failures:
+            LOG.error(f"Baselines not written to {args.baselines}, a stage failed")
+            return 1
+        baselines.update(
+            {
+                scenario: {
+                    stage: {metric: metrics[metric] for metric in THRESHOLDS}
+                    for stage, metrics in stages.items()
+                }
+                for scenario, stages in results.items()
+            }
+        )
+        args.baselines.write_text(
+            json.dumps(baselines, indent=2, sort_keys=True) + "\n"
+        )
+        LOG.info(f"Baselines written to {args.baselines}")
+        return 0
+
+    regressions = compare(
+        results=results,
+        baselines=baselines,
+        thresholds={**THRESHOLDS, "peak_memory": args.memory_threshold},
+    )
+    for regression in regressions:
+        LOG.error(regression)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
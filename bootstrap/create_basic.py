@@ -4,7 +4,8 @@ from ipaddress import IPv4Network
 from infrahub_sdk.batch import InfrahubBatch
 from infrahub_sdk import InfrahubClient
 
-from utils import create_and_add_to_batch, create_ipam_pool, execute_batch
+from instrumentation import instrument_run
+from utils import NodeCache, create_and_add_to_batch, create_ipam_pool, execute_batch
 
 # flake8: noqa
 # pylint: skip-file
@@ -118,6 +119,8 @@ DEVICE_TYPES = (
     ("MX204", "MX204-HWBASE-AC-FS", 1, False, "Juniper JunOS"),
     ("CCS-720DP-48S-2F", None, 1, False, "Arista EOS"),
     ("DCS-7280DR3-24-F", None, 1, False, "Arista EOS"),
+    ("DCS-7060DX5-64S", None, 2, False, "Arista EOS"),
+    ("DCS-7816R3", None, 29, True, "Arista EOS"),
     ("NCS-5501-SE", None, 1, False, "Cisco IOS-XR"),
     ("ASR1002-HX", None, 2, True, "Cisco IOS-XR"),
 )
@@ -159,8 +162,26 @@ INTERNAL_NETWORKS = [
     "172.16.0.0/12",
 ]
 
+# Kinds compared with their desired state before being saved
+CACHED_KINDS = [
+    "CoreAccount",
+    "CoreStandardGroup",
+    "OrganizationManufacturer",
+    "OrganizationProvider",
+    "OrganizationTenant",
+    "InfraAutonomousSystem",
+    "BuiltinTag",
+    "InfraPlatform",
+    "InfraDeviceType",
+    "InfraBGPPeerGroup",
+    "InfraRouteTarget",
+    "InfraVRF",
+]
+
 
-async def create_basics(client: InfrahubClient, log: logging.Logger, branch: str):
+async def create_basics(
+    client: InfrahubClient, log: logging.Logger, branch: str, cache: NodeCache
+):
     # Create Batch for Accounts, Platforms, and Standards Groups
     log.info("Creating User Accounts, Platforms, and Standard Groups")
     batch = await client.create_batch()
@@ -182,6 +203,7 @@ async def create_basics(client: InfrahubClient, log: logging.Logger, branch: str
             kind_name="CoreAccount",
             data=data,
             batch=batch,
+            cache=cache,
         )
 
     # ------------------------------------------
@@ -200,6 +222,7 @@ async def create_basics(client: InfrahubClient, log: logging.Logger, branch: str
             kind_name="CoreStandardGroup",
             data=data,
             batch=batch,
+            cache=cache,
         )
 
     async for node, _ in batch.execute():
@@ -226,6 +249,7 @@ async def create_basics(client: InfrahubClient, log: logging.Logger, branch: str
             kind_name=f"Organization{org[1].title()}",
             data=data_org,
             batch=batch,
+            cache=cache,
         )
     async for node, _ in batch.execute():
         # accessor = f"{node._schema.human_friendly_id.split('__')[0]}"
@@ -268,6 +292,7 @@ async def create_basics(client: InfrahubClient, log: logging.Logger, branch: str
             kind_name="InfraAutonomousSystem",
             data=data_asn,
             batch=batch,
+            cache=cache,
         )
     # Generate 11 private ASNs for Duff
     for asn in range(65000, 65010):
@@ -292,6 +317,7 @@ async def create_basics(client: InfrahubClient, log: logging.Logger, branch: str
             kind_name="InfraAutonomousSystem",
             data=data_asn,
             batch=batch,
+            cache=cache,
         )
     async for node, _ in batch.execute():
         accessor = f"{node._schema.human_friendly_id[0].split('__')[0]}"
@@ -315,6 +341,7 @@ async def create_basics(client: InfrahubClient, log: logging.Logger, branch: str
             kind_name="BuiltinTag",
             data=data,
             batch=batch,
+            cache=cache,
         )
     async for node, _ in batch.execute():
         accessor = f"{node._schema.default_filter.split('__')[0]}"
@@ -349,6 +376,7 @@ async def create_basics(client: InfrahubClient, log: logging.Logger, branch: str
             kind_name="InfraPlatform",
             data=data,
             batch=batch,
+            cache=cache,
         )
     async for node, _ in batch.execute():
         accessor = f"{node._schema.human_friendly_id[0].split('__')[0]}"
@@ -384,6 +412,7 @@ async def create_basics(client: InfrahubClient, log: logging.Logger, branch: str
             kind_name="InfraDeviceType",
             data=data,
             batch=batch,
+            cache=cache,
         )
     async for node, _ in batch.execute():
         accessor = f"{node._schema.human_friendly_id[0].split('__')[0]}"
@@ -424,6 +453,7 @@ async def create_basics(client: InfrahubClient, log: logging.Logger, branch: str
             kind_name="InfraBGPPeerGroup",
             data=data,
             batch=batch,
+            cache=cache,
         )
     async for node, _ in batch.execute():
         accessor = f"{node._schema.human_friendly_id[0].split('__')[0]}"
@@ -446,6 +476,7 @@ async def create_basics(client: InfrahubClient, log: logging.Logger, branch: str
             kind_name="InfraRouteTarget",
             data=data,
             batch=batch,
+            cache=cache,
         )
 
     async for node, _ in batch.execute():
@@ -477,6 +508,7 @@ async def create_basics(client: InfrahubClient, log: logging.Logger, branch: str
             kind_name="InfraVRF",
             data=data,
             batch=batch,
+            cache=cache,
         )
     async for node, _ in batch.execute():
         accessor = f"{node._schema.human_friendly_id[0].split('__')[0]}"
@@ -500,6 +532,7 @@ async def create_basics(client: InfrahubClient, log: logging.Logger, branch: str
             kind_name="InfraPrefix",
             data=data,
             batch=batch,
+            cache=cache,
         )
     async for node, _ in batch.execute():
         accessor = f"{node._schema.human_friendly_id[0].split('__')[0]}"
@@ -507,7 +540,7 @@ async def create_basics(client: InfrahubClient, log: logging.Logger, branch: str
 
 
 async def create_containers_prefixes(
-    client: InfrahubClient, log: logging.Logger, branch: str
+    client: InfrahubClient, log: logging.Logger, branch: str, cache: NodeCache
 ):
     batch = await client.create_batch()
     await create_ipam_pool(
@@ -515,6 +548,7 @@ async def create_containers_prefixes(
         log=log,
         branch=branch,
         batch=batch,
+        cache=cache,
         prefix=EXTERNAL_NETWORKS[0],
         role="container",
         default_prefix_length=28,
@@ -525,6 +559,7 @@ async def create_containers_prefixes(
         log=log,
         branch=branch,
         batch=batch,
+        cache=cache,
         prefix=INTERNAL_NETWORKS[0],
         role="container",
         default_prefix_length=16,
@@ -538,8 +573,23 @@ async def create_containers_prefixes(
 #   infrahubctl run models/infrastructure_edge.py
 #
 # ---------------------------------------------------------------
+@instrument_run
 async def run(
     client: InfrahubClient, log: logging.Logger, branch: str, **kwargs
 ) -> None:
-    await create_basics(client=client, log=log, branch=branch)
-    await create_containers_prefixes(client=client, log=log, branch=branch)
+    log.info("Retrieving objects from Infrahub")
+    cache = NodeCache()
+    await cache.load(client=client, branch=branch, kinds=CACHED_KINDS)
+    await cache.load(
+        client=client, branch=branch, kinds=["InfraPrefix"], key_attribute="prefix"
+    )
+    await cache.load(
+        client=client,
+        branch=branch,
+        kinds=["CoreIPPrefixPool", "CoreIPAddressPool"],
+        include=["resources"],
+    )
+
+    await create_basics(client=client, log=log, branch=branch, cache=cache)
+    await create_containers_prefixes(client=client, log=log, branch=branch, cache=cache)
+    cache.log_summary(log=log)
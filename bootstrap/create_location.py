@@ -8,13 +8,16 @@ from typing import Dict, List, Optional
 from infrahub_sdk.batch import InfrahubBatch
 from infrahub_sdk import InfrahubClient
 
+from instrumentation import instrument_run
 from utils import (
+    NodeCache,
     create_and_save,
     create_and_add_to_batch,
     create_ipam_pool,
     execute_batch,
     extract_common_prefix,
-    populate_local_store,
+    load_reference_data,
+    ReferenceDataError,
 )
 
 # flake8: noqa
@@ -273,9 +276,34 @@ VLANS = [
 # Mapping Dropdown Role and Status here
 ACTIVE_STATUS = "active"
 
+REFERENCE_KINDS = {
+    "CoreAccount": "name",
+    "OrganizationTenant": "name",
+    "OrganizationProvider": "name",
+    "InfraAutonomousSystem": "name",
+    "CoreStandardGroup": "name",
+    "InfraVRF": "name",
+}
+
+CACHED_KINDS = [
+    "NetworkNameServer",
+    "NetworkNTPServer",
+    "LocationContinent",
+    "LocationCountry",
+    "LocationMetro",
+    "LocationBuilding",
+    "LocationFloor",
+    "LocationSuite",
+    "LocationRack",
+    "CoreIPPrefixPool",
+    "CoreIPAddressPool",
+    "CoreNumberPool",
+    "InfraVLAN",
+]
+
 
 async def create_location_hierarchy(
-    client: InfrahubClient, log: logging.Logger, branch: str
+    client: InfrahubClient, log: logging.Logger, branch: str, cache: NodeCache
 ):
     orga_duff_obj = client.store.get(key="Duff", kind="OrganizationTenant")
     orga_eqx_obj = client.store.get(key="Equinix", kind="OrganizationProvider")
@@ -305,6 +333,7 @@ async def create_location_hierarchy(
             kind_name="LocationContinent",
             data=data,
             retrieved_on_failure=True,
+            cache=cache,
         )
 
         for country_name, country_data in continent_data["countries"].items():
@@ -329,6 +358,7 @@ async def create_location_hierarchy(
                 kind_name="LocationCountry",
                 data=data,
                 retrieved_on_failure=True,
+                cache=cache,
             )
 
             for region_name, region_data in country_data.get("regions", {}).items():
@@ -353,6 +383,7 @@ async def create_location_hierarchy(
                     kind_name="LocationRegion",
                     data=data,
                     retrieved_on_failure=True,
+                    cache=cache,
                 )
                 name_servers = [
                     server[0] for server in MGMT_SERVERS if server[2] == "Name"
@@ -375,13 +406,18 @@ async def create_location_hierarchy(
                 mgmt_servers_obj_ids = [
                     mgmt_server_obj.id for mgmt_server_obj in mgmt_servers_obj
                 ]
-                await region_obj.add_relationships(
-                    relation_to_update="network_management_servers",
-                    related_nodes=mgmt_servers_obj_ids,
-                )
+                # Regions already holding management servers are left as is
+                region_servers = region_obj.network_management_servers
+                if not region_servers.initialized or not region_servers.peers:
+                    await region_obj.add_relationships(
+                        relation_to_update="network_management_servers",
+                        related_nodes=mgmt_servers_obj_ids,
+                    )
 
-                for mgmt_server_obj in mgmt_servers_obj:
-                    log.info(f"- Added {mgmt_server_obj.name.value} to {region_name}")
+                    for mgmt_server_obj in mgmt_servers_obj:
+                        log.info(
+                            f"- Added {mgmt_server_obj.name.value} to {region_name}"
+                        )
 
                 for metro_name, metro_data in region_data.get("metros", {}).items():
                     metro_shortname = metro_data["shortname"]
@@ -403,6 +439,7 @@ async def create_location_hierarchy(
                         kind_name="LocationMetro",
                         data=data,
                         retrieved_on_failure=True,
+                        cache=cache,
                     )
 
                     for building_name, building_data in metro_data.get(
@@ -438,6 +475,7 @@ async def create_location_hierarchy(
                             kind_name="LocationBuilding",
                             data=data,
                             retrieved_on_failure=True,
+                            cache=cache,
                         )
 
                         for floor_name, floor_data in building_data.get(
@@ -464,6 +502,7 @@ async def create_location_hierarchy(
                                 kind_name="LocationFloor",
                                 data=data,
                                 retrieved_on_failure=True,
+                                cache=cache,
                             )
 
                             for suite_name, suite_data in floor_data.get(
@@ -501,6 +540,7 @@ async def create_location_hierarchy(
                                     kind_name="LocationSuite",
                                     data=data,
                                     retrieved_on_failure=True,
+                                    cache=cache,
                                 )
 
                                 for rack_name, rack_data in suite_data.get(
@@ -531,6 +571,7 @@ async def create_location_hierarchy(
                                         kind_name="LocationRack",
                                         data=data,
                                         batch=batch_racks,
+                                        cache=cache,
                                     )
 
     async for node, _ in batch_racks.execute():
@@ -545,6 +586,7 @@ async def create_location_public_and_supernet(
     supernet_container_pool,
     public_container_pool,
     organisation,
+    cache: NodeCache,
 ):
     batch = await client.create_batch()
     for location in site_locations:
@@ -561,14 +603,16 @@ async def create_location_public_and_supernet(
             "status": {"value": "active"},
             "role": {"value": "supernet"},
         }
-        location_supernet = await client.allocate_next_ip_prefix(
-            resource_pool=supernet_container_pool,
-            kind="InfraPrefix",
-            branch=branch,
-            data=data_prefix,
-            identifier=supernet_description,
-        )
-        await location_supernet.save()
+        location_supernet = cache.get(key=supernet_description, kind="InfraPrefix")
+        if not location_supernet:
+            location_supernet = await client.allocate_next_ip_prefix(
+                resource_pool=supernet_container_pool,
+                kind="InfraPrefix",
+                branch=branch,
+                data=data_prefix,
+                identifier=supernet_description,
+            )
+            await location_supernet.save()
         await create_ipam_pool(
             client=client,
             log=log,
@@ -578,6 +622,7 @@ async def create_location_public_and_supernet(
             location=location_shortname,
             default_prefix_length=24,
             batch=batch,
+            cache=cache,
         )
         public_description = f"{location_shortname.lower()}-public"
         # Get next public (/28) from container pool
@@ -588,14 +633,16 @@ async def create_location_public_and_supernet(
             "status": {"value": "active"},
             "role": {"value": "public"},
         }
-        location_public = await client.allocate_next_ip_prefix(
-            resource_pool=public_container_pool,
-            kind="InfraPrefix",
-            branch=branch,
-            data=data_prefix,
-            identifier=public_description,
-        )
-        await location_public.save()
+        location_public = cache.get(key=public_description, kind="InfraPrefix")
+        if not location_public:
+            location_public = await client.allocate_next_ip_prefix(
+                resource_pool=public_container_pool,
+                kind="InfraPrefix",
+                branch=branch,
+                data=data_prefix,
+                identifier=public_description,
+            )
+            await location_public.save()
         await create_ipam_pool(
             client=client,
             log=log,
@@ -605,6 +652,7 @@ async def create_location_public_and_supernet(
             location=location_shortname,
             default_prefix_length=32,
             batch=batch,
+            cache=cache,
         )
 
     # Execute Supernet Pool batch
@@ -616,6 +664,7 @@ async def create_location_vlans(
     log: logging.Logger,
     branch: str,
     organisation,
+    cache: NodeCache,
 ):
     batch = await client.create_batch()
     for idx, location in enumerate(site_locations):
@@ -623,11 +672,7 @@ async def create_location_vlans(
         pool_name = f"vlans-{location_shortname.lower()}"
 
         # Check if pool already exists
-        existing_pool = await client.get(
-            kind="CoreNumberPool", name__value=pool_name, raise_when_missing=False
-        )
-
-        if existing_pool:
+        if cache.get(key=pool_name, kind="CoreNumberPool"):
             log.info(f"Pool {pool_name} already exists, skipping creation")
             continue
 
@@ -678,10 +723,13 @@ async def create_location_vlans(
                 object_name=f"{location_shortname.lower()}_{vlan}",
                 kind_name="InfraVLAN",
                 data=vlan_data,
+                cache=cache,
             )
 
 
-async def create_location(client: InfrahubClient, log: logging.Logger, branch: str):
+async def create_location(
+    client: InfrahubClient, log: logging.Logger, branch: str, cache: NodeCache
+):
     # --------------------------------------------------
     # Preparing some variables for the Location
     # --------------------------------------------------
@@ -724,9 +772,10 @@ async def create_location(client: InfrahubClient, log: logging.Logger, branch: s
             kind_name=mgmt_server_kind,
             data=data,
             retrieved_on_failure=True,
+            cache=cache,
         )
 
-    await create_location_hierarchy(client=client, branch=branch, log=log)
+    await create_location_hierarchy(client=client, branch=branch, log=log, cache=cache)
     supernet_container_pool = await client.get(
         kind="CoreIPPrefixPool", name__value="container-10/8", raise_when_missing=True
     )
@@ -743,10 +792,11 @@ async def create_location(client: InfrahubClient, log: logging.Logger, branch: s
         supernet_container_pool=supernet_container_pool,
         public_container_pool=public_container_pool,
         organisation=orga_duff_obj,
+        cache=cache,
     )
     log.info("Creating the Locations VLANs")
     await create_location_vlans(
-        client=client, log=log, branch=branch, organisation=orga_duff_obj
+        client=client, log=log, branch=branch, organisation=orga_duff_obj, cache=cache
     )
     log.info("Creating the Locations Prefixes")
     # Create prefixes from supernets
@@ -766,6 +816,8 @@ async def create_location(client: InfrahubClient, log: logging.Logger, branch: s
         )
         for role in ("management", "technical", "loopback", "loopback-vtep"):
             prefix_description = f"{location_shortname.lower()}-{role}"
+            if cache.get(key=prefix_description, kind="InfraPrefix"):
+                continue
             data_prefix = {
                 "description": {"value": prefix_description},
                 "organization": {"id": orga_duff_obj.id},
@@ -799,38 +851,56 @@ async def create_location(client: InfrahubClient, log: logging.Logger, branch: s
     await execute_batch(batch=batch, log=log)
 
 
-# ---------------------------------------------------------------
-# Use the `infrahubctl run` command line to execute this script
-#
-#   infrahubctl run models/infrastructure_edge.py
-#
-# ---------------------------------------------------------------
-async def run(
-    client: InfrahubClient, log: logging.Logger, branch: str, **kwargs
+async def bootstrap_locations(
+    client: InfrahubClient, log: logging.Logger, branch: str
 ) -> None:
+    """Creates the locations, raises ReferenceDataError when the objects they need can't be retrieved."""
     # ------------------------------------------
     # Create Sites
     # ------------------------------------------
     log.info("Retrieving objects from Infrahub")
     try:
-        accounts = await client.all("CoreAccount")
-        populate_local_store(objects=accounts, key_type="name", store=client.store)
-        tenants = await client.all("OrganizationTenant")
-        populate_local_store(objects=tenants, key_type="name", store=client.store)
-        providers = await client.all("OrganizationProvider")
-        populate_local_store(objects=providers, key_type="name", store=client.store)
-        autonomous_systems = await client.all("InfraAutonomousSystem")
-        populate_local_store(
-            objects=autonomous_systems, key_type="name", store=client.store
+        await load_reference_data(
+            client=client, log=log, branch=branch, kinds=REFERENCE_KINDS
+        )
+
+        # Nodes created with create_and_save, skipped when already present
+        cache = NodeCache()
+        await cache.load(client=client, branch=branch, kinds=CACHED_KINDS)
+        await cache.load(
+            client=client,
+            branch=branch,
+            kinds=["LocationRegion"],
+            include=["network_management_servers"],
+        )
+        # Prefixes allocated from the pools are identified by their description
+        await cache.load(
+            client=client,
+            branch=branch,
+            kinds=["InfraPrefix"],
+            key_attribute="description",
         )
-        groups = await client.all("CoreStandardGroup")
-        populate_local_store(objects=groups, key_type="name", store=client.store)
-        vrfs = await client.all("InfraVRF")
-        populate_local_store(objects=vrfs, key_type="name", store=client.store)
 
     except Exception as e:
-        log.info(f"Fail to populate due to {e}")
-        exit(1)
+        raise ReferenceDataError(f"Fail to populate due to {e}") from e
 
     log.info("Generating Locations")
-    await create_location(client=client, branch=branch, log=log)
+    await create_location(client=client, branch=branch, log=log, cache=cache)
+    cache.log_summary(log=log)
+
+
+# ---------------------------------------------------------------
+# Use the `infrahubctl run` command line to execute this script
+#
+#   infrahubctl run models/infrastructure_edge.py
+#
+# ---------------------------------------------------------------
+@instrument_run
+async def run(
+    client: InfrahubClient, log: logging.Logger, branch: str, **kwargs
+) -> None:
+    try:
+        await bootstrap_locations(client=client, log=log, branch=branch)
+    except ReferenceDataError as e:
+        log.error(e)
+        exit(1)
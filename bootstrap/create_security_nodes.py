@@ -1,15 +1,14 @@
 #!/usr/bin/env python
 import ipaddress
 import logging
-
 from dataclasses import dataclass
-from enum import auto, Enum
+from enum import Enum, auto
 from typing import Any, List, Optional, Union
 
-
 from infrahub_sdk import InfrahubClient
 from infrahub_sdk.node import InfrahubNode
-from infrahub_sdk.exceptions import NodeNotFoundError
+from instrumentation import instrument_run
+from utils import NodeCache, create_and_save
 
 
 @dataclass
@@ -317,126 +316,180 @@ RULES = [
 ]
 
 
-async def run(client: InfrahubClient, log: logging.Logger, branch: str) -> None:
+# Relationships of the rules with many peers, included to compare them
+RULE_RELATIONSHIPS = [
+    "source_address",
+    "source_groups",
+    "source_services",
+    "source_service_groups",
+    "destination_address",
+    "destination_groups",
+    "destination_services",
+    "destination_service_groups",
+]
+
+
+async def upsert(
+    client: InfrahubClient,
+    log: logging.Logger,
+    branch: str,
+    cache: NodeCache,
+    kind: str,
+    name: str,
+    key: Optional[str] = None,
+    **data: Any,
+) -> InfrahubNode:
+    return await create_and_save(
+        client=client,
+        log=log,
+        branch=branch,
+        object_name=key or name,
+        kind_name=kind,
+        data={"name": name, **data},
+        cache=cache,
+    )
+
+
+async def create_security_policies(
+    client: InfrahubClient, log: logging.Logger, branch: str
+) -> None:
+    cache = NodeCache()
+    await cache.load(
+        client=client,
+        branch=branch,
+        kinds=[
+            "SecurityIPProtocol",
+            "SecurityService",
+            "SecurityPrefix",
+            "SecurityIPAddress",
+            "SecurityZone",
+            "SecurityPolicy",
+        ],
+    )
+    await cache.load(
+        client=client,
+        branch=branch,
+        kinds=["SecurityServiceGroup"],
+        include=["services"],
+    )
+    await cache.load(
+        client=client,
+        branch=branch,
+        kinds=["SecurityAddressGroup"],
+        include=["addresses"],
+    )
+    # The rule names are only unique within a policy
+    for existing_rule in await client.all(
+        kind="SecurityPolicyRule",
+        branch=branch,
+        include=RULE_RELATIONSHIPS,
+        property=True,
+    ):
+        existing_policy = cache.get(key=existing_rule.policy.id, kind="SecurityPolicy")
+        if existing_policy:
+            cache.add(
+                node=existing_rule,
+                key=f"{existing_policy.name.value}/{existing_rule.name.value}",
+            )
+    params = {"client": client, "log": log, "branch": branch, "cache": cache}
+
     for ip_proto in IP_PROTOCOLS:
-        obj = await client.create(
+        await upsert(
+            **params,
             kind="SecurityIPProtocol",
             name=ip_proto.name,
             protocol=ip_proto.protocol,
             description=ip_proto.description,
         )
-        await obj.save(allow_upsert=True)
-        client.store.set(key=obj.name.value, node=obj)
 
     for service in SERVICES:
-        proto = client.store.get(key=service.ip_protocol.name)
-        obj = await client.create(
+        proto = cache.get(key=service.ip_protocol.name, kind="SecurityIPProtocol")
+        await upsert(
+            **params,
             kind="SecurityService",
             name=service.name,
             description=service.description,
             ip_protocol=proto,
             port=service.port,
         )
-        await obj.save(allow_upsert=True)
-        client.store.set(key=obj.name.value, node=obj)
 
     for service_group in SERVICE_GROUPS:
         services = [
-            client.store.get(service.name) for service in service_group.services
+            cache.get(key=service.name, kind="SecurityService")
+            for service in service_group.services
         ]
-        obj = await client.create(
-            kind="SecurityServiceGroup", name=service_group.name, services=services
+        await upsert(
+            **params,
+            kind="SecurityServiceGroup",
+            name=service_group.name,
+            services=services,
         )
-        await obj.save(allow_upsert=True)
-        client.store.set(key=obj.name.value, node=obj)
 
     for prefix in PREFIXES:
-        obj = await client.create(
-            "SecurityPrefix", name=prefix.name, prefix=prefix.prefix
+        await upsert(
+            **params, kind="SecurityPrefix", name=prefix.name, prefix=prefix.prefix
         )
-        await obj.save(allow_upsert=True)
-        client.store.set(key=obj.name.value, node=obj)
 
     for address in ADDRESSES:
-        obj = await client.create(
-            "SecurityIPAddress", name=address.name, address=address.address
+        await upsert(
+            **params,
+            kind="SecurityIPAddress",
+            name=address.name,
+            address=address.address,
         )
-        await obj.save(allow_upsert=True)
-        client.store.set(key=obj.name.value, node=obj)
 
     for address_group in ADDRESS_GROUPS:
         addresses = [
-            client.store.get(key=address.name) for address in address_group.addresses
+            cache.get(key=address.name, kind="SecurityGenericAddress")
+            for address in address_group.addresses
         ]
-        obj = await client.create(
-            kind="SecurityAddressGroup", name=address_group.name, addresses=addresses
+        await upsert(
+            **params,
+            kind="SecurityAddressGroup",
+            name=address_group.name,
+            addresses=addresses,
         )
-        await obj.save(allow_upsert=True)
-        client.store.set(key=obj.name.value, node=obj)
 
     for security_zone in SECURITY_ZONES:
-        obj = await client.create(kind="SecurityZone", name=security_zone.name)
-        await obj.save(allow_upsert=True)
-        client.store.set(key=obj.name.value, node=obj)
+        await upsert(**params, kind="SecurityZone", name=security_zone.name)
 
     for policy in POLICIES:
-        obj = await client.create(kind="SecurityPolicy", name=policy.name)
-        await obj.save(allow_upsert=True)
-        client.store.set(key=obj.name.value, node=obj)
-
-    def store_get_or_none(key) -> Optional[InfrahubNode]:
-        try:
-            return client.store.get(key=key)
-        except NodeNotFoundError:
+        await upsert(**params, kind="SecurityPolicy", name=policy.name)
+
+    def lookup(kind: str, objects: Optional[List[Any]]) -> Optional[List[InfrahubNode]]:
+        if not objects:
             return None
+        return [cache.get(key=obj.name, kind=kind) for obj in objects]
 
     for rule in RULES:
-        policy = store_get_or_none(rule.policy.name)
-        source_zone = store_get_or_none(rule.source_zone.name)
-        destination_zone = store_get_or_none(rule.destination_zone.name)
-        source_address = (
-            [store_get_or_none(address.name) for address in rule.source_addresses]
-            if rule.source_addresses
-            else None
+        policy = cache.get(key=rule.policy.name, kind="SecurityPolicy")
+        source_zone = cache.get(key=rule.source_zone.name, kind="SecurityZone")
+        destination_zone = cache.get(
+            key=rule.destination_zone.name, kind="SecurityZone"
         )
-        source_groups = (
-            [store_get_or_none(group.name) for group in rule.source_groups]
-            if rule.source_groups
-            else None
+        source_address = lookup("SecurityGenericAddress", rule.source_addresses)
+        source_groups = lookup("SecurityGenericAddressGroup", rule.source_groups)
+        source_services = lookup("SecurityGenericService", rule.source_services)
+        source_service_groups = lookup(
+            "SecurityGenericServiceGroup", rule.source_service_groups
         )
-        source_services = (
-            [store_get_or_none(service.name) for service in rule.source_services]
-            if rule.source_services
-            else None
+        destination_address = lookup(
+            "SecurityGenericAddress", rule.destination_addresses
         )
-        source_service_groups = (
-            [store_get_or_none(group.name) for group in rule.source_service_groups]
-            if rule.source_service_groups
-            else None
+        destination_groups = lookup(
+            "SecurityGenericAddressGroup", rule.destination_groups
         )
-        destination_address = (
-            [store_get_or_none(address.name) for address in rule.destination_addresses]
-            if rule.destination_addresses
-            else None
+        destination_services = lookup(
+            "SecurityGenericService", rule.destination_services
         )
-        destination_groups = (
-            [store_get_or_none(group.name) for group in rule.destination_groups]
-            if rule.destination_groups
-            else None
+        destination_service_groups = lookup(
+            "SecurityGenericServiceGroup", rule.destination_service_groups
         )
-        destination_services = (
-            [store_get_or_none(service.name) for service in rule.destination_services]
-            if rule.destination_services
-            else None
-        )
-        destination_service_groups = (
-            [store_get_or_none(group.name) for group in rule.destination_service_groups]
-            if rule.destination_service_groups
-            else None
-        )
-        obj = await client.create(
+        await upsert(
+            **params,
             kind="SecurityPolicyRule",
             name=rule.name,
+            key=f"{rule.policy.name}/{rule.name}",
             policy=policy,
             index=rule.index,
             action=rule.action.name,
@@ -452,22 +505,41 @@ async def run(client: InfrahubClient, log: logging.Logger, branch: str) -> None:
             destination_service_groups=destination_service_groups,
         )
 
-        await obj.save(allow_upsert=True)
+    cache.log_summary(log=log)
+
+
+async def create_firewall(
+    client: InfrahubClient, log: logging.Logger, branch: str
+) -> None:
+    cache = NodeCache()
+    await cache.load(
+        client=client,
+        branch=branch,
+        kinds=["InfraDeviceType", "SecurityFirewall", "SecurityZone", "SecurityPolicy"],
+    )
+    await cache.load(
+        client=client,
+        branch=branch,
+        kinds=["CoreStandardGroup"],
+        include=["members"],
+    )
+    params = {"client": client, "log": log, "branch": branch, "cache": cache}
 
     manufacturer = await client.get("OrganizationManufacturer", name__value="Juniper")
     platform = await client.get("InfraPlatform", name__value="Juniper JunOS")
 
     fra = await client.get(kind="LocationMetro", name__value="Frankfurt")
 
-    device_type = await client.create(
+    device_type = await upsert(
+        **params,
         kind="InfraDeviceType",
         name="SRX1500",
         platform=platform,
         manufacturer=manufacturer,
     )
-    await device_type.save(allow_upsert=True)
 
-    device = await client.create(
+    device = await upsert(
+        **params,
         kind="SecurityFirewall",
         name="fra-fw1",
         device_type=device_type,
@@ -476,53 +548,93 @@ async def run(client: InfrahubClient, log: logging.Logger, branch: str) -> None:
         role="edge_firewall",
         location=fra,
     )
-    await device.save(allow_upsert=True)
 
-    group = await client.create(
-        kind="CoreStandardGroup", name="firewall_devices", members=[device]
+    await upsert(
+        **params, kind="CoreStandardGroup", name="firewall_devices", members=[device]
     )
-    await group.save()
 
-    management_interface = await client.create(
+    interfaces = [
+        ("ge-0/0/1", "outside", "10.0.1.1/24"),
+        ("ge-0/0/2", "inside", "10.0.2.1/24"),
+        ("ge-0/0/3", "dmz", "10.0.3.1/24"),
+    ]
+
+    # Only the interfaces of the firewall and its addresses, indexed by name
+    # and by address
+    management_address = "192.168.0.1/24"
+    ip_addresses = await client.filters(
+        kind="InfraIPAddress",
+        address__values=[management_address, *(ip for _, _, ip in interfaces)],
+        branch=branch,
+        property=True,
+    )
+    cache.extend(nodes=ip_addresses, key_attribute="address")
+    for kind in ("InfraInterfaceL3", "SecurityFirewallInterface"):
+        firewall_interfaces = await client.filters(
+            kind=kind,
+            device__ids=[device.id],
+            include=["ip_addresses"],
+            branch=branch,
+            property=True,
+        )
+        cache.extend(nodes=firewall_interfaces, key_attribute="name")
+
+    async def upsert_address(address: str) -> InfrahubNode:
+        return await create_and_save(
+            client=client,
+            log=log,
+            branch=branch,
+            object_name=address,
+            kind_name="InfraIPAddress",
+            data={"address": address},
+            cache=cache,
+        )
+
+    async def add_address(kind: str, name: str, address: str) -> List[str]:
+        # Other addresses already set on the interface are kept
+        ip_address = await upsert_address(address)
+        interface = cache.get(key=name, kind=kind)
+        peer_ids = (
+            [peer.id for peer in interface.ip_addresses.peers] if interface else []
+        )
+        if ip_address.id in peer_ids:
+            return peer_ids
+        return [*peer_ids, ip_address.id]
+
+    await upsert(
+        **params,
         kind="InfraInterfaceL3",
         name="ge-0/0/0",
         speed=1_000_000,
         role="management",
         device=device,
+        ip_addresses=await add_address(
+            kind="InfraInterfaceL3", name="ge-0/0/0", address=management_address
+        ),
     )
-    await management_interface.save(allow_upsert=True)
-
-    management_ip = await client.create(kind="InfraIPAddress", address="192.168.0.1/24")
-    await management_ip.save(allow_upsert=True)
-
-    await management_interface.ip_addresses.fetch()
-    management_interface.ip_addresses.add(management_ip)
-    await management_interface.save(allow_upsert=True)
-
-    interfaces = [
-        ("ge-0/0/1", "outside", "10.0.1.1/24"),
-        ("ge-0/0/2", "inside", "10.0.2.1/24"),
-        ("ge-0/0/3", "dmz", "10.0.3.1/24"),
-    ]
 
     for interface, zone, ip in interfaces:
-        security_zone = store_get_or_none(zone)
-
-        firewall_interface = await client.create(
+        await upsert(
+            **params,
             kind="SecurityFirewallInterface",
             name=interface,
             speed=1_000_000,
-            security_zone=security_zone,
+            security_zone=cache.get(key=zone, kind="SecurityZone"),
             device=device,
+            ip_addresses=await add_address(
+                kind="SecurityFirewallInterface", name=interface, address=ip
+            ),
         )
-        await firewall_interface.save(allow_upsert=True)
 
-        ip_address = await client.create(kind="InfraIPAddress", address=ip)
-        await ip_address.save(allow_upsert=True)
+    fw_policy = cache.get(key=FRA_FW1_POLICY.name, kind="SecurityPolicy")
+    if device.policy.id != fw_policy.id:
+        device.policy = fw_policy
+        await device.save()
 
-        await firewall_interface.ip_addresses.fetch()
-        firewall_interface.ip_addresses.add(ip_address)
-        await firewall_interface.save(allow_upsert=True)
+    cache.log_summary(log=log)
 
-    device.policy = store_get_or_none(FRA_FW1_POLICY.name)
-    await device.save()
+
+@instrument_run
+async def run(client: InfrahubClient, log: logging.Logger, branch: str) -> None:
+    await create_security_policies(client=client, log=log, branch=branch)
+    await create_firewall(client=client, log=log, branch=branch)
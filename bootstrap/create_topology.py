@@ -7,7 +7,13 @@ from infrahub_sdk.batch import InfrahubBatch
 from infrahub_sdk.node import InfrahubNode
 from infrahub_sdk.uuidt import UUIDT
 
-from utils import create_and_add_to_batch, populate_local_store
+from instrumentation import instrument_run
+from utils import (
+    NodeCache,
+    ReferenceDataError,
+    create_and_add_to_batch,
+    load_reference_data,
+)
 
 # flake8: noqa
 # pylint: skip-file
@@ -30,6 +36,17 @@ TOPOLOGY = (
     ("denver-mpls1", "Medium MPLS in Denver Metro (DE1+DE2)", "DEN", "isis-ibgp"),
 )
 
+REFERENCE_KINDS = {
+    "CoreAccount": "name",
+    "OrganizationTenant": "name",
+    "OrganizationProvider": "name",
+    "OrganizationManufacturer": "name",
+    "InfraAutonomousSystem": "name",
+    "InfraPlatform": "name",
+    "InfraDeviceType": "name",
+    "LocationGeneric": "shortname",
+}
+
 TOPOLOGY_ELEMENTS = {
     # Topology [ Quantity, Device Role, Device Type, mtu, mlag support, is border]
     "fra05-pod1": [
@@ -59,7 +76,7 @@ TOPOLOGY_ELEMENTS = {
 
 
 async def create_topology_strategies(
-    client: InfrahubClient, log: logging.Logger, branch: str
+    client: InfrahubClient, log: logging.Logger, branch: str, cache: NodeCache
 ):
     log.info("Creating Network Strategies")
     # Create Network Strategies
@@ -87,13 +104,16 @@ async def create_topology_strategies(
             kind_name=f"Topology{strategy_type.upper()}Strategy",
             data=data,
             batch=batch,
+            cache=cache,
         )
     async for node, _ in batch.execute():
         accessor = f"{node._schema.human_friendly_id[0].split('__')[0]}"
         log.info(f"- Created {node._schema.kind} - {getattr(node, accessor).value}")
 
 
-async def create_topology(client: InfrahubClient, log: logging.Logger, branch: str):
+async def create_topology(
+    client: InfrahubClient, log: logging.Logger, branch: str, cache: NodeCache
+):
     # ------------------------------------------
     # Create Topology
     # ------------------------------------------
@@ -113,6 +133,7 @@ async def create_topology(client: InfrahubClient, log: logging.Logger, branch: s
             kind_name="CoreStandardGroup",
             data=data,
             batch=batch,
+            cache=cache,
         )
     async for node, _ in batch.execute():
         accessor = f"{node._schema.human_friendly_id[0].split('__')[0]}"
@@ -146,6 +167,7 @@ async def create_topology(client: InfrahubClient, log: logging.Logger, branch: s
             kind_name="TopologyTopology",
             data=data,
             batch=batch,
+            cache=cache,
         )
     async for node, _ in batch.execute():
         accessor = f"{node._schema.human_friendly_id[0].split('__')[0]}"
@@ -163,15 +185,19 @@ async def create_topology(client: InfrahubClient, log: logging.Logger, branch: s
         )
         await topology_group.members.fetch()
         topology_group.members.add(topology_obj.id)
-        await topology_group.save()
-        log.info(
-            f"- Add {topology_name} to {topology_group.name.value} CoreStandardGroup"
-        )
+        if topology_group.members.has_update:
+            await topology_group.save()
+            log.info(
+                f"- Add {topology_name} to {topology_group.name.value} CoreStandardGroup"
+            )
 
         topology_object = client.store.get(key=topology_name, kind="TopologyTopology")
         if topology[2]:
             topology_location_object = client.store.get(key=topology[2])
-            if topology_location_object:
+            if (
+                topology_location_object
+                and topology_object.location.id != topology_location_object.id
+            ):
                 topology_object.location = topology_location_object
                 await topology_object.save()
             log.info(
@@ -221,6 +247,7 @@ async def create_topology(client: InfrahubClient, log: logging.Logger, branch: s
                 kind_name="TopologyPhysicalElement",
                 data=data,
                 batch=batch,
+                cache=cache,
             )
 
     # Add Topologies to Topology Summary Group
@@ -237,48 +264,56 @@ async def create_topology(client: InfrahubClient, log: logging.Logger, branch: s
         log.info(
             f"- Add {topology_name} to {topology_group.name.value} CoreStandardGroup"
         )
-    await all_topologies_group.save()
+    if all_topologies_group.members.has_update:
+        await all_topologies_group.save()
 
     async for node, _ in batch.execute():
         accessor = f"{node._schema.human_friendly_id[0].split('__')[0]}"
         log.info(f"- Created {node._schema.kind} - {getattr(node, accessor).value}")
 
 
+async def bootstrap_topologies(
+    client: InfrahubClient, log: logging.Logger, branch: str
+) -> None:
+    """Creates the topologies, raises ReferenceDataError when the objects they need can't be retrieved."""
+    log.info("Retrieving objects from Infrahub")
+    try:
+        await load_reference_data(
+            client=client, log=log, branch=branch, kinds=REFERENCE_KINDS
+        )
+
+    except Exception as e:
+        raise ReferenceDataError(f"Fail to populate due to {e}") from e
+
+    cache = NodeCache()
+    await cache.load(
+        client=client,
+        branch=branch,
+        kinds=[
+            "TopologyEVPNStrategy",
+            "CoreStandardGroup",
+            "TopologyTopology",
+            "TopologyPhysicalElement",
+        ],
+    )
+
+    await create_topology_strategies(client=client, branch=branch, log=log, cache=cache)
+    await create_topology(client=client, branch=branch, log=log, cache=cache)
+    cache.log_summary(log=log)
+
+
 # ---------------------------------------------------------------
 # Use the `infrahubctl run` command line to execute this script
 #
 #   infrahubctl run models/infrastructure_edge.py
 #
 # ---------------------------------------------------------------
+@instrument_run
 async def run(
     client: InfrahubClient, log: logging.Logger, branch: str, **kwargs
 ) -> None:
-    log.info("Retrieving objects from Infrahub")
     try:
-        accounts = await client.all("CoreAccount")
-        populate_local_store(objects=accounts, key_type="name", store=client.store)
-        tenants = await client.all("OrganizationTenant")
-        populate_local_store(objects=tenants, key_type="name", store=client.store)
-        providers = await client.all("OrganizationProvider")
-        populate_local_store(objects=providers, key_type="name", store=client.store)
-        manufacturers = await client.all("OrganizationManufacturer")
-        populate_local_store(objects=manufacturers, key_type="name", store=client.store)
-        autonomous_systems = await client.all("InfraAutonomousSystem")
-        populate_local_store(
-            objects=autonomous_systems, key_type="name", store=client.store
-        )
-        platforms = await client.all("InfraPlatform")
-        populate_local_store(objects=platforms, key_type="name", store=client.store)
-        device_types = await client.all("InfraDeviceType")
-        populate_local_store(objects=device_types, key_type="name", store=client.store)
-        locations = await client.all("LocationGeneric")
-        populate_local_store(
-            objects=locations, key_type="shortname", store=client.store
-        )
-
-    except Exception as e:
-        log.error(f"Fail to populate due to {e}")
+        await bootstrap_topologies(client=client, log=log, branch=branch)
+    except ReferenceDataError as e:
+        log.error(e)
         exit(1)
-
-    await create_topology_strategies(client=client, branch=branch, log=log)
-    await create_topology(client=client, branch=branch, log=log)
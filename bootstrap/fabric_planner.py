@@ -0,0 +1,862 @@
+import functools
+import ipaddress
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+# Pure planning of a fabric (devices, interfaces, cabling, addressing, BGP)
+# from a topology definition. Nothing in here talks to Infrahub, the plan is
+# written by generate_topology.
+
+INTERFACE_MGMT_NAME = {
+    "QFX5110-48S-S": "fxp0",
+    "CCS-720DP-48S-2F": "Management0",
+    "DCS-7280DR3-24-F": "Management0",
+    "DCS-7060DX5-64S": "Management0",
+    "DCS-7816R3": "Management1/1",
+    "NCS-5501-SE": "MgmtEth0/RP0/CPU0/0",
+    "ASR1002-HX": "GigabitEthernet0",
+    "linux": "Eth0",
+}
+
+INTERFACE_LOOP_NAME = {
+    "QFX5110-48S-S": "lo0",
+    "CCS-720DP-48S-2F": "Loopback0",
+    "DCS-7280DR3-24-F": "Loopback0",
+    "DCS-7060DX5-64S": "Loopback0",
+    "DCS-7816R3": "Loopback0",
+    "NCS-5501-SE": "Loopback0",
+    "ASR1002-HX": "Loopback 0",
+    "linux": "lo",
+}
+
+INTERFACE_VTEP_NAME = {
+    "QFX5110-48S-S": "lo1",
+    "CCS-720DP-48S-2F": "Loopback1",
+    "DCS-7280DR3-24-F": "Loopback1",
+    "DCS-7060DX5-64S": "Loopback1",
+    "DCS-7816R3": "Loopback1",
+    "NCS-5501-SE": "Loopback1",
+    "ASR1002-HX": "Loopback 1",
+    "linux": "lo1",
+}
+
+
+@dataclass(frozen=True)
+class PortTemplate:
+    """Front panel of a device type.
+
+    The ports are numbered from `first`, the last `breakout_ports` of them are
+    split into `lanes` interfaces named with `breakout_name`. Modular chassis
+    repeat the ports on each of their `slots` line cards, numbered from
+    `first_slot`.
+    """
+
+    name: str
+    ports: int
+    first: int = 1
+    breakout_ports: int = 0
+    lanes: int = 4
+    first_lane: int = 1
+    breakout_name: str = "{name}/{lane}"
+    slots: int = 1
+    first_slot: int = 1
+
+    def interfaces(self) -> List[str]:
+        names = []
+        first_breakout = self.first + self.ports - self.breakout_ports
+        for slot in range(self.first_slot, self.first_slot + self.slots):
+            for port in range(self.first, self.first + self.ports):
+                name = self.name.format(slot=slot, port=port)
+                if port < first_breakout:
+                    names.append(name)
+                    continue
+                names.extend(
+                    self.breakout_name.format(name=name, lane=lane)
+                    for lane in range(self.first_lane, self.first_lane + self.lanes)
+                )
+        return names
+
+
+PORT_TEMPLATES = {
+    # 48x SFP+ and 4x QSFP28 split in 4x 25G
+    "QFX5110-48S-S": PortTemplate(
+        name="xe-0/0/{port}",
+        ports=52,
+        first=0,
+        breakout_ports=4,
+        first_lane=0,
+        breakout_name="{name}:{lane}",
+    ),
+    # 48x SFP and 2x QSFP split in 4x 10G
+    "CCS-720DP-48S-2F": PortTemplate(name="Ethernet{port}", ports=50, breakout_ports=2),
+    # 24x QSFP-DD, all of them split in 4x 100G
+    "DCS-7280DR3-24-F": PortTemplate(
+        name="Ethernet{port}", ports=24, breakout_ports=24
+    ),
+    # 64x QSFP-DD split in 2x 400G
+    "DCS-7060DX5-64S": PortTemplate(
+        name="Ethernet{port}", ports=64, breakout_ports=64, lanes=2
+    ),
+    # 16 line cards of 36x QSFP100, in the slots 3 to 18
+    "DCS-7816R3": PortTemplate(
+        name="Ethernet{slot}/{port}", ports=36, slots=16, first_slot=3
+    ),
+    # 48x SFP28 and 6x QSFP28 split in 4x 25G
+    "NCS-5501-SE": PortTemplate(name="Ethernet{port}", ports=54, breakout_ports=6),
+    "ASR1002-HX": PortTemplate(name="Ethernet{port}", ports=48),
+}
+
+
+@dataclass(frozen=True)
+class PortGroup:
+    """Consecutive ports of a device role.
+
+    The scalable groups grow with the number of peers.
+    """
+
+    role: str
+    ports: int
+    scalable: bool = False
+
+
+# Ports of each device role, in order, before scaling to the fabric.
+# A layout has at most two scalable groups, see port_map.
+PORT_LAYOUTS = {
+    "spine": (
+        PortGroup("leaf", 10, scalable=True),  # leaf1 to leaf10 (L3)
+        PortGroup("uplink", 2, scalable=True),  # borderleafs (L3)
+        PortGroup("spare", 2),
+    ),
+    "leaf": (
+        PortGroup("server", 6),
+        PortGroup("spare", 1),
+        PortGroup("peer", 2),  # leaf (L2)
+        PortGroup("uplink", 4, scalable=True),  # spine1 to spine4 (L3)
+        PortGroup("spare", 1),
+    ),
+}
+
+
+@dataclass(frozen=True)
+class PortMap:
+    """Role of the interfaces of a device, with the interfaces of each role."""
+
+    ports: Tuple[Tuple[str, str], ...]
+    by_role: Dict[str, Tuple[str, ...]]
+
+
+@functools.lru_cache(maxsize=None)
+def port_map(
+    device_type: str, device_role: str, demand: Tuple[Tuple[str, int], ...] = ()
+) -> Optional[PortMap]:
+    """Returns the port map of a device type in a role.
+
+    Demand is the number of ports needed per role, the scalable groups grow
+    to it as long as the device type has ports left. The groups keep the
+    ports of the layout and grow into the ports after it: the first scalable
+    group from the start of the free ports, the second one from the end of
+    the panel. Growing a fabric never moves the ports already assigned.
+    """
+    if device_type not in PORT_TEMPLATES or device_role not in PORT_LAYOUTS:
+        return None
+    interfaces = PORT_TEMPLATES[device_type].interfaces()
+    layout = PORT_LAYOUTS[device_role]
+    needed = dict(demand)
+
+    roles: Dict[int, str] = {}
+    by_role: Dict[str, List[str]] = defaultdict(list)
+    for group in layout:
+        for name in interfaces[len(roles) : len(roles) + group.ports]:
+            roles[len(roles)] = group.role
+            by_role[group.role].append(name)
+
+    low, high = len(roles), len(interfaces)
+    scalable = [group for group in layout if group.scalable]
+    for position, group in enumerate(scalable):
+        extra = min(max(needed.get(group.role, 0) - group.ports, 0), high - low)
+        if position % 2 == 0:
+            indexes = range(low, low + extra)
+            low += extra
+        else:
+            indexes = range(high - 1, high - 1 - extra, -1)
+            high -= extra
+        for index in indexes:
+            roles[index] = group.role
+            by_role[group.role].append(interfaces[index])
+    return PortMap(
+        ports=tuple((interfaces[index], roles[index]) for index in sorted(roles)),
+        by_role={role: tuple(names) for role, names in by_role.items()},
+    )
+
+
+L3_ROLE_MAPPING = ["backbone", "upstream", "peering", "uplink", "leaf", "spare"]
+L2_ROLE_MAPPING = [
+    "peer",
+    "server",
+]
+
+# Mapping Dropdown Role and Status here
+ACTIVE_STATUS = "active"
+PROVISIONING_STATUS = "provisioning"
+LOOPBACK_ROLE = "loopback"
+MGMT_ROLE = "management"
+
+L3_INTERFACE_KIND = "InfraInterfaceL3"
+L2_INTERFACE_KIND = "InfraInterfaceL2"
+
+
+def get_interface_names(
+    device_type: str,
+    device_role: str,
+    interface_role: str,
+    demand: Tuple[Tuple[str, int], ...] = (),
+) -> Optional[List]:
+    ports = port_map(device_type, device_role, demand)
+    if ports is None:
+        return None
+    return list(ports.by_role.get(interface_role, ()))
+
+
+def remove_interface_prefixes(text: str) -> str:
+    parts = text.split(":", 1)
+    if len(parts) > 1:
+        return parts[1].lstrip()
+    else:
+        return text
+
+
+def generate_asn(
+    location_index: int, element_type_index: int, element_index: int
+) -> int:
+    location_index_adjusted = location_index + 1
+    element_index_adjusted = (element_index + 1) // 2
+    asn = (
+        65000
+        + (location_index_adjusted * 100)
+        + (element_type_index * 10)
+        + element_index_adjusted
+    )
+    return asn
+
+
+@dataclass
+class TopologyElement:
+    role: str
+    quantity: int
+    device_type: Optional[str] = None
+    platform: Optional[str] = None
+    mtu: Optional[int] = None
+    border: bool = False
+
+
+@dataclass
+class PrefixPools:
+    loopback: str
+    loopback_vtep: str
+    management: str
+    technical: str
+
+
+@dataclass
+class PlannedInterface:
+    device: str
+    name: str
+    role: str
+    kind: str
+    status: str
+    description: str
+    mtu: Optional[int] = None
+    l2_mode: Optional[str] = None
+    address: Optional[str] = None
+    address_prefix: Optional[str] = None
+
+
+@dataclass
+class PlannedDevice:
+    name: str
+    role: str
+    device_type: str
+    platform: str
+    mtu: Optional[int] = None
+    asn: Optional[int] = None
+    interfaces: List[PlannedInterface] = field(default_factory=list)
+
+
+@dataclass
+class PlannedLink:
+    kind: str
+    a_device: str
+    a_interface: str
+    a_description: str
+    b_device: str
+    b_interface: str
+    b_description: str
+    prefix: Optional[str] = None
+    prefix_description: Optional[str] = None
+    a_address: Optional[str] = None
+    b_address: Optional[str] = None
+
+
+@dataclass
+class PlannedBGPGroup:
+    name: str
+    local_asn: Optional[int]
+    remote_asn: Optional[int]
+    description: str
+
+
+@dataclass
+class PlannedBGPSession:
+    name: str
+    device: str
+    local_asn: Optional[int]
+    remote_asn: Optional[int]
+    local_address: str
+    remote_address: str
+    peer_group: str
+    description: str
+    peer_session: Optional[str] = None
+
+
+@dataclass
+class FabricPlan:
+    devices: List[PlannedDevice] = field(default_factory=list)
+    links: List[PlannedLink] = field(default_factory=list)
+    bgp_groups: List[PlannedBGPGroup] = field(default_factory=list)
+    bgp_sessions: List[PlannedBGPSession] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+    complete: bool = True
+    _devices_by_name: Dict[str, PlannedDevice] = field(default_factory=dict, repr=False)
+
+    def add_device(self, device: PlannedDevice) -> None:
+        self.devices.append(device)
+        self._devices_by_name[device.name] = device
+
+    def get_device(self, name: str) -> Optional[PlannedDevice]:
+        return self._devices_by_name.get(name)
+
+
+def interface_kind(interface_role: str) -> str:
+    if interface_role in L3_ROLE_MAPPING or interface_role in (
+        LOOPBACK_ROLE,
+        MGMT_ROLE,
+    ):
+        return L3_INTERFACE_KIND
+    return L2_INTERFACE_KIND
+
+
+def interface_description(interface_name: str, device_name: str) -> str:
+    return f"{interface_name.lower().replace(' ', '')}.{device_name.lower()}"
+
+
+def device_name(topology_name: str, role: str, index: int, border: bool) -> str:
+    if border and role != "spine":
+        return f"{topology_name}-border{role}{index}"
+    return f"{topology_name}-{role}{index}"
+
+
+def host_count(pool: str) -> int:
+    """Returns the number of host addresses of a pool."""
+    network = ipaddress.ip_network(pool)
+    if network.prefixlen >= network.max_prefixlen - 1:
+        return network.num_addresses
+    return network.num_addresses - 2
+
+
+def paired_port(ports: List[str], index: int) -> Optional[str]:
+    """Returns the port facing the index-th peer.
+
+    The odd peers use the first port of each pair.
+    """
+    pair_num = (index + 1) // 2
+    offset = (pair_num - 1) * 2
+    if pair_num == 1 and len(ports) < 2:
+        return None
+    if len(ports) < offset + 1:
+        return None
+    position = offset if index % 2 != 0 else offset + 1
+    if position >= len(ports):
+        return None
+    return ports[position]
+
+
+class InterconnectAllocator:
+    """Allocates the /31 of the spine/leaf links from the technical pool.
+
+    Each leaf owns a block of `block_size` /31, one per spine: the leafs take
+    the blocks from the start of the pool and the border leafs from its end.
+    The /31 already bound to a link are passed with `existing` and kept as is,
+    a link whose position in its block is taken gets the first free /31.
+    """
+
+    def __init__(
+        self,
+        pool: str,
+        block_size: int,
+        existing: Optional[Dict[Tuple[str, str], str]] = None,
+    ) -> None:
+        self.pool = ipaddress.ip_network(pool)
+        self.block_size = max(block_size, 1)
+        self._first = int(self.pool.network_address)
+        self._size = self.pool.num_addresses // 2
+        self._blocks = self._size // self.block_size
+        self._links: Dict[Tuple[str, str], int] = {}
+        self._used: Set[int] = set()
+        for link, prefix in (existing or {}).items():
+            subnet = ipaddress.ip_network(prefix)
+            if subnet.prefixlen != 31 or not subnet.subnet_of(self.pool):
+                continue
+            index = (int(subnet.network_address) - self._first) // 2
+            if index in self._used:
+                continue
+            self._links[link] = index
+            self._used.add(index)
+
+    def subnet(
+        self,
+        spine: str,
+        leaf: str,
+        leaf_idx: int,
+        spine_idx: int,
+        border: bool = False,
+    ) -> Optional[ipaddress.IPv4Network]:
+        index = self._links.get((spine, leaf))
+        if index is None:
+            index = self._allocate(leaf_idx, spine_idx, border)
+            if index is None:
+                return None
+            self._links[(spine, leaf)] = index
+            self._used.add(index)
+        return ipaddress.ip_network((self._first + 2 * index, 31))
+
+    def _allocate(self, leaf_idx: int, spine_idx: int, border: bool) -> Optional[int]:
+        block = self._blocks - leaf_idx if border else leaf_idx - 1
+        if spine_idx <= self.block_size and 0 <= block < self._blocks:
+            index = block * self.block_size + spine_idx - 1
+            if index not in self._used:
+                return index
+        return next(
+            (index for index in range(self._size) if index not in self._used), None
+        )
+
+
+def _plan_device(
+    name: str,
+    element: TopologyElement,
+    asn: Optional[int],
+    loopback_hosts: Iterator,
+    loopback_vtep_hosts: Iterator,
+    management_hosts: Iterator,
+    pools: PrefixPools,
+    ports: Optional[PortMap] = None,
+) -> PlannedDevice:
+    device = PlannedDevice(
+        name=name,
+        role=element.role,
+        device_type=element.device_type,
+        platform=element.platform,
+        mtu=element.mtu,
+        asn=asn,
+    )
+    logical_interfaces = (
+        (
+            INTERFACE_LOOP_NAME[element.device_type],
+            LOOPBACK_ROLE,
+            f"{next(loopback_hosts)}/32",
+            pools.loopback,
+        ),
+        (
+            INTERFACE_VTEP_NAME[element.device_type],
+            LOOPBACK_ROLE,
+            f"{next(loopback_vtep_hosts)}/32",
+            pools.loopback_vtep,
+        ),
+        (
+            INTERFACE_MGMT_NAME[element.device_type],
+            MGMT_ROLE,
+            f"{next(management_hosts)}/{ipaddress.ip_network(pools.management).prefixlen}",
+            pools.management,
+        ),
+    )
+    for intf_name, intf_role, address, address_prefix in logical_interfaces:
+        device.interfaces.append(
+            PlannedInterface(
+                device=name,
+                name=intf_name,
+                role=intf_role,
+                kind=interface_kind(intf_role),
+                status=ACTIVE_STATUS,
+                description=interface_description(intf_name, name),
+                mtu=element.mtu,
+                address=address,
+                address_prefix=address_prefix,
+            )
+        )
+
+    if ports is None:
+        return device
+
+    for intf_name, intf_role in ports.ports:
+        if intf_role not in L3_ROLE_MAPPING and intf_role not in L2_ROLE_MAPPING:
+            continue
+        device.interfaces.append(
+            PlannedInterface(
+                device=name,
+                name=intf_name,
+                role=intf_role,
+                kind=interface_kind(intf_role),
+                status=PROVISIONING_STATUS,
+                description=interface_description(intf_name, name),
+                mtu=element.mtu,
+                l2_mode="Access" if intf_role in L2_ROLE_MAPPING else None,
+            )
+        )
+    return device
+
+
+def _plan_uplinks(
+    plan: FabricPlan,
+    topology_name: str,
+    location_shortname: str,
+    underlay: Optional[str],
+    leaf_label: str,
+    leaf_quantity: int,
+    spine_quantity: int,
+    spine_ports: List[str],
+    spine_ports_role: str,
+    leaf_ports: List[str],
+    allocator: InterconnectAllocator,
+    border: bool,
+    bgp_groups: Dict[str, PlannedBGPGroup],
+) -> None:
+    """Cables every leaf of a kind to all the spines, one /31 per link."""
+    for leaf_idx in range(1, leaf_quantity + 1):
+        if leaf_idx > len(spine_ports):
+            plan.errors.append(
+                f"The quantity of {leaf_label} requested ({leaf_quantity}) is superior"
+                f" to the number of interfaces flagged as '{spine_ports_role}'"
+                f" ({len(spine_ports)})"
+            )
+            break
+        spine_port = paired_port(spine_ports, leaf_idx)
+        if spine_port is None:
+            continue
+
+        for spine_idx in range(1, spine_quantity + 1):
+            if spine_idx > len(leaf_ports):
+                plan.errors.append(
+                    f"The quantity of spines requested ({spine_quantity}) is superior"
+                    " to the number of interfaces flagged as 'uplink'"
+                    f" ({len(leaf_ports)})"
+                )
+                break
+            leaf_port = paired_port(leaf_ports, spine_idx)
+            if leaf_port is None:
+                continue
+
+            spine_name = f"{topology_name}-spine{spine_idx}"
+            leaf_name = f"{topology_name}-{leaf_label}{leaf_idx}"
+            spine_description = interface_description(spine_port, spine_name)
+            leaf_description = interface_description(leaf_port, leaf_name)
+
+            subnet = allocator.subnet(
+                spine=spine_name,
+                leaf=leaf_name,
+                leaf_idx=leaf_idx,
+                spine_idx=spine_idx,
+                border=border,
+            )
+            if subnet is None:
+                plan.errors.append(
+                    f"The technical pool {allocator.pool} is too small to connect"
+                    f" {leaf_name} to {spine_name}"
+                )
+                plan.complete = False
+                return
+            spine_ip = subnet.network_address
+            leaf_ip = spine_ip + 1
+            link = PlannedLink(
+                kind=L3_INTERFACE_KIND,
+                a_device=spine_name,
+                a_interface=spine_port,
+                a_description=f"{spine_description} to {leaf_description}",
+                b_device=leaf_name,
+                b_interface=leaf_port,
+                b_description=f"{leaf_description} to {spine_description}",
+                prefix=str(subnet),
+                prefix_description=f"{location_shortname.lower()}-ico-{subnet.network_address}",
+                a_address=f"{spine_ip}/31",
+                b_address=f"{leaf_ip}/31",
+            )
+            plan.links.append(link)
+
+            if underlay != "ebgp":
+                continue
+
+            spine = plan.get_device(spine_name)
+            leaf = plan.get_device(leaf_name)
+            spine_asn = spine.asn if spine else None
+            leaf_asn = leaf.asn if leaf else None
+            leaf_pair = (leaf_idx + 1) // 2
+            spine_group = PlannedBGPGroup(
+                name=f"{topology_name}-underlay-spine-{leaf_label}-pair{leaf_pair}",
+                local_asn=spine_asn,
+                remote_asn=leaf_asn,
+                description=f"BGP group for {topology_name} underlay",
+            )
+            leaf_group = PlannedBGPGroup(
+                name=f"{topology_name}-underlay-{leaf_label}-pair{leaf_pair}-spine",
+                local_asn=leaf_asn,
+                remote_asn=spine_asn,
+                description=f"BGP group for {topology_name} underlay",
+            )
+            bgp_groups[spine_group.name] = spine_group
+            bgp_groups[leaf_group.name] = leaf_group
+
+            spine_session = PlannedBGPSession(
+                name=f"spine-{subnet}",
+                device=spine_name,
+                local_asn=spine_asn,
+                remote_asn=leaf_asn,
+                local_address=link.a_address,
+                remote_address=link.b_address,
+                peer_group=spine_group.name,
+                description=remove_interface_prefixes(link.a_description),
+            )
+            plan.bgp_sessions.append(spine_session)
+            plan.bgp_sessions.append(
+                PlannedBGPSession(
+                    name=f"{leaf_label}-{subnet}",
+                    device=leaf_name,
+                    local_asn=leaf_asn,
+                    remote_asn=spine_asn,
+                    local_address=link.b_address,
+                    remote_address=link.a_address,
+                    peer_group=leaf_group.name,
+                    description=remove_interface_prefixes(link.b_description),
+                    peer_session=spine_session.name,
+                )
+            )
+
+
+def plan_fabric(
+    topology_name: str,
+    topology_index: int,
+    location_shortname: str,
+    elements: List[TopologyElement],
+    pools: PrefixPools,
+    underlay: Optional[str] = None,
+    overlay: Optional[str] = None,
+    existing_interconnects: Optional[Dict[Tuple[str, str], str]] = None,
+    max_spines: Optional[int] = None,
+) -> FabricPlan:
+    """Computes the complete desired state of a topology fabric.
+
+    `existing_interconnects` maps the (spine, leaf) names of the links already
+    addressed to their /31, they are kept. `max_spines` reserves the /31 of
+    more spines than the topology has for each leaf, as far as the technical
+    pool allows, so that adding spines keeps the blocks contiguous.
+    """
+    plan = FabricPlan()
+
+    # The ports facing the peers scale with the number of peers
+    spine_quantity = leaf_quantity = border_leaf_quantity = 0
+    for element in elements:
+        if not element.device_type:
+            continue
+        if element.role == "spine":
+            spine_quantity = element.quantity
+        elif element.role == "leaf" and element.border:
+            border_leaf_quantity = element.quantity
+        elif element.role == "leaf":
+            leaf_quantity = element.quantity
+    demand = {
+        "spine": (("leaf", leaf_quantity), ("uplink", border_leaf_quantity)),
+        "leaf": (("uplink", spine_quantity),),
+    }
+    for element in elements:
+        if not element.device_type:
+            continue
+        role = element.role.lower()
+        ports = port_map(element.device_type, role, demand.get(role, ()))
+        if ports is None:
+            continue
+        for interface_role, quantity in demand.get(role, ()):
+            available = len(ports.by_role.get(interface_role, ()))
+            if quantity > available:
+                plan.errors.append(
+                    f"A {role} {element.device_type} has {available} interfaces flagged"
+                    f" as '{interface_role}', {quantity} are needed by the topology"
+                )
+                plan.complete = False
+
+    #   -------------------- Devices --------------------
+    # Every device takes an address from each of these pools
+    device_quantity = sum(
+        element.quantity
+        for element in elements
+        if element.device_type and element.platform
+    )
+    exhausted_pools = [
+        (label, pool)
+        for label, pool in (
+            ("loopback", pools.loopback),
+            ("loopback VTEP", pools.loopback_vtep),
+            ("management", pools.management),
+        )
+        if host_count(pool) < device_quantity
+    ]
+    for label, pool in exhausted_pools:
+        plan.errors.append(
+            f"The {label} pool {pool} is too small for the {device_quantity} devices"
+            f" of {topology_name}"
+        )
+    if exhausted_pools:
+        plan.complete = False
+        return plan
+
+    loopback_hosts = ipaddress.ip_network(pools.loopback).hosts()
+    loopback_vtep_hosts = ipaddress.ip_network(pools.loopback_vtep).hosts()
+    management_hosts = ipaddress.ip_network(pools.management).hosts()
+    sorted_elements = sorted(elements, key=lambda x: x.role, reverse=True)
+    for element_index, element in enumerate(sorted_elements):
+        if not element.device_type or not element.platform:
+            continue
+        for idx in range(1, element.quantity + 1):
+            name = device_name(topology_name, element.role, idx, element.border)
+            # Without eBGP in the underlay or overlay, the device uses the "default" ASN
+            asn = None
+            if underlay == "ebgp" or overlay == "ebgp":
+                asn = generate_asn(
+                    location_index=topology_index,
+                    element_type_index=element_index,
+                    element_index=0 if element.role == "spine" else idx,
+                )
+            plan.add_device(
+                _plan_device(
+                    name=name,
+                    element=element,
+                    asn=asn,
+                    loopback_hosts=loopback_hosts,
+                    loopback_vtep_hosts=loopback_vtep_hosts,
+                    management_hosts=management_hosts,
+                    pools=pools,
+                    ports=port_map(
+                        element.device_type,
+                        element.role.lower(),
+                        demand.get(element.role.lower(), ()),
+                    ),
+                )
+            )
+
+    #   -------------------- Cabling --------------------
+    #   odd number lf1 uplink port <-> sp1 odd number leaf port
+    #   even number lf1 uplink port <-> sp2 odd number leaf port
+    #   odd number lf2 uplink port <-> sp1 even number leaf port
+    #   even number lf2 uplink port <-> sp2 even number leaf port
+    #   odd number lf1 peer port <-> lf2 odd number peer port
+    #   even number lf1 peer port <-> lf2 even number peer port
+    spine_leaf_interfaces = spine_uplink_interfaces = None
+    leaf_uplink_interfaces = leaf_peer_interfaces = None
+    border_leaf_uplink_interfaces = None
+    for element in elements:
+        if not element.device_type:
+            continue
+        if element.role == "spine":
+            spine_leaf_interfaces = get_interface_names(
+                element.device_type, "spine", "leaf", demand["spine"]
+            )
+            spine_uplink_interfaces = get_interface_names(
+                element.device_type, "spine", "uplink", demand["spine"]
+            )
+        elif element.role == "leaf" and element.border:
+            border_leaf_uplink_interfaces = get_interface_names(
+                element.device_type, "leaf", "uplink", demand["leaf"]
+            )
+        elif element.role == "leaf":
+            leaf_uplink_interfaces = get_interface_names(
+                element.device_type, "leaf", "uplink", demand["leaf"]
+            )
+            leaf_peer_interfaces = get_interface_names(
+                element.device_type, "leaf", "peer", demand["leaf"]
+            )
+
+    if not spine_leaf_interfaces or not leaf_uplink_interfaces:
+        plan.errors.append(
+            "No 'uplink' interfaces found on leaf or no 'leaf' interfaces on spines"
+        )
+        plan.complete = False
+        return plan
+
+    # Each leaf reserves a /31 per spine, up to max_spines when the pool has room
+    block_size = spine_quantity
+    if max_spines:
+        technical_links = ipaddress.ip_network(pools.technical).num_addresses // 2
+        leafs = max(leaf_quantity + border_leaf_quantity, 1)
+        block_size = max(spine_quantity, min(max_spines, technical_links // leafs))
+    allocator = InterconnectAllocator(
+        pools.technical, block_size=block_size, existing=existing_interconnects
+    )
+    bgp_groups: Dict[str, PlannedBGPGroup] = {}
+    _plan_uplinks(
+        plan=plan,
+        topology_name=topology_name,
+        location_shortname=location_shortname,
+        underlay=underlay,
+        leaf_label="leaf",
+        leaf_quantity=leaf_quantity,
+        spine_quantity=spine_quantity,
+        spine_ports=spine_leaf_interfaces,
+        spine_ports_role="leaf",
+        leaf_ports=leaf_uplink_interfaces,
+        allocator=allocator,
+        border=False,
+        bgp_groups=bgp_groups,
+    )
+    if border_leaf_quantity > 0:
+        _plan_uplinks(
+            plan=plan,
+            topology_name=topology_name,
+            location_shortname=location_shortname,
+            underlay=underlay,
+            leaf_label="borderleaf",
+            leaf_quantity=border_leaf_quantity,
+            spine_quantity=spine_quantity,
+            spine_ports=spine_uplink_interfaces or [],
+            spine_ports_role="uplink",
+            leaf_ports=border_leaf_uplink_interfaces or [],
+            allocator=allocator,
+            border=True,
+            bgp_groups=bgp_groups,
+        )
+    plan.bgp_groups = list(bgp_groups.values())
+
+    if not leaf_peer_interfaces:
+        plan.errors.append("No 'peer' interfaces found on Leaf")
+        plan.complete = False
+        return plan
+    if leaf_quantity % 2 != 0:
+        plan.errors.append("The number of leaf must be even to form pairs")
+        plan.complete = False
+        return plan
+
+    for leaf_idx in range(1, leaf_quantity + 1, 2):
+        leaf1_name = f"{topology_name}-leaf{leaf_idx}"
+        leaf2_name = f"{topology_name}-leaf{leaf_idx + 1}"
+        for peer_port in leaf_peer_interfaces:
+            leaf1_description = interface_description(peer_port, leaf1_name)
+            leaf2_description = interface_description(peer_port, leaf2_name)
+            plan.links.append(
+                PlannedLink(
+                    kind=L2_INTERFACE_KIND,
+                    a_device=leaf1_name,
+                    a_interface=peer_port,
+                    a_description=f"{leaf1_description} to {leaf2_description}",
+                    b_device=leaf2_name,
+                    b_interface=peer_port,
+                    b_description=f"{leaf2_description} to {leaf1_description}",
+                )
+            )
+
+    return plan
@@ -1,181 +1,390 @@
+import asyncio
+import ipaddress
 import logging
+import sys
 import uuid
 from collections import defaultdict
-from ipaddress import IPv4Network
-from typing import Any, Dict, List, Optional
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 from infrahub_sdk.batch import InfrahubBatch
 from infrahub_sdk.node import InfrahubNode
-from infrahub_sdk import InfrahubClient
+from infrahub_sdk import Config, InfrahubClient
 from infrahub_sdk.uuidt import UUIDT
-from utils import populate_local_store, create_and_save, create_and_add_to_batch
+from fabric_planner import (
+    ACTIVE_STATUS,
+    L3_INTERFACE_KIND,
+    L2_INTERFACE_KIND,
+    MGMT_ROLE,
+    PlannedDevice,
+    PrefixPools,
+    TopologyElement,
+    interface_kind,
+    plan_fabric,
+)
+from instrumentation import instrument_run
+from recorder import (
+    DRY_RUN_LATENCY,
+    RequestRecorder,
+    run_with_virtual_clock,
+    set_phase,
+)
+from scheduler import REQUEST_BUDGET, TOPOLOGY_CONCURRENCY, TopologyScheduler
+from utils import (
+    create_and_add_to_batch,
+    create_and_save,
+    NodeCache,
+    NodeIndex,
+    ReferenceDataError,
+    iter_records,
+    load_reference_data,
+)
 
 
 # flake8: noqa
 # pylint: skip-file
 
-INTERFACE_MGMT_NAME = {
-    "QFX5110-48S-S": "fxp0",
-    "CCS-720DP-48S-2F": "Management0",
-    "NCS-5501-SE": "MgmtEth0/RP0/CPU0/0",
-    "ASR1002-HX": "GigabitEthernet0",
-    "linux": "Eth0",
+INTERFACE_KINDS = (L3_INTERFACE_KIND, L2_INTERFACE_KIND)
+
+# Root of the repository, where the stand-in used by the dry run is
+PROJECT_DIRECTORY = Path(__file__).parent.parent
+
+# Number of devices of a topology built concurrently
+DEVICE_CONCURRENCY = 10
+
+# Kinds retrieved before generating the topologies, with their key in the store
+REFERENCE_KINDS = {
+    "CoreAccount": "name",
+    "OrganizationTenant": "name",
+    "OrganizationProvider": "name",
+    "OrganizationManufacturer": "name",
+    "InfraAutonomousSystem": "name",
+    "InfraPlatform": "name",
+    "InfraDeviceType": "name",
+    "TopologyTopology": "name",
+    "TopologyEVPNStrategy": "name",
+    "LocationGeneric": "name",
+    "CoreStandardGroup": "name",
+    "InfraVRF": "name",
 }
 
-INTERFACE_LOOP_NAME = {
-    "QFX5110-48S-S": "lo0",
-    "CCS-720DP-48S-2F": "Loopback0",
-    "NCS-5501-SE": "Loopback0",
-    "ASR1002-HX": "Loopback 0",
-    "linux": "lo",
-}
 
-INTERFACE_VTEP_NAME = {
-    "QFX5110-48S-S": "lo1",
-    "CCS-720DP-48S-2F": "Loopback1",
-    "NCS-5501-SE": "Loopback1",
-    "ASR1002-HX": "Loopback 1",
-    "linux": "lo1",
-}
+@dataclass
+class LocationContext:
+    """VLANs, prefixes by role and VRF of a location."""
 
-DEVICES_INTERFACES = {
-    # Device Type [ Interfaces ]
-    "QFX5110-48S-S": [
-        "xe-0/0/0",
-        "xe-0/0/1",
-        "xe-0/0/2",
-        "xe-0/0/3",
-        "xe-0/0/4",
-        "xe-0/0/5",
-        "xe-0/0/6",
-        "xe-0/0/7",
-        "xe-0/0/8",
-        "xe-0/0/9",
-        "xe-0/0/10",
-        "xe-0/0/11",
-        "xe-0/0/12",
-        "xe-0/0/13",
-    ],
-    "CCS-720DP-48S-2F": [
-        "Ethernet1",
-        "Ethernet2",
-        "Ethernet3",
-        "Ethernet4",
-        "Ethernet5",
-        "Ethernet6",
-        "Ethernet7",
-        "Ethernet8",
-        "Ethernet9",
-        "Ethernet10",
-        "Ethernet11",
-        "Ethernet12",
-        "Ethernet13",
-        "Ethernet14",
-    ],
-    "NCS-5501-SE": [
-        "Ethernet1",
-        "Ethernet2",
-        "Ethernet3",
-        "Ethernet4",
-        "Ethernet5",
-        "Ethernet6",
-        "Ethernet7",
-        "Ethernet8",
-        "Ethernet9",
-        "Ethernet10",
-        "Ethernet11",
-        "Ethernet12",
-        "Ethernet13",
-        "Ethernet14",
-    ],
-    "ASR1002-HX": [
-        "Ethernet1",
-        "Ethernet2",
-        "Ethernet3",
-        "Ethernet4",
-        "Ethernet5",
-        "Ethernet6",
-        "Ethernet7",
-        "Ethernet8",
-        "Ethernet9",
-        "Ethernet10",
-        "Ethernet11",
-        "Ethernet12",
-        "Ethernet13",
-        "Ethernet14",
-    ],
-}
+    vlans: List[InfrahubNode] = field(default_factory=list)
+    prefixes: Dict[str, List[InfrahubNode]] = field(
+        default_factory=lambda: defaultdict(list)
+    )
+    backbone_vrf: Optional[InfrahubNode] = None
 
-# 14 Interfaces to fit DEVICES_INTERFACES
-INTERFACE_ROLES_MAPPING = {
-    "spine": [
-        "leaf",  # Ethernet1  - leaf1 (L3)
-        "leaf",  # Ethernet2  - leaf2 (L3)
-        "leaf",  # Ethernet3  - leaf3 (L3)
-        "leaf",  # Ethernet4  - leaf4 (L3)
-        "leaf",  # Ethernet5  - leaf5 (L3)
-        "leaf",  # Ethernet6  - leaf6 (L3)
-        "leaf",  # Ethernet7  - leaf7 (L3)
-        "leaf",  # Ethernet8  - leaf8 (L3)
-        "leaf",  # Ethernet9  - leaf9 (L3)
-        "leaf",  # Ethernet10 - leaf10 (L3)
-        "uplink",  # Ethernet11
-        "uplink",  # Ethernet12
-        "spare",  # Ethernet13
-        "spare",  # Ethernet14
-    ],
-    "leaf": [
-        "server",  # Ethernet1
-        "server",  # Ethernet2
-        "server",  # Ethernet3
-        "server",  # Ethernet4
-        "server",  # Ethernet5
-        "server",  # Ethernet6
-        "spare",  # Ethernet7
-        "peer",  # Ethernet8  - leaf (L2)
-        "peer",  # Ethernet9  - leaf (L2)
-        "uplink",  # Ethernet10 - spine1 (L3)
-        "uplink",  # Ethernet11 - spine2 (L3)
-        "uplink",  # Ethernet12 - spine3 (L3)
-        "uplink",  # Ethernet13 - spine4 (L3)
-        "spare",  # Ethernet14
-    ],
-}
+    def vlan(self, name: str) -> Optional[InfrahubNode]:
+        for vlan in self.vlans:
+            if vlan.name.value == name:
+                return vlan
+        return None
 
-L3_ROLE_MAPPING = ["backbone", "upstream", "peering", "uplink", "leaf", "spare"]
-L2_ROLE_MAPPING = [
-    "peer",
-    "server",
-]
+    def vlans_with_role(self, role: str) -> List[InfrahubNode]:
+        return [vlan for vlan in self.vlans if vlan.role.value == role]
 
-DEVICE_INTERFACE_OBJS: Dict[str, List[InfrahubNode]] = defaultdict(list)
 
-# Mapping Dropdown Role and Status here
-ACTIVE_STATUS = "active"
-PROVISIONING_STATUS = "provisioning"
-LOOPBACK_ROLE = "loopback"
-MGMT_ROLE = "management"
+class LocationContexts:
+    """Loads the context of each location once, for all the topologies of the location.
 
+    The VLANs and prefixes of a location are retrieved with concurrent queries,
+    topologies generated at the same time on the same location wait for the same load.
+    """
 
-def get_interface_names(
-    device_type: str, device_role: str, interface_role: str
-) -> Optional[List]:
-    if device_type not in DEVICES_INTERFACES:
-        return None
-    if device_role not in INTERFACE_ROLES_MAPPING:
-        return None
+    def __init__(self, client: InfrahubClient, branch: str) -> None:
+        self.client = client
+        self.branch = branch
+        self._contexts: Dict[str, asyncio.Future] = {}
+
+    async def get(self, location_shortname: str) -> LocationContext:
+        if location_shortname not in self._contexts:
+            self._contexts[location_shortname] = asyncio.ensure_future(
+                self._load(location_shortname=location_shortname)
+            )
+        future = self._contexts[location_shortname]
+        try:
+            return await future
+        except Exception:
+            # Not kept, the next topology of the location loads it again
+            if self._contexts.get(location_shortname) is future:
+                del self._contexts[location_shortname]
+            raise
+
+    async def _load(self, location_shortname: str) -> LocationContext:
+        vlans, prefixes = await asyncio.gather(
+            self.client.filters(
+                kind="InfraVLAN",
+                location__shortname__value=location_shortname,
+                branch=self.branch,
+            ),
+            self.client.filters(
+                kind="InfraPrefix",
+                location__shortname__value=location_shortname,
+                branch=self.branch,
+            ),
+        )
+        context = LocationContext(
+            vlans=vlans,
+            backbone_vrf=self.client.store.get(key="Backbone", kind="InfraVRF"),
+        )
+        # Using Prefix role to knwow which network to use. Role to Prefix should help avoid doing this
+        for prefix in prefixes:
+            context.prefixes[prefix.role.value].append(prefix)
+        return context
+
+
+class InterfaceIndex:
+    """Interfaces of a topology split by device id and indexed by name."""
+
+    def __init__(self) -> None:
+        self._devices: Dict[str, Dict[str, InfrahubNode]] = defaultdict(dict)
+        # Devices of the topology by id
+        self.devices: Dict[str, InfrahubNode] = {}
+
+    def __len__(self) -> int:
+        return sum(len(interfaces) for interfaces in self._devices.values())
+
+    def interfaces(self, kind: str) -> List[InfrahubNode]:
+        return [
+            interface
+            for interfaces in self._devices.values()
+            for interface in interfaces.values()
+            if interface.get_kind() == kind
+        ]
+
+    def add(self, interface: InfrahubNode) -> None:
+        if not interface.id or not interface.device.id:
+            return
+        self._devices[interface.device.id][interface.name.value] = interface
+
+    def get(
+        self, device_id: Optional[str], name: str, kind: Optional[str] = None
+    ) -> Optional[InfrahubNode]:
+        interface = self._devices.get(device_id, {}).get(name)
+        if interface is None or (kind and interface.get_kind() != kind):
+            return None
+        return interface
+
+
+async def prefetch_interfaces(
+    client: InfrahubClient, branch: str, topology_id: str
+) -> InterfaceIndex:
+    """Retrieves the interfaces of all the topology devices, one paginated query per kind.
+
+    The devices and the interfaces are retrieved with their properties, to be
+    compared with the plan.
+    """
+    interface_index = InterfaceIndex()
+    # The filters only go one relationship deep, the devices are retrieved first
+    devices = await client.filters(
+        kind="InfraDevice",
+        topology__ids=[topology_id],
+        branch=branch,
+        property=True,
+        parallel=True,
+    )
+    if not devices:
+        return interface_index
+    interface_index.devices = {device.id: device for device in devices}
+    device_ids = [device.id for device in devices]
+    for kind in INTERFACE_KINDS:
+        interfaces = await client.filters(
+            kind=kind,
+            device__ids=device_ids,
+            branch=branch,
+            property=True,
+            include=["tagged_vlan"] if kind == L2_INTERFACE_KIND else None,
+            parallel=True,
+        )
+        for interface in interfaces:
+            interface_index.add(interface)
+    return interface_index
+
+
+async def prefetch_addresses(
+    client: InfrahubClient, branch: str, interface_index: InterfaceIndex
+) -> List[InfrahubNode]:
+    """Retrieves the addresses of the L3 interfaces of the topology devices."""
+    interface_ids = [
+        interface.id for interface in interface_index.interfaces(kind=L3_INTERFACE_KIND)
+    ]
+    if not interface_ids:
+        return []
+    return await client.filters(
+        kind="InfraIPAddress",
+        interface__ids=interface_ids,
+        branch=branch,
+        property=True,
+        parallel=True,
+    )
+
+
+def existing_interconnects(
+    interface_index: InterfaceIndex, addresses: List[InfrahubNode]
+) -> Dict[Tuple[str, str], str]:
+    """Returns the /31 already addressed on the spine/leaf links, by (spine, leaf) name."""
+    interface_devices = {
+        interface.id: interface.device.id
+        for interface in interface_index.interfaces(kind=L3_INTERFACE_KIND)
+        if interface.role.value in ("leaf", "uplink")
+    }
+    endpoints: Dict[str, Set[str]] = defaultdict(set)
+    for address in addresses:
+        network = ipaddress.ip_interface(address.address.value).network
+        device_id = interface_devices.get(address.interface.id)
+        if network.prefixlen == 31 and device_id:
+            endpoints[str(network)].add(device_id)
+    links: Dict[Tuple[str, str], str] = {}
+    for prefix, device_ids in endpoints.items():
+        devices = [interface_index.devices[device_id] for device_id in device_ids]
+        spines = [device for device in devices if device.role.value == "spine"]
+        leafs = [device for device in devices if device.role.value == "leaf"]
+        if len(spines) == 1 and len(leafs) == 1:
+            links[(spines[0].name.value, leafs[0].name.value)] = prefix
+    return links
+
+
+async def prefetch_topology_nodes(
+    client: InfrahubClient,
+    branch: str,
+    interface_index: InterfaceIndex,
+    addresses: List[InfrahubNode],
+    asn_names: List[str],
+    bgp_group_names: List[str],
+) -> NodeCache:
+    """Indexes the nodes of the topology already in Infrahub by the name they are saved with.
+
+    The BGP sessions are identified by their device and remote address.
+    """
+    cache = NodeCache()
+    device_names = {
+        device.id: device.name.value for device in interface_index.devices.values()
+    }
+    for device in interface_index.devices.values():
+        cache.add(node=device, key=device.name.value)
+    interface_names = {}
+    for kind in INTERFACE_KINDS:
+        for interface in interface_index.interfaces(kind=kind):
+            name = f"{device_names[interface.device.id]}-{interface.name.value}"
+            interface_names[interface.id] = name
+            cache.add(node=interface, key=name)
+    address_values = {}
+    for address in addresses:
+        address_values[address.id] = str(address.address.value)
+        if address.interface.id in interface_names:
+            cache.add(
+                node=address, key=f"{interface_names[address.interface.id]}-address"
+            )
 
-    # Mapping of roles to interface indices
-    role_indices = [
-        i
-        for i, r in enumerate(INTERFACE_ROLES_MAPPING[device_role])
-        if r == interface_role
+    queries = [
+        client.filters(
+            kind=kind, name__values=names, branch=branch, property=True, parallel=True
+        )
+        for kind, names in (
+            ("InfraAutonomousSystem", asn_names),
+            ("InfraBGPPeerGroup", bgp_group_names),
+        )
+        if names
     ]
+    if device_names:
+        queries.append(
+            client.filters(
+                kind="InfraBGPSession",
+                device__ids=list(device_names),
+                branch=branch,
+                property=True,
+                parallel=True,
+            )
+        )
+    for nodes in await asyncio.gather(*queries):
+        for node in nodes:
+            if node.get_kind() != "InfraBGPSession":
+                cache.add(node=node, key=node.name.value)
+            elif node.device.id in device_names and node.remote_ip.id in address_values:
+                cache.add(
+                    node=node,
+                    key=bgp_session_key(
+                        device_name=device_names[node.device.id],
+                        remote_address=address_values[node.remote_ip.id],
+                    ),
+                )
+    return cache
+
 
-    # Get the interface names based on the indices for the specific device model
-    interface_names = [DEVICES_INTERFACES[device_type][i] for i in role_indices]
+def bgp_session_key(device_name: str, remote_address: str) -> str:
+    return f"{device_name}-{remote_address}"
 
-    return interface_names
+
+async def add_group_members(
+    client: InfrahubClient,
+    log: logging.Logger,
+    branch: str,
+    group_members: Dict[str, List[str]],
+) -> None:
+    """Adds the collected members to their CoreStandardGroup with one save per group."""
+    for group_name, member_ids in group_members.items():
+        # The group is retrieved with its current members, the node held by the
+        # store may have been edited by another topology already
+        group = await client.get(
+            kind="CoreStandardGroup",
+            name__value=group_name,
+            include=["members"],
+            branch=branch,
+            populate_store=False,
+        )
+        existing = {peer.id for peer in group.members.peers}
+        new_ids = [member_id for member_id in member_ids if member_id not in existing]
+        if not new_ids:
+            continue
+        for member_id in new_ids:
+            group.members.add(member_id)
+        await group.save()
+        log.info(f"- Add {len(new_ids)} members to {group_name} CoreStandardGroup")
+
+
+async def regenerate_artifacts(
+    client: InfrahubClient,
+    log: logging.Logger,
+    branch: str,
+    artifact_targets: Dict[str, Set[str]],
+    topology_ids: Optional[Set[str]] = None,
+) -> None:
+    """Regenerates the artifacts of the given nodes, indexed by the name of the targeted group.
+
+    The topologies are regenerated by the definitions targeting one of their groups.
+    """
+    if not artifact_targets and not topology_ids:
+        return
+    artifact_definitions = await client.filters(
+        kind="CoreArtifactDefinition", branch=branch, prefetch_relationships=True
+    )
+    topology_groups: Dict[str, Set[str]] = defaultdict(set)
+    if topology_ids:
+        for topology in await client.filters(
+            kind="TopologyTopology",
+            branch=branch,
+            ids=sorted(topology_ids),
+            include=["member_of_groups"],
+        ):
+            for group in topology.member_of_groups.peers:
+                topology_groups[group.id].add(topology.id)
+    for artifact_definition in artifact_definitions:
+        group = artifact_definition.targets.peer
+        node_ids = (
+            artifact_targets.get(group.name.value, set()) | topology_groups[group.id]
+        )
+        if not node_ids:
+            continue
+        await artifact_definition.generate(nodes=sorted(node_ids))
+        log.info(
+            f"- Regenerate {artifact_definition.name.value} for {len(node_ids)} nodes"
+        )
 
 
 async def upsert_interface(
@@ -185,15 +394,14 @@ async def upsert_interface(
     device_name: str,
     intf_name: str,
     data: Dict[str, Any],
+    interface_index: InterfaceIndex,
     batch: Optional[InfrahubBatch] = None,
+    cache: Optional[NodeCache] = None,
 ) -> InfrahubNode:
-    kind_name = data["kind_name"]
-    data.pop("kind_name")
-    found_iface = None
-    for tmp_iface in DEVICE_INTERFACE_OBJS[device_name]:
-        if tmp_iface.name.value == intf_name:
-            found_iface = tmp_iface
-            break
+    kind_name = data.pop("kind_name")
+    found_iface = interface_index.get(
+        device_id=data["device"]["id"], name=intf_name, kind=kind_name
+    )
     if found_iface is not None:
         data["id"] = found_iface.id
 
@@ -206,6 +414,7 @@ async def upsert_interface(
             kind_name=kind_name,
             data=data,
             batch=batch,
+            cache=cache,
         )
     else:
         interface_obj = await create_and_save(
@@ -215,7 +424,9 @@ async def upsert_interface(
             object_name=f"{device_name}-{intf_name}",
             kind_name=kind_name,
             data=data,
+            cache=cache,
         )
+        interface_index.add(interface_obj)
     return interface_obj
 
 
@@ -230,7 +441,8 @@ async def upsert_ip_address(
     account_pop_id: str,
     address: str,
     batch: Optional[InfrahubBatch] = None,
-) -> None:
+    cache: Optional[NodeCache] = None,
+) -> InfrahubNode:
     if prefix_obj:
         prefix_id = prefix_obj.id
         if prefix_obj.ip_namespace:
@@ -258,6 +470,7 @@ async def upsert_ip_address(
             kind_name="InfraIPAddress",
             data=data,
             batch=batch,
+            cache=cache,
         )
     else:
         ip_obj = await create_and_save(
@@ -267,6 +480,7 @@ async def upsert_ip_address(
             object_name=f"{device_name}-{interface_obj.name.value}-address",
             kind_name="InfraIPAddress",
             data=data,
+            cache=cache,
         )
     return ip_obj
 
@@ -293,9 +507,7 @@ def prepare_interface_data(
         "status": {"value": intf_status, "owner": account_ops_id},
         "role": {"value": intf_role, "source": account_pop_id, "is_protected": True},
         "speed": speed,
-        "kind_name": "InfraInterfaceL3"
-        if intf_role in L3_ROLE_MAPPING or intf_role in (LOOPBACK_ROLE, MGMT_ROLE)
-        else "InfraInterfaceL2",
+        "kind_name": interface_kind(intf_role),
     }
     if l2_mode:
         data["l2_mode"] = l2_mode
@@ -308,38 +520,23 @@ def prepare_interface_data(
     return data
 
 
-def remove_interface_prefixes(text: str) -> str:
-    parts = text.split(":", 1)
-    if len(parts) > 1:
-        return parts[1].lstrip()
-    else:
-        return text
-
-
-def generate_asn(
-    location_index: int, element_type_index: int, element_index: int
-) -> int:
-    location_index_adjusted = location_index + 1
-    element_index_adjusted = (element_index + 1) // 2
-    asn = (
-        65000
-        + (location_index_adjusted * 100)
-        + (element_type_index * 10)
-        + element_index_adjusted
-    )
-    return asn
-
-
 async def generate_topology(
     client: InfrahubClient,
     log: logging.Logger,
     branch: str,
     topology: InfrahubNode,
     topology_index: int,
+    device_concurrency: int = DEVICE_CONCURRENCY,
+    artifact_targets: Optional[Dict[str, Set[str]]] = None,
+    topology_ids: Optional[Set[str]] = None,
+    group_members: Optional[Dict[str, List[str]]] = None,
+    prefix_index: Optional[NodeIndex] = None,
+    location_contexts: Optional[LocationContexts] = None,
 ) -> Optional[str]:
     async with client.start_tracking(
         params={"topology": topology.name.value}
     ) as client:
+        set_phase("location")
         topology_name = topology.name.value
         topology_id = topology.id
 
@@ -373,381 +570,323 @@ async def generate_topology(
         # We are using DUFF Oragnization ASN as "internal" (AS65000)
         internal_as = client.store.get(key="AS65000", kind="InfraAutonomousSystem")
 
-        locations_vlans = await client.filters(
-            kind="InfraVLAN",
-            location__shortname__value=location_shortname,
-            branch=branch,
-        )
-        populate_local_store(
-            objects=locations_vlans, key_type="name", store=client.store
-        )
-        vlan_pxe = client.store.get(
-            key=f"{location_shortname.lower()}_server-pxe", kind="InfraVLAN"
-        )
-        vlans = await client.filters(
-            kind="InfraVLAN",
-            location__shortname__value=location_shortname,
-            branch=branch,
-        )
-        vlans_server = []
-        for vlan in vlans:
-            if (
-                vlan.role.value == "server"
-                and vlan.name != f"{location_shortname.lower}_server-pxe"
-            ):
-                vlans_server.append(vlan)
-        # Using Prefix role to knwow which network to use. Role to Prefix should help avoid doing this
-        locations_subnets = await client.filters(
-            kind="InfraPrefix",
-            location__shortname__value=location_shortname,
-            branch=branch,
-        )
-        location_external_net = []
-        location_technical_net_pool = []
-        location_loopback_net_pool = []
-        location_loopback_vtep_net_pool = []
-        location_mgmt_net_pool = []
+        if location_contexts is None:
+            location_contexts = LocationContexts(client=client, branch=branch)
+        location = await location_contexts.get(location_shortname=location_shortname)
+        vlan_pxe = location.vlan(name=f"{location_shortname.lower()}_server-pxe")
+        vlans_server = location.vlans_with_role(role="server")
 
-        if not locations_subnets:
+        if not any(location.prefixes.values()):
             log.error(f"{topology.location.peer.name.value} doesn't have any prefixes")
             return None
 
-        for prefix in locations_subnets:
-            if prefix.role.value == "management":
-                location_mgmt_net_pool.append(prefix)
-            elif prefix.role.value == "technical":
-                location_technical_net_pool.append(prefix)
-            elif prefix.role.value == "loopback":
-                location_loopback_net_pool.append(prefix)
-            elif prefix.role.value == "loopback-vtep":
-                location_loopback_vtep_net_pool.append(prefix)
-            elif prefix.role.value == "public":
-                location_external_net.append(prefix)
-
-        #   -------------------- Devices Generation --------------------
-        #   - Create Devices
-        #   - Create Devices Interfaces
-        #   - Add IP to external facing L3 Interfaces
+        location_technical_net_pool = location.prefixes["technical"]
+        location_loopback_net_pool = location.prefixes["loopback"]
+        location_loopback_vtep_net_pool = location.prefixes["loopback-vtep"]
+        location_mgmt_net_pool = location.prefixes["management"]
+
+        if (
+            not location_loopback_net_pool
+            or not location_loopback_vtep_net_pool
+            or not location_mgmt_net_pool
+            or not location_technical_net_pool
+        ):
+            log.error(
+                f"{topology.location.peer.name.value} is missing loopback, management or technical prefixes"
+            )
+            return None
 
-        loopback_address_pool = location_loopback_net_pool[0].prefix.value.hosts()
-        loopback_vtep_address_pool = location_loopback_vtep_net_pool[
-            0
-        ].prefix.value.hosts()
-        mgmt_address_pool = location_mgmt_net_pool[0].prefix.value.hosts()
+        #   -------------------- Fabric Planning --------------------
+        set_phase("planning")
+        #   - Devices, Interfaces, Cabling, Addressing and BGP are computed
+        #     by the planner, the rest of this function writes the plan
         topology_elements = await client.filters(
             kind="TopologyPhysicalElement",
             topology__ids=topology.id,
             populate_store=True,
             prefetch_relationships=True,
         )
-
-        batch = await client.create_batch()
-        sorted_topology_elements = sorted(
-            topology_elements, key=lambda x: x.device_role.value, reverse=True
-        )
-        for elemt_index, topology_element in enumerate(sorted_topology_elements):
+        device_types: Dict[str, InfrahubNode] = {}
+        platforms: Dict[str, InfrahubNode] = {}
+        elements: List[TopologyElement] = []
+        for topology_element in topology_elements:
+            element = TopologyElement(
+                role=topology_element.device_role.value,
+                quantity=int(topology_element.quantity.value),
+                mtu=topology_element.mtu.value,
+                border=topology_element.border.value,
+            )
+            elements.append(element)
             if not topology_element.device_type:
                 log.info(f"No device_type for {topology_element.name.value} - Ignored")
                 continue
             device_type = await client.get(
                 ids=topology_element.device_type.id, kind="InfraDeviceType"
             )
+            element.device_type = device_type.name.value
+            device_types[element.device_type] = device_type
             if not device_type.platform.id:
                 log.info(f"No platform for {device_type.name.value} - Ignored")
                 continue
             platform = await client.get(
                 ids=device_type.platform.id, kind="InfraPlatform"
             )
-            platform_id = platform.id
-            device_role_name = topology_element.device_role.value
-            device_type_name = device_type.name.value
-            device_mtu = topology_element.mtu.value
-
-            for id in range(1, int(topology_element.quantity.value) + 1):
-                is_border: bool = topology_element.border.value
-                device_name = f"{topology_name}-{device_role_name}{id}"
-                if is_border and device_role_name != "spine":
-                    device_name = f"{topology_name}-border{device_role_name}{id}"
-                # If neither underlay nor overlay are eBGP, we create the device with the "default" ASN
-                if not strategy_underlay == "ebgp" and not strategy_overlay == "ebgp":
-                    device_asn_id = internal_as.id
-                else:
-                    element_index = 0 if device_role_name == "spine" else id
-                    asn = generate_asn(
-                        location_index=topology_index,
-                        element_type_index=elemt_index,
-                        element_index=element_index,
-                    )
-                    asn_name = f"AS{asn}"
-                    data_asn = {
-                        "name": {
-                            "value": asn_name,
-                            "source": account_crm.id,
-                            "owner": account_pop.id,
-                        },
-                        "asn": {
-                            "value": asn,
-                            "source": account_crm.id,
-                            "owner": account_pop.id,
-                        },
-                        "organization": {"id": orga_duff.id},
-                        "description": {
-                            "value": f"Private {asn_name} for Duff on device {device_name}"
-                        },
-                    }
-                    asn_obj = await create_and_save(
-                        client=client,
-                        log=log,
-                        branch=branch,
-                        object_name=asn_name,
-                        kind_name="InfraAutonomousSystem",
-                        data=data_asn,
-                        retrieved_on_failure=True,
-                    )
-                    device_asn_id = asn_obj.id
-                data_device = {
-                    "name": {
-                        "value": device_name,
-                        "source": account_pop.id,
-                        "is_protected": True,
-                    },
-                    "location": {
-                        "id": location_id,
-                        "source": account_pop.id,
-                        "is_protected": True,
-                    },
-                    "status": {"value": ACTIVE_STATUS, "owner": account_ops.id},
-                    "device_type": {"id": device_type.id, "source": account_pop.id},
-                    "role": {
-                        "value": device_role_name,
-                        "source": account_pop.id,
-                        "is_protected": True,
-                        "owner": account_eng.id,
-                    },
-                    "asn": {
-                        "id": device_asn_id,
-                        "source": account_pop.id,
-                        "is_protected": True,
-                        "owner": account_eng.id,
-                    },
-                    "platform": {
-                        "id": platform_id,
-                        "source": account_pop.id,
-                        "is_protected": True,
-                    },
-                    "topology": {
-                        "id": topology_id,
-                        "source": account_pop.id,
-                        "is_protected": True,
-                    },
-                }
-                device_obj = await create_and_save(
-                    client=client,
-                    log=log,
-                    branch=branch,
-                    object_name=device_name,
-                    kind_name="InfraDevice",
-                    data=data_device,
-                    retrieved_on_failure=True,
-                )
+            element.platform = platform.name.value
+            platforms[element.platform] = platform
 
-                # Add device to groups
-                platform_group_name = (
-                    f"{platform.name.value.lower().split(' ', 1)[0]}_devices"
-                )
-                platform_group = await client.get(
-                    name__value=platform_group_name, kind="CoreStandardGroup"
-                )
-                await platform_group.members.fetch()
-                platform_group.members.add(device_obj.id)
-                await platform_group.save()
-                log.info(
-                    f"- Add {device_name} to {platform_group_name} CoreStandardGroup"
-                )
-                topology_group = await client.get(
-                    name__value=f"{topology_name}_topology", kind="CoreStandardGroup"
-                )
-                await topology_group.members.fetch()
-                topology_group.members.add(device_obj.id)
-                await topology_group.save()
-                log.info(f"- Add {device_name} to {topology_group} CoreStandardGroup")
-
-                # FIXME  Interface name is not unique, upsert() is not good enough for indempotency. Need constraints
-                DEVICE_INTERFACE_OBJS[device_name] = await client.filters(
-                    kind="InfraInterfaceL3",
-                    device__name__value=device_name,
-                    branch=branch,
-                )
-                DEVICE_INTERFACE_OBJS[device_name] += await client.filters(
-                    kind="InfraInterfaceL2",
-                    device__name__value=device_name,
-                    branch=branch,
-                )
+        # Prefetch the interfaces already present on the topology devices
+        # FIXME  Interface name is not unique, upsert() is not good enough for indempotency. Need constraints
+        interface_index = await prefetch_interfaces(
+            client=client, branch=branch, topology_id=topology_id
+        )
+        log.debug(f"- Prefetched {len(interface_index)} interfaces for {topology_name}")
+        interface_addresses = await prefetch_addresses(
+            client=client, branch=branch, interface_index=interface_index
+        )
+        # The links already addressed keep their /31
+        interconnects = existing_interconnects(
+            interface_index=interface_index, addresses=interface_addresses
+        )
 
-                # Loopback Interface
-                loopback_name = INTERFACE_LOOP_NAME[device_type_name]
-                loopback_description = (
-                    f"{loopback_name.lower().replace(' ', '')}.{device_name.lower()}"
-                )
-                loopback_data = prepare_interface_data(
-                    device_obj_id=device_obj.id,
-                    intf_name=loopback_name,
-                    intf_role=LOOPBACK_ROLE,
-                    intf_status=ACTIVE_STATUS,
-                    description=loopback_description,
-                    account_pop_id=account_pop.id,
-                    account_ops_id=account_ops.id,
-                    mtu=device_mtu,
-                )
-                loopback_obj = await upsert_interface(
-                    client=client,
-                    log=log,
-                    branch=branch,
-                    device_name=device_name,
-                    intf_name=loopback_name,
-                    data=loopback_data,
-                )
-                ip_loop = f"{str(next(loopback_address_pool))}/32"
-                await upsert_ip_address(
-                    client=client,
-                    log=log,
-                    branch=branch,
-                    prefix_obj=location_loopback_net_pool[0],
-                    device_name=device_name,
-                    interface_obj=loopback_obj,
-                    description=loopback_description,
-                    account_pop_id=account_pop.id,
-                    address=ip_loop,
-                    batch=batch,
-                )
+        plan = plan_fabric(
+            topology_name=topology_name,
+            topology_index=topology_index,
+            location_shortname=location_shortname,
+            elements=elements,
+            pools=PrefixPools(
+                loopback=str(location_loopback_net_pool[0].prefix.value),
+                loopback_vtep=str(location_loopback_vtep_net_pool[0].prefix.value),
+                management=str(location_mgmt_net_pool[0].prefix.value),
+                technical=str(location_technical_net_pool[0].prefix.value),
+            ),
+            underlay=strategy_underlay,
+            overlay=strategy_overlay,
+            existing_interconnects=interconnects,
+        )
+        pool_prefixes = {
+            str(prefix.prefix.value): prefix
+            for prefix in (
+                location_mgmt_net_pool[0],
+                location_loopback_vtep_net_pool[0],
+                location_loopback_net_pool[0],
+            )
+        }
+        # Nodes already in place are only saved when they differ from the plan
+        cache = await prefetch_topology_nodes(
+            client=client,
+            branch=branch,
+            interface_index=interface_index,
+            addresses=interface_addresses,
+            asn_names=sorted(
+                {f"AS{device.asn}" for device in plan.devices if device.asn is not None}
+            ),
+            bgp_group_names=[bgp_group.name for bgp_group in plan.bgp_groups],
+        )
+        # The cabled interfaces end up with the description and status of their link
+        link_descriptions = {}
+        for link in plan.links:
+            link_descriptions[(link.a_device, link.a_interface)] = link.a_description
+            link_descriptions[(link.b_device, link.b_interface)] = link.b_description
 
-                # Loopback VTEP Interface
-                loopback_vtep_name = INTERFACE_VTEP_NAME[device_type_name]
-                loopback_vtep_description = f"{loopback_vtep_name.lower().replace(' ', '')}.{device_name.lower()}"
-                loopback_vtep_data = prepare_interface_data(
-                    device_obj_id=device_obj.id,
-                    intf_name=loopback_vtep_name,
-                    intf_role=LOOPBACK_ROLE,
-                    intf_status=ACTIVE_STATUS,
-                    description=loopback_vtep_description,
-                    account_pop_id=account_pop.id,
-                    account_ops_id=account_ops.id,
-                    mtu=device_mtu,
-                )
-                loopback_vtep_obj = await upsert_interface(
-                    client=client,
-                    log=log,
-                    branch=branch,
-                    device_name=device_name,
-                    intf_name=loopback_vtep_name,
-                    data=loopback_vtep_data,
-                )
-                ip_loop = f"{str(next(loopback_vtep_address_pool))}/32"
-                await upsert_ip_address(
-                    client=client,
-                    log=log,
-                    branch=branch,
-                    prefix_obj=location_loopback_vtep_net_pool[0],
-                    device_name=device_name,
-                    interface_obj=loopback_vtep_obj,
-                    description=loopback_vtep_description,
-                    account_pop_id=account_pop.id,
-                    address=ip_loop,
-                    batch=batch,
-                )
+        #   -------------------- Devices Generation --------------------
+        #   - Create Devices
+        #   - Create Devices Interfaces
+        #   - Add IP to external facing L3 Interfaces
+        set_phase("devices")
 
-                # Management Interface
-                mgmt_name = INTERFACE_MGMT_NAME[device_type_name]
-                mgmt_description = (
-                    f"{mgmt_name.lower().replace(' ', '')}.{device_name.lower()}"
-                )
-                mgmt_data = prepare_interface_data(
+        asn_objs: Dict[int, InfrahubNode] = {}
+        device_objs: Dict[str, InfrahubNode] = {}
+        topology_members: Dict[str, List[str]] = defaultdict(list)
+        batch = await client.create_batch()
+
+        async def build_asn(asn: int, device_name: str) -> None:
+            asn_name = f"AS{asn}"
+            data_asn = {
+                "name": {
+                    "value": asn_name,
+                    "source": account_crm.id,
+                    "owner": account_pop.id,
+                },
+                "asn": {
+                    "value": asn,
+                    "source": account_crm.id,
+                    "owner": account_pop.id,
+                },
+                "organization": {"id": orga_duff.id},
+                "description": {
+                    "value": f"Private {asn_name} for Duff on device {device_name}"
+                },
+            }
+            asn_objs[asn] = await create_and_save(
+                client=client,
+                log=log,
+                branch=branch,
+                object_name=asn_name,
+                kind_name="InfraAutonomousSystem",
+                data=data_asn,
+                retrieved_on_failure=True,
+                cache=cache,
+            )
+
+        async def build_device(device: PlannedDevice) -> None:
+            device_type = device_types[device.device_type]
+            platform = platforms[device.platform]
+            if device.asn is None:
+                device_asn_id = internal_as.id
+            else:
+                device_asn_id = asn_objs[device.asn].id
+            data_device = {
+                "name": {
+                    "value": device.name,
+                    "source": account_pop.id,
+                    "is_protected": True,
+                },
+                "location": {
+                    "id": location_id,
+                    "source": account_pop.id,
+                    "is_protected": True,
+                },
+                "status": {"value": ACTIVE_STATUS, "owner": account_ops.id},
+                "device_type": {"id": device_type.id, "source": account_pop.id},
+                "role": {
+                    "value": device.role,
+                    "source": account_pop.id,
+                    "is_protected": True,
+                    "owner": account_eng.id,
+                },
+                "asn": {
+                    "id": device_asn_id,
+                    "source": account_pop.id,
+                    "is_protected": True,
+                    "owner": account_eng.id,
+                },
+                "platform": {
+                    "id": platform.id,
+                    "source": account_pop.id,
+                    "is_protected": True,
+                },
+                "topology": {
+                    "id": topology_id,
+                    "source": account_pop.id,
+                    "is_protected": True,
+                },
+            }
+            device_obj = await create_and_save(
+                client=client,
+                log=log,
+                branch=branch,
+                object_name=device.name,
+                kind_name="InfraDevice",
+                data=data_device,
+                retrieved_on_failure=True,
+                cache=cache,
+            )
+            device_objs[device.name] = device_obj
+
+            # Group memberships are saved once per group after all the devices
+            platform_group_name = (
+                f"{platform.name.value.lower().split(' ', 1)[0]}_devices"
+            )
+            topology_members[platform_group_name].append(device_obj.id)
+            topology_members[f"{topology_name}_topology"].append(device_obj.id)
+
+            for interface in device.interfaces:
+                link_description = link_descriptions.get((device.name, interface.name))
+                interface_data = prepare_interface_data(
                     device_obj_id=device_obj.id,
-                    intf_name=mgmt_name,
-                    intf_role=MGMT_ROLE,
-                    intf_status=ACTIVE_STATUS,
-                    description=mgmt_description,
+                    intf_name=interface.name,
+                    intf_role=interface.role,
+                    intf_status=ACTIVE_STATUS if link_description else interface.status,
+                    description=link_description or interface.description,
                     account_pop_id=account_pop.id,
-                    account_ops_id=account_eng.id,
-                    mtu=device_mtu,
+                    account_ops_id=account_eng.id
+                    if interface.role == MGMT_ROLE
+                    else account_ops.id,
+                    l2_mode=interface.l2_mode,
+                    untagged_vlan=vlan_pxe,
+                    tagged_vlans=vlans_server,
+                    mtu=interface.mtu,
                 )
-                mgmt_obj = await upsert_interface(
+                # Interfaces without address are only saved with the batch
+                if not interface.address:
+                    await upsert_interface(
+                        client=client,
+                        log=log,
+                        branch=branch,
+                        device_name=device.name,
+                        intf_name=interface.name,
+                        data=interface_data,
+                        interface_index=interface_index,
+                        batch=batch,
+                        cache=cache,
+                    )
+                    continue
+
+                interface_obj = await upsert_interface(
                     client=client,
                     log=log,
                     branch=branch,
-                    device_name=device_name,
-                    intf_name=mgmt_name,
-                    data=mgmt_data,
+                    device_name=device.name,
+                    intf_name=interface.name,
+                    data=interface_data,
+                    interface_index=interface_index,
+                    cache=cache,
                 )
-                ip_mgmt = f"{str(next(mgmt_address_pool))}/24"
-                ip_mgmt_obj = await upsert_ip_address(
+                ip_obj = await upsert_ip_address(
                     client=client,
                     log=log,
                     branch=branch,
-                    prefix_obj=location_mgmt_net_pool[0],
-                    device_name=device_name,
-                    interface_obj=mgmt_obj,
-                    description=mgmt_description,
+                    prefix_obj=pool_prefixes[interface.address_prefix],
+                    device_name=device.name,
+                    interface_obj=interface_obj,
+                    description=interface.description,
                     account_pop_id=account_pop.id,
-                    address=ip_mgmt,
+                    address=interface.address,
+                    batch=None if interface.role == MGMT_ROLE else batch,
+                    cache=cache,
                 )
 
                 # Set Mgmt IP as Primary IP
-                device_obj.primary_address = ip_mgmt_obj
-                await device_obj.save()
-                client.store.set(key=f"{device_name}", node=device_obj)
-                log.info(f"- Set {ip_mgmt} as {device_name} Primary IP")
+                if (
+                    interface.role == MGMT_ROLE
+                    and device_obj.primary_address.id != ip_obj.id
+                ):
+                    device_obj.primary_address = ip_obj
+                    await device_obj.save()
+                    client.store.set(key=f"{device.name}", node=device_obj)
+                    log.info(f"- Set {interface.address} as {device.name} Primary IP")
+
+        # Devices don't depend on each other, each one is built by its own task.
+        # These batches have their own semaphore, the requests they send
+        # still count against the budget of the scheduler running the topologies.
+        # ASNs are shared by both leafs of a pair so they are created first.
+        asn_devices = {
+            device.asn: device.name for device in plan.devices if device.asn is not None
+        }
+        asn_batch = InfrahubBatch(max_concurrent_execution=device_concurrency)
+        for asn, device_name in asn_devices.items():
+            asn_batch.add(task=build_asn, asn=asn, device_name=device_name)
+        async for _ in asn_batch.execute():
+            pass
 
-                if device_role_name.lower() not in ["spine", "leaf"]:
-                    continue
+        device_batch = InfrahubBatch(max_concurrent_execution=device_concurrency)
+        for device in plan.devices:
+            device_batch.add(task=build_device, device=device)
+        async for _ in device_batch.execute():
+            pass
 
-                for intf_idx, intf_name in enumerate(
-                    DEVICES_INTERFACES[device_type_name]
-                ):
-                    intf_role = INTERFACE_ROLES_MAPPING[device_role_name.lower()][
-                        intf_idx
-                    ]
-                    interface_description = (
-                        f"{intf_name.lower().replace(' ', '')}.{device_name.lower()}"
-                    )
+        # When group_members is provided, the caller saves the groups once for all topologies
+        if group_members is None:
+            await add_group_members(
+                client=client, log=log, branch=branch, group_members=topology_members
+            )
+        else:
+            for group_name, member_ids in topology_members.items():
+                group_members[group_name].extend(member_ids)
 
-                    # L3 Interfaces
-                    if intf_role in L3_ROLE_MAPPING:
-                        interface_data = prepare_interface_data(
-                            device_obj_id=device_obj.id,
-                            intf_name=intf_name,
-                            intf_role=intf_role,
-                            intf_status=PROVISIONING_STATUS,
-                            description=interface_description,
-                            account_pop_id=account_pop.id,
-                            account_ops_id=account_ops.id,
-                            mtu=device_mtu,
-                        )
-                    # L2 Interfaces
-                    elif intf_role in L2_ROLE_MAPPING:
-                        interface_data = prepare_interface_data(
-                            device_obj_id=device_obj.id,
-                            intf_name=intf_name,
-                            intf_role=intf_role,
-                            intf_status=PROVISIONING_STATUS,
-                            description=interface_description,
-                            account_pop_id=account_pop.id,
-                            account_ops_id=account_ops.id,
-                            l2_mode="Access",
-                            untagged_vlan=vlan_pxe,
-                            tagged_vlans=vlans_server,
-                            mtu=device_mtu,
-                        )
-                    interface_obj = await upsert_interface(
-                        client=client,
-                        log=log,
-                        branch=branch,
-                        device_name=device_name,
-                        intf_name=intf_name,
-                        data=interface_data,
-                        batch=batch,
-                    )
         async for node, _ in batch.execute():
+            if node.get_kind() in INTERFACE_KINDS:
+                interface_index.add(node)
             if node._schema.default_filter:
                 accessor = f"{node._schema.default_filter.split('__')[0]}"
                 log.info(
@@ -757,623 +896,228 @@ async def generate_topology(
                 log.info(f"- Created {node}")
 
         #   -------------------- Connect Spines & Leafs --------------------
-        #   - Cabling Spines to Leaf, Leaf to Leaf, Spine to Spine
+        #   - Cabling Spines to Leaf, Borderleaf to Spines, Leaf to Leaf
         #   - Add ico IP to Spines <-> Leafs
-        spine_quantity = 0
-        leaf_quantity = 0
-        border_leaf_quantity = 0
-        # spines <-> leaf interfaces
-        spine_leaf_interfaces = {}
-        leaf_uplink_interfaces = {}
-        border_leaf_uplink_interfaces = {}
-        # leaf <-> leaf interfaces
-        leaf_peer_interfaces = {}
-        border_leaf_peer_interfaces = {}
-        # spines <-> borderleaf interfaces
-        spine_uplink_interfaces = {}
-
+        set_phase("cabling")
+        for error in plan.errors:
+            log.error(error)
+
+        backbone_vrf_obj_id = location.backbone_vrf.id
+        device_ids = {name: device_obj.id for name, device_obj in device_objs.items()}
+        connected_interfaces: Dict[str, InfrahubNode] = {}
+
+        # The interconnect prefixes and addresses already present are kept as is,
+        # the missing ones are all created with a single batch
+        link_prefixes = [link.prefix for link in plan.links if link.prefix]
+        existing_prefixes: Dict[str, InfrahubNode] = {}
+        link_addresses: Dict[str, InfrahubNode] = {}
+        if link_prefixes:
+            if prefix_index is not None:
+                # Only retrieve the interconnect prefixes known to exist
+                link_prefixes = [
+                    prefix
+                    for prefix in link_prefixes
+                    if prefix_index.has(
+                        key=(backbone_vrf_obj_id, prefix), kind="InfraPrefix"
+                    )
+                ]
+            prefixes = []
+            if link_prefixes:
+                prefixes = await client.filters(
+                    kind="InfraPrefix",
+                    prefix__values=link_prefixes,
+                    vrf__ids=[backbone_vrf_obj_id],
+                    branch=branch,
+                    parallel=True,
+                )
+            existing_prefixes = {
+                str(prefix.prefix.value): prefix for prefix in prefixes
+            }
+            addresses = await client.filters(
+                kind="InfraIPAddress",
+                address__values=[
+                    address
+                    for link in plan.links
+                    if link.prefix
+                    for address in (link.a_address, link.b_address)
+                ],
+                branch=branch,
+                parallel=True,
+            )
+            link_addresses = {
+                str(address.address.value): address for address in addresses
+            }
+        reused_ids: List[str] = []
+        # Addresses of the links cabled by this run, the BGP sessions use them
+        cabled_addresses: Set[str] = set()
+        allocation_batch = await client.create_batch()
         batch = await client.create_batch()
-        for topology_element in topology_elements:
-            if not topology_element.device_type:
-                log.info(f"No device_type for {topology_element.name.value} - Ignored")
-                continue
-            device_type = await client.get(
-                id=topology_element.device_type.id,
-                kind="InfraDeviceType",
-                populate_store=True,
+        for link in plan.links:
+            # Both ends were created (or retrieved) above, resolve them locally
+            intf_a_obj = interface_index.get(
+                device_id=device_ids.get(link.a_device),
+                name=link.a_interface,
+                kind=link.kind,
             )
-            device_role_name = topology_element.device_role.value
-            device_type_name = device_type.name.value
-            is_border: bool = topology_element.border.value
-
-            if device_role_name == "spine":
-                spine_quantity = topology_element.quantity.value
-                spine_leaf_interfaces = get_interface_names(
-                    device_type=device_type_name,
-                    device_role="spine",
-                    interface_role="leaf",
-                )
-                spine_uplink_interfaces = get_interface_names(
-                    device_type=device_type_name,
-                    device_role="spine",
-                    interface_role="uplink",
-                )
-            elif device_role_name == "leaf":
-                if is_border:
-                    border_leaf_quantity = topology_element.quantity.value
-                    border_leaf_uplink_interfaces = get_interface_names(
-                        device_type=device_type_name,
-                        device_role="leaf",
-                        interface_role="uplink",
-                    )
-                    border_leaf_peer_interfaces = get_interface_names(
-                        device_type=device_type_name,
-                        device_role="leaf",
-                        interface_role="peer",
-                    )
-                else:
-                    leaf_quantity = topology_element.quantity.value
-                    leaf_uplink_interfaces = get_interface_names(
-                        device_type=device_type_name,
-                        device_role="leaf",
-                        interface_role="uplink",
-                    )
-                    leaf_peer_interfaces = get_interface_names(
-                        device_type=device_type_name,
-                        device_role="leaf",
-                        interface_role="peer",
-                    )
-
-        #   ---  Cabling Logic  ---
-        #   odd number lf1 uplink port <-> sp1 odd number leaf port
-        #   even number lf1 uplink port <-> sp2 odd number leaf port
-        #   odd number lf2 uplink port <-> sp1 even number leaf port
-        #   even number lf2 uplink port <-> sp2 even number leaf port
-        #   odd number lf1 peer port <-> lf2 odd number peer port
-        #   even number lf1 peer port <-> lf2 even number peer port
-
-        # Cabling Spines <-> Leaf
-        if not spine_leaf_interfaces or not leaf_uplink_interfaces:
-            log.error(
-                "No 'uplink' interfaces found on leaf or no 'leaf' interfaces on spines"
+            intf_b_obj = interface_index.get(
+                device_id=device_ids.get(link.b_device),
+                name=link.b_interface,
+                kind=link.kind,
             )
-            return None
-
-        interconnection_subnets = IPv4Network(
-            next(iter(location_technical_net_pool)).prefix.value
-        ).subnets(new_prefix=31)
-
-        # Cabling Leaf
-        backbone_vrf_obj_id = client.store.get(key="Backbone", kind="InfraVRF").id
-        for leaf_idx in range(1, leaf_quantity + 1):
-            if leaf_idx > len(spine_leaf_interfaces):
+            if intf_a_obj is None or intf_b_obj is None:
                 log.error(
-                    f"The quantity of leaf requested ({leaf_quantity}) is superior to the number of interfaces flagged as 'leaf' ({len(spine_leaf_interfaces)})"
-                )
-                break
-            # Calculate the good interfaces based on the Cabling Logic above
-            leaf_pair_num = (leaf_idx + 1) // 2
-            if leaf_pair_num == 1:
-                if len(spine_leaf_interfaces) < 2:
-                    continue
-                spine_port = (
-                    spine_leaf_interfaces[0]
-                    if leaf_idx % 2 != 0
-                    else spine_leaf_interfaces[1]
-                )
-            else:
-                offset = (leaf_pair_num - 1) * 2
-                if len(spine_leaf_interfaces) < offset + 1:
-                    continue
-                spine_port = (
-                    spine_leaf_interfaces[offset]
-                    if leaf_idx % 2 != 0
-                    else spine_leaf_interfaces[offset + 1]
-                )
-
-            for spine_idx in range(1, spine_quantity + 1):
-                if spine_idx > len(leaf_uplink_interfaces):
-                    log.error(
-                        f"The quantity of spines requested ({spine_quantity}) is superior to the number of interfaces flagged as 'uplink' ({len(leaf_uplink_interfaces)})"
-                    )
-                    break
-
-                spine_pair_num = (spine_idx + 1) // 2
-                if spine_pair_num == 1:
-                    if len(leaf_uplink_interfaces) < 2:
-                        continue
-                    uplink_port = (
-                        leaf_uplink_interfaces[0]
-                        if spine_idx % 2 != 0
-                        else leaf_uplink_interfaces[1]
-                    )
-                else:
-                    offset = (spine_pair_num - 1) * 2
-                    if len(leaf_uplink_interfaces) < offset + 1:
-                        continue
-                    if spine_idx % 2 != 0:
-                        uplink_port = leaf_uplink_interfaces[offset]
-                    else:
-                        uplink_port = leaf_uplink_interfaces[offset + 1]
-
-                # Retrieve interfaces from infrahub (as we create them above) #{topology_name}-{device_role_name}
-                intf_spine_obj = await client.get(
-                    kind="InfraInterfaceL3",
-                    name__value=spine_port,
-                    device__name__value=f"{topology_name}-spine{spine_idx}",
-                )
-                intf_leaf_obj = await client.get(
-                    kind="InfraInterfaceL3",
-                    name__value=uplink_port,
-                    device__name__value=f"{topology_name}-leaf{leaf_idx}",
-                )
-                # store.get(kind="InfraInterfaceL3", key=f"{topology_name}-leaf{leaf_idx}-{uplink_port}")
-
-                new_spine_intf_description = (
-                    intf_spine_obj.description.value
-                    + f" to {intf_leaf_obj.description.value}"
-                )
-                spine_ico_ip_description = intf_spine_obj.description.value
-                new_leaf_intf_description = (
-                    intf_leaf_obj.description.value
-                    + f" to {intf_spine_obj.description.value}"
-                )
-                leaf_ico_ip_description = intf_leaf_obj.description.value
-
-                interconnection_subnet = next(interconnection_subnets)
-                interconnection_ips = list(interconnection_subnet.hosts())
-                spine_ip = f"{str(interconnection_ips[0])}/31"
-                leaf_ip = f"{str(interconnection_ips[1])}/31"
-                prefix_description = f"{location_shortname.lower()}-ico-{IPv4Network(interconnection_subnet).network_address}"
-                data = {
-                    "prefix": {"value": IPv4Network(interconnection_subnet)},
-                    "description": {"value": prefix_description},
-                    "organization": {"id": orga_duff.id},
-                    "location": {"id": location_id},
-                    "status": {"value": "active"},
-                    "role": {"value": "technical"},
-                    "vrf": {"id": backbone_vrf_obj_id},
-                }
-                prefix_obj = await create_and_save(
-                    client=client,
-                    log=log,
-                    branch=branch,
-                    object_name=str(interconnection_subnet),
-                    kind_name="InfraPrefix",
-                    data=data,
-                )
-
-                spine_ip_obj = await upsert_ip_address(
-                    client=client,
-                    log=log,
-                    branch=branch,
-                    prefix_obj=prefix_obj,
-                    device_name=f"{topology_name}-spine{spine_idx}",
-                    interface_obj=intf_spine_obj,
-                    description=spine_ico_ip_description,
-                    account_pop_id=account_pop.id,
-                    address=spine_ip,
+                    f"- Unable to connect {link.a_device}-{link.a_interface} to {link.b_device}-{link.b_interface}"
                 )
-                leaf_ip_obj = await upsert_ip_address(
-                    client=client,
-                    log=log,
-                    branch=branch,
-                    prefix_obj=prefix_obj,
-                    device_name=f"{topology_name}-leaf{leaf_idx}",
-                    interface_obj=intf_leaf_obj,
-                    description=leaf_ico_ip_description,
-                    account_pop_id=account_pop.id,
-                    address=leaf_ip,
-                )
-
-                # Delete the other interface.connected_endpoint
-                # FIXME if we want to redo the cabling - may need to cleanup the other end first
-
-                # Update Spine interface (description, endpoints, status)
-                intf_spine_obj.description.value = new_spine_intf_description
-                intf_spine_obj.status.value = ACTIVE_STATUS
-                intf_spine_obj.connected_endpoint = intf_leaf_obj
-                await intf_spine_obj.save(allow_upsert=True)
-
-                # Delete the other interface.connected_endpoint
-                # FIXME if we want to redo the cabling - may need to cleanup the other end first
-
-                # Update Leaf interface (description, endpoints, status)
-                intf_leaf_obj.description.value = new_leaf_intf_description
-                intf_leaf_obj.status.value = ACTIVE_STATUS
-                intf_leaf_obj.connected_endpoint = intf_spine_obj
-                await intf_leaf_obj.save(allow_upsert=True)
-                log.info(
-                    f"- Connected {topology_name}-leaf{leaf_idx}-{uplink_port} to {topology_name}-spine{spine_idx}-{spine_port}"
-                )
-
-                # If Topology underlay is BGP, add BGP Sessions Spines <-> Leaf
-                if strategy_underlay == "ebgp":
-                    spine_obj = await client.get(
-                        kind="InfraDevice",
-                        name__value=f"{topology_name}-spine{spine_idx}",
-                    )
-                    leaf_obj = await client.get(
-                        kind="InfraDevice",
-                        name__value=f"{topology_name}-leaf{leaf_idx}",
-                    )
-                    spine_asn_obj = spine_obj.asn.peer
-                    leaf_asn_obj = leaf_obj.asn.peer
-                    leaf_pair = (leaf_idx + 1) // 2
-                    spine_bgp_group_name = (
-                        f"{topology_name}-underlay-spine-leaf-pair{leaf_pair}"
-                    )
-                    leaf_bgp_group_name = (
-                        f"{topology_name}-underlay-leaf-pair{leaf_pair}-spine"
-                    )
-                    data_spine_bgp_group = {
-                        "name": {"value": spine_bgp_group_name},
-                        "local_as": {"id": spine_asn_obj.id},
-                        "remote_as": {"id": leaf_asn_obj.id},
-                        "description": {
-                            "value": f"BGP group for {topology_name} underlay"
-                        },
-                    }
-                    spine_bgp_group_obj = await create_and_save(
-                        client=client,
-                        log=log,
-                        branch=branch,
-                        object_name=f"bgpgroup-underlay-{spine_obj.name.value}-{leaf_obj.name.value}",
-                        kind_name="InfraBGPPeerGroup",
-                        data=data_spine_bgp_group,
-                    )
-                    data_leaf_bgp_group = {
-                        "name": {"value": leaf_bgp_group_name},
-                        "remote_as": {"id": spine_asn_obj.id},
-                        "local_as": {"id": leaf_asn_obj.id},
-                        "description": {
-                            "value": f"BGP group for {topology_name} underlay"
-                        },
-                    }
-                    leaf_bgp_group_obj = await create_and_save(
-                        client=client,
-                        log=log,
-                        branch=branch,
-                        object_name=f"bgpgroup-underlay-{leaf_obj.name.value}-{spine_obj.name.value}",
-                        kind_name="InfraBGPPeerGroup",
-                        data=data_leaf_bgp_group,
-                    )
-                    data_spine_session = {
-                        "local_as": {"id": spine_asn_obj.id},
-                        "remote_as": {"id": leaf_asn_obj.id},
-                        "local_ip": {"id": spine_ip_obj.id},
-                        "remote_ip": {"id": leaf_ip_obj.id},
-                        "type": {"value": "EXTERNAL"},
-                        "status": {"value": ACTIVE_STATUS},
-                        "role": {"value": "backbone"},
-                        "device": {"id": spine_obj.id},
-                        "peer_group": {"id": spine_bgp_group_obj.id},
-                        "description": {
-                            "value": remove_interface_prefixes(
-                                new_spine_intf_description
-                            )
-                        },
-                    }
-                    spine_session_obj = await create_and_save(
-                        client=client,
-                        log=log,
-                        branch=branch,
-                        object_name=f"spine-{str(interconnection_subnet)}",
-                        kind_name="InfraBGPSession",
-                        data=data_spine_session,
-                    )
-                    data_leaf_session = {
-                        "remote_as": {"id": spine_asn_obj.id},
-                        "local_as": {"id": leaf_asn_obj.id},
-                        "remote_ip": {"id": spine_ip_obj.id},
-                        "local_ip": {"id": leaf_ip_obj.id},
-                        "type": {"value": "EXTERNAL"},
-                        "status": {"value": ACTIVE_STATUS},
-                        "role": {"value": "backbone"},
-                        "device": {"id": leaf_obj.id},
-                        "peer_session": {"id": spine_session_obj.id},
-                        "peer_group": {"id": leaf_bgp_group_obj.id},
-                        "description": {
-                            "value": remove_interface_prefixes(
-                                new_leaf_intf_description
-                            )
-                        },
-                    }
-                    leaf_session_obj = await create_and_add_to_batch(
-                        client=client,
-                        log=log,
-                        branch=branch,
-                        object_name=f"leaf-{str(interconnection_subnet)}",
-                        kind_name="InfraBGPSession",
-                        data=data_leaf_session,
-                        batch=batch,
-                    )
+                continue
 
-        # Cabling BorderLeaf
-        if border_leaf_quantity > 0:
-            for leaf_idx in range(1, border_leaf_quantity + 1):
-                if leaf_idx > len(spine_uplink_interfaces):
-                    log.error(
-                        f"The quantity of borderleaf requested ({border_leaf_quantity}) is superior to the number of interfaces flagged as 'uplink' ({len(spine_uplink_interfaces)})"
-                    )
-                    break
-                # Calculate the good interfaces based on the Cabling Logic above
-                leaf_pair_num = (leaf_idx + 1) // 2
-                if leaf_pair_num == 1:
-                    if len(spine_uplink_interfaces) < 2:
-                        continue
-                    spine_port = (
-                        spine_uplink_interfaces[0]
-                        if leaf_idx % 2 != 0
-                        else spine_uplink_interfaces[1]
-                    )
+            if link.prefix:
+                prefix_obj = existing_prefixes.get(link.prefix)
+                if prefix_obj is not None:
+                    reused_ids.append(prefix_obj.id)
                 else:
-                    offset = (leaf_pair_num - 1) * 2
-                    if len(spine_uplink_interfaces) < offset + 1:
-                        continue
-                    spine_port = (
-                        spine_uplink_interfaces[offset]
-                        if leaf_idx % 2 != 0
-                        else spine_uplink_interfaces[offset + 1]
-                    )
-
-                for spine_idx in range(1, spine_quantity + 1):
-                    if spine_idx > len(border_leaf_uplink_interfaces):
-                        log.error(
-                            f"The quantity of spines requested ({spine_quantity}) is superior to the number of interfaces flagged as 'uplink' ({len(border_leaf_uplink_interfaces)})"
-                        )
-                        break
-
-                    spine_pair_num = (spine_idx + 1) // 2
-                    if spine_pair_num == 1:
-                        if len(border_leaf_uplink_interfaces) < 2:
-                            continue
-                        leaf_port = (
-                            border_leaf_uplink_interfaces[0]
-                            if spine_idx % 2 != 0
-                            else border_leaf_uplink_interfaces[1]
-                        )
-                    else:
-                        offset = (spine_pair_num - 1) * 2
-                        if len(border_leaf_uplink_interfaces) < offset + 1:
-                            continue
-                        if spine_idx % 2 != 0:
-                            leaf_port = border_leaf_uplink_interfaces[offset]
-                        else:
-                            leaf_port = border_leaf_uplink_interfaces[offset + 1]
-
-                    # Retrieve interfaces from infrahub (as we create them above) #{topology_name}-{device_role_name}
-                    intf_spine_obj = await client.get(
-                        kind="InfraInterfaceL3",
-                        name__value=spine_port,
-                        device__name__value=f"{topology_name}-spine{spine_idx}",
-                    )
-                    intf_leaf_obj = await client.get(
-                        kind="InfraInterfaceL3",
-                        name__value=leaf_port,
-                        device__name__value=f"{topology_name}-borderleaf{leaf_idx}",
-                    )
-                    # store.get(kind="InfraInterfaceL3", key=f"{topology_name}-borderleaf{leaf_idx}-{leaf_port}")
-
-                    new_spine_intf_description = (
-                        intf_spine_obj.description.value
-                        + f" to {intf_leaf_obj.description.value}"
-                    )
-                    spine_ico_ip_description = intf_spine_obj.description.value
-                    new_leaf_intf_description = (
-                        intf_leaf_obj.description.value
-                        + f" to {intf_spine_obj.description.value}"
-                    )
-                    leaf_ico_ip_description = intf_leaf_obj.description.value
-
-                    interconnection_subnet = next(interconnection_subnets)
-                    interconnection_ips = list(interconnection_subnet.hosts())
-                    spine_ip = f"{str(interconnection_ips[0])}/31"
-                    leaf_ip = f"{str(interconnection_ips[1])}/31"
-                    prefix_description = f"{location_shortname.lower()}-ico-{IPv4Network(interconnection_subnet).network_address}"
                     data = {
-                        "prefix": {"value": IPv4Network(interconnection_subnet)},
-                        "description": {"value": prefix_description},
+                        "prefix": {"value": link.prefix},
+                        "description": {"value": link.prefix_description},
                         "organization": {"id": orga_duff.id},
                         "location": {"id": location_id},
                         "status": {"value": "active"},
                         "role": {"value": "technical"},
                         "vrf": {"id": backbone_vrf_obj_id},
                     }
-                    prefix_obj = await create_and_save(
+                    prefix_obj = await create_and_add_to_batch(
                         client=client,
                         log=log,
                         branch=branch,
-                        object_name=str(interconnection_subnet),
+                        object_name=link.prefix,
                         kind_name="InfraPrefix",
                         data=data,
+                        batch=allocation_batch,
                     )
-
-                    spine_ip_obj = await upsert_ip_address(
-                        client=client,
-                        log=log,
-                        branch=branch,
-                        prefix_obj=prefix_obj,
-                        device_name=f"{topology_name}-spine{spine_idx}",
-                        interface_obj=intf_spine_obj,
-                        description=spine_ico_ip_description,
-                        account_pop_id=account_pop.id,
-                        address=spine_ip,
-                    )
-                    leaf_ip_obj = await upsert_ip_address(
+                for device_name, interface_obj, address in (
+                    (link.a_device, intf_a_obj, link.a_address),
+                    (link.b_device, intf_b_obj, link.b_address),
+                ):
+                    ip_obj = link_addresses.get(address)
+                    if ip_obj is not None and ip_obj.interface.id == interface_obj.id:
+                        reused_ids.append(ip_obj.id)
+                        continue
+                    link_addresses[address] = await upsert_ip_address(
                         client=client,
                         log=log,
                         branch=branch,
                         prefix_obj=prefix_obj,
-                        device_name=f"{topology_name}-borderleaf{leaf_idx}",
-                        interface_obj=intf_leaf_obj,
-                        description=leaf_ico_ip_description,
+                        device_name=device_name,
+                        interface_obj=interface_obj,
+                        description=interface_obj.description.value,
                         account_pop_id=account_pop.id,
-                        address=leaf_ip,
-                    )
-
-                    # Delete the other interface.connected_endpoint
-                    # FIXME if we want to redo the cabling - may need to cleanup the other end first
-
-                    # Update Spine interface (description, endpoints, status)
-                    intf_spine_obj.description.value = new_spine_intf_description
-                    intf_spine_obj.status.value = ACTIVE_STATUS
-                    intf_spine_obj.connected_endpoint = intf_leaf_obj
-                    await intf_spine_obj.save(allow_upsert=True)
-
-                    # Delete the other interface.connected_endpoint
-                    # FIXME if we want to redo the cabling - may need to cleanup the other end first
-
-                    # Update Leaf interface (description, endpoints, status)
-                    intf_leaf_obj.description.value = new_leaf_intf_description
-                    intf_leaf_obj.status.value = ACTIVE_STATUS
-                    intf_leaf_obj.connected_endpoint = intf_spine_obj
-                    await intf_leaf_obj.save(allow_upsert=True)
-                    log.info(
-                        f"- Connected {topology_name}-leaf{leaf_idx}-{uplink_port} to {topology_name}-spine{spine_idx}-{spine_port}"
+                        address=address,
+                        batch=allocation_batch,
                     )
+                cabled_addresses.update((link.a_address, link.b_address))
+
+            # FIXME if we want to redo the cabling - may need to cleanup the other end first
+            # Update both interfaces (description, endpoints, status), saved with the
+            # batch unless they are already connected as planned
+            for interface_obj, peer_obj, description in (
+                (intf_a_obj, intf_b_obj, link.a_description),
+                (intf_b_obj, intf_a_obj, link.b_description),
+            ):
+                if (
+                    interface_obj.connected_endpoint.id == peer_obj.id
+                    and interface_obj.description.value == description
+                    and interface_obj.status.value == ACTIVE_STATUS
+                ):
+                    continue
+                interface_obj.description.value = description
+                interface_obj.status.value = ACTIVE_STATUS
+                interface_obj.connected_endpoint = peer_obj
+                connected_interfaces[interface_obj.id] = interface_obj
+            log.info(
+                f"- Connected {link.b_device}-{link.b_interface} to {link.a_device}-{link.a_interface}"
+            )
 
-                    # If Topology underlay is BGP, add BGP Sessions Spines <-> Leaf
-                    if strategy_underlay == "ebgp":
-                        spine_obj = await client.get(
-                            kind="InfraDevice",
-                            name__value=f"{topology_name}-spine{spine_idx}",
-                        )
-                        leaf_obj = await client.get(
-                            kind="InfraDevice",
-                            name__value=f"{topology_name}-borderleaf{leaf_idx}",
-                        )
-                        spine_asn_obj = spine_obj.asn.peer
-                        leaf_asn_obj = leaf_obj.asn.peer
-                        leaf_pair = (leaf_idx + 1) // 2
-                        spine_bgp_group_name = (
-                            f"{topology_name}-underlay-spine-borderleaf-pair{leaf_pair}"
-                        )
-                        leaf_bgp_group_name = (
-                            f"{topology_name}-underlay-borderleaf-pair{leaf_pair}-spine"
-                        )
-                        data_spine_bgp_group = {
-                            "name": {"value": spine_bgp_group_name},
-                            "local_as": {"id": spine_asn_obj.id},
-                            "remote_as": {"id": leaf_asn_obj.id},
-                            "description": {
-                                "value": f"BGP group for {topology_name} underlay"
-                            },
-                        }
-                        spine_bgp_group_obj = await create_and_save(
-                            client=client,
-                            log=log,
-                            branch=branch,
-                            object_name=f"bgpgroup-underlay-{spine_obj.name.value}-{leaf_obj.name.value}",
-                            kind_name="InfraBGPPeerGroup",
-                            data=data_spine_bgp_group,
-                        )
-                        data_leaf_bgp_group = {
-                            "name": {"value": leaf_bgp_group_name},
-                            "remote_as": {"id": spine_asn_obj.id},
-                            "local_as": {"id": leaf_asn_obj.id},
-                            "description": {
-                                "value": f"BGP group for {topology_name} underlay"
-                            },
-                        }
-                        leaf_bgp_group_obj = await create_and_save(
-                            client=client,
-                            log=log,
-                            branch=branch,
-                            object_name=f"bgpgroup-underlay-{leaf_obj.name.value}-{spine_obj.name.value}",
-                            kind_name="InfraBGPPeerGroup",
-                            data=data_leaf_bgp_group,
-                        )
-                        data_spine_session = {
-                            "local_as": {"id": spine_asn_obj.id},
-                            "remote_as": {"id": leaf_asn_obj.id},
-                            "local_ip": {"id": spine_ip_obj.id},
-                            "remote_ip": {"id": leaf_ip_obj.id},
-                            "type": {"value": "EXTERNAL"},
-                            "status": {"value": ACTIVE_STATUS},
-                            "role": {"value": "backbone"},
-                            "device": {"id": spine_obj.id},
-                            "peer_group": {"id": spine_bgp_group_obj.id},
-                            "description": {
-                                "value": remove_interface_prefixes(
-                                    new_spine_intf_description
-                                )
-                            },
-                        }
-                        spine_session_obj = await create_and_save(
-                            client=client,
-                            log=log,
-                            branch=branch,
-                            object_name=f"spine-{str(interconnection_subnet)}",
-                            kind_name="InfraBGPSession",
-                            data=data_spine_session,
-                        )
-                        data_leaf_session = {
-                            "remote_as": {"id": spine_asn_obj.id},
-                            "local_as": {"id": leaf_asn_obj.id},
-                            "remote_ip": {"id": spine_ip_obj.id},
-                            "local_ip": {"id": leaf_ip_obj.id},
-                            "type": {"value": "EXTERNAL"},
-                            "status": {"value": ACTIVE_STATUS},
-                            "role": {"value": "backbone"},
-                            "device": {"id": leaf_obj.id},
-                            "peer_session": {"id": spine_session_obj.id},
-                            "peer_group": {"id": leaf_bgp_group_obj.id},
-                            "description": {
-                                "value": remove_interface_prefixes(
-                                    new_leaf_intf_description
-                                )
-                            },
-                        }
-                        leaf_session_obj = await create_and_save(
-                            client=client,
-                            log=log,
-                            branch=branch,
-                            object_name=f"borderleaf-{str(interconnection_subnet)}",
-                            kind_name="InfraBGPSession",
-                            data=data_leaf_session,
-                            batch=batch,
-                        )
-
-        # Cabling Leaf <-> Leaf
-        if not leaf_peer_interfaces:
-            log.error("No 'peer' interfaces found on Leaf")
-            return None
-
-        if leaf_quantity % 2 != 0:
-            log.error("The number of leaf must be even to form pairs")
-            return None
-
-        for leaf_idx in range(1, leaf_quantity + 1, 2):
-            leaf1_name = f"{topology_name}-leaf{leaf_idx}"
-            leaf2_name = f"{topology_name}-leaf{leaf_idx + 1}"
-            for leaf_peer_interface in leaf_peer_interfaces:
-                intf_leaf1_obj = client.store.get(
-                    kind="InfraInterfaceL2", key=f"{leaf1_name}-{leaf_peer_interface}"
-                )
-                intf_leaf2_obj = client.store.get(
-                    kind="InfraInterfaceL2", key=f"{leaf2_name}-{leaf_peer_interface}"
-                )
-
-                new_leaf1_intf_description = (
-                    intf_leaf1_obj.description.value
-                    + f" to {intf_leaf2_obj.description.value}"
+        async for node, _ in allocation_batch.execute():
+            log.info(f"- Created {node._schema.kind} - {node}")
+        # Nodes left untouched still belong to what this generator produced
+        await client.group_context.add_related_nodes(ids=reused_ids)
+
+        for interface in connected_interfaces.values():
+            batch.add(task=interface.save, allow_upsert=True, node=interface)
+
+        # If Topology underlay is BGP, add BGP Sessions Spines <-> Leaf
+        set_phase("bgp")
+        bgp_group_objs: Dict[str, InfrahubNode] = {}
+        for bgp_group in plan.bgp_groups:
+            data_bgp_group = {
+                "name": {"value": bgp_group.name},
+                "local_as": {"id": asn_objs[bgp_group.local_asn].id},
+                "remote_as": {"id": asn_objs[bgp_group.remote_asn].id},
+                "description": {"value": bgp_group.description},
+            }
+            bgp_group_objs[bgp_group.name] = await create_and_save(
+                client=client,
+                log=log,
+                branch=branch,
+                object_name=bgp_group.name,
+                kind_name="InfraBGPPeerGroup",
+                data=data_bgp_group,
+                cache=cache,
+            )
+        bgp_session_objs: Dict[str, InfrahubNode] = {}
+        for bgp_session in plan.bgp_sessions:
+            if (
+                not {
+                    bgp_session.local_address,
+                    bgp_session.remote_address,
+                }
+                <= cabled_addresses
+            ):
+                log.warning(
+                    f"- Skipped the BGP session {bgp_session.name}, its link is not cabled"
                 )
-                new_leaf2_intf_description = (
-                    intf_leaf2_obj.description.value
-                    + f" to {intf_leaf1_obj.description.value}"
+                continue
+            device_obj = device_objs[bgp_session.device]
+            # Sessions have no name, they are identified by their device and remote address
+            session_key = bgp_session_key(
+                device_name=bgp_session.device,
+                remote_address=bgp_session.remote_address,
+            )
+            data_session = {
+                "local_as": {"id": asn_objs[bgp_session.local_asn].id},
+                "remote_as": {"id": asn_objs[bgp_session.remote_asn].id},
+                "local_ip": {"id": link_addresses[bgp_session.local_address].id},
+                "remote_ip": {"id": link_addresses[bgp_session.remote_address].id},
+                "type": {"value": "EXTERNAL"},
+                "status": {"value": ACTIVE_STATUS},
+                "role": {"value": "backbone"},
+                "device": {"id": device_obj.id},
+                "peer_group": {"id": bgp_group_objs[bgp_session.peer_group].id},
+                "description": {"value": bgp_session.description},
+            }
+            if not bgp_session.peer_session:
+                bgp_session_objs[bgp_session.name] = await create_and_save(
+                    client=client,
+                    log=log,
+                    branch=branch,
+                    object_name=session_key,
+                    kind_name="InfraBGPSession",
+                    data=data_session,
+                    cache=cache,
                 )
-
-                # Update Leaf1 interface (description, endpoints, status)
-                intf_leaf1_obj.description.value = new_leaf1_intf_description
-                intf_leaf1_obj.status.value = ACTIVE_STATUS
-                intf_leaf1_obj.connected_endpoint = intf_leaf2_obj
-                await intf_leaf1_obj.save()
-                # Update Leaf2 interface (description, endpoints, status)
-                intf_leaf2_obj.description.value = new_leaf2_intf_description
-                intf_leaf2_obj.status.value = ACTIVE_STATUS
-                intf_leaf2_obj.connected_endpoint = intf_leaf1_obj
-                await intf_leaf2_obj.save()
+                continue
+            data_session["peer_session"] = {
+                "id": bgp_session_objs[bgp_session.peer_session].id
+            }
+            await create_and_add_to_batch(
+                client=client,
+                log=log,
+                branch=branch,
+                object_name=session_key,
+                kind_name="InfraBGPSession",
+                data=data_session,
+                batch=batch,
+                cache=cache,
+            )
 
         async for node, _ in batch.execute():
             if node._schema.default_filter:
@@ -1383,6 +1127,8 @@ async def generate_topology(
                 )
             else:
                 log.info(f"- Created {node}")
+        await client.group_context.add_related_nodes(ids=cache.unchanged_ids)
+        cache.log_summary(log=log)
 
         #   -------------------- Overlay Spines & Leafs --------------------
         #   - eBGP Sessions within the Site (Spines <-> Spines, Spines <-> Leaf)
@@ -1393,20 +1139,28 @@ async def generate_topology(
             pass
 
         #   -------------------- Forcing the Generation of the Artifact --------------------
-        artifact_definitions = await client.filters(kind="CoreArtifactDefinition")
-        for artifact_definition in artifact_definitions:
-            await artifact_definition.generate()
+        set_phase("artifacts")
+        # Only the devices and the topology built here are regenerated, including the
+        # devices already written when the plan is incomplete. When artifact_targets and
+        # topology_ids are provided, the caller regenerates them once for all topologies.
+        targets = defaultdict(set) if artifact_targets is None else artifact_targets
+        for group_name, member_ids in topology_members.items():
+            targets[group_name].update(member_ids)
+        if artifact_targets is None:
+            await regenerate_artifacts(
+                client=client,
+                log=log,
+                branch=branch,
+                artifact_targets=targets,
+                topology_ids={topology_id},
+            )
+        elif topology_ids is not None:
+            topology_ids.add(topology_id)
 
-        return location_shortname
+        return location_shortname if plan.complete else None
 
 
-# ---------------------------------------------------------------
-# Use the `infrahubctl run` command line to execute this script
-#
-#   infrahubctl run models/infrastructure_edge.py
-#
-# ---------------------------------------------------------------
-async def run(
+async def generate_topologies(
     client: InfrahubClient, log: logging.Logger, branch: str, **kwargs
 ) -> None:
     # ------------------------------------------
@@ -1414,59 +1168,39 @@ async def run(
     # ------------------------------------------
     log.info("Retrieving objects from Infrahub")
     try:
-        # CoreAccount
-        accounts = await client.all("CoreAccount")
-        populate_local_store(objects=accounts, key_type="name", store=client.store)
-        # Organizations
-        tenants = await client.all("OrganizationTenant")
-        populate_local_store(objects=tenants, key_type="name", store=client.store)
-        providers = await client.all("OrganizationProvider")
-        populate_local_store(objects=providers, key_type="name", store=client.store)
-        manufacturers = await client.all("OrganizationManufacturer")
-        populate_local_store(objects=manufacturers, key_type="name", store=client.store)
-        # ASN
-        autonomous_systems = await client.all("InfraAutonomousSystem")
-        populate_local_store(
-            objects=autonomous_systems, key_type="name", store=client.store
-        )
-        # Platforms + Device Types
-        platforms = await client.all("InfraPlatform")
-        populate_local_store(objects=platforms, key_type="name", store=client.store)
-        device_types = await client.all("InfraDeviceType")
-        populate_local_store(objects=device_types, key_type="name", store=client.store)
-        # Topologies + Network Strategies
-        topologies = await client.all("TopologyTopology")
-        populate_local_store(objects=topologies, key_type="name", store=client.store)
-        evpn_strategies = await client.all("TopologyEVPNStrategy", populate_store=True)
-        populate_local_store(
-            objects=evpn_strategies, key_type="name", store=client.store
+        references = await load_reference_data(
+            client=client, log=log, branch=branch, kinds=REFERENCE_KINDS
         )
-        # Locations
-        locations = await client.all("LocationGeneric", populate_store=True)
-        populate_local_store(objects=locations, key_type="name", store=client.store)
-        # Groups
-        groups = await client.all("CoreStandardGroup")
-        populate_local_store(objects=groups, key_type="name", store=client.store)
-        # Prefixes
-        prefixes = await client.all("InfraPrefix")
-        populate_local_store(objects=prefixes, key_type="prefix", store=client.store)
-        # VRF
-        vrfs = await client.all("InfraVRF")
-        populate_local_store(objects=vrfs, key_type="name", store=client.store)
+        topologies = references.all("TopologyTopology")
+        # The IPAM can hold a lot of prefixes, only their id, VRF and value are kept
+        async for record in iter_records(
+            client=client,
+            branch=branch,
+            kind="InfraPrefix",
+            attributes=["prefix"],
+            relationships=["vrf"],
+        ):
+            references.add_record(
+                record=record, key=(record.values["vrf"], record.values["prefix"])
+            )
 
     except Exception as e:
-        log.error(f"Fail to populate due to {e}")
-        exit(1)
+        raise ReferenceDataError(f"Fail to populate due to {e}") from e
 
     log.info("Adding a new Device Role (client) via the SDK")
     try:
-        await client.schema.add_dropdown_option(
-            kind="InfraDevice",
-            attribute="role",
-            option="client",
-            color="#c5a3ff",
-            description="Server & Client endpoints.",
-        )
+        device_schema = await client.schema.get(kind="InfraDevice", branch=branch)
+        role_choices = device_schema.get_attribute("role").choices or []
+        if "client" in [choice["name"] for choice in role_choices]:
+            log.debug("- The Client dropdown option is already present")
+        else:
+            await client.schema.add_dropdown_option(
+                kind="InfraDevice",
+                attribute="role",
+                option="client",
+                color="#c5a3ff",
+                description="Server & Client endpoints.",
+            )
     except Exception as e:
         log.debug(f"Fail to add Client dropdown option due to {e}")
 
@@ -1476,9 +1210,21 @@ async def run(
     topology_name = None
     if "topology" in kwargs:
         topology_name = kwargs["topology"]
+    device_concurrency = int(kwargs.get("device_concurrency", DEVICE_CONCURRENCY))
+    artifact_targets: Dict[str, Set[str]] = defaultdict(set)
+    topology_ids: Set[str] = set()
+    group_members: Dict[str, List[str]] = defaultdict(list)
     if not topology_name:
         log.info("Generation Topologies")
-    batch = await client.create_batch()
+    location_contexts = LocationContexts(client=client, branch=branch)
+    scheduler = TopologyScheduler(
+        client=client,
+        log=log,
+        request_budget=int(kwargs.get("request_budget", REQUEST_BUDGET)),
+        topology_concurrency=int(
+            kwargs.get("topology_concurrency", TOPOLOGY_CONCURRENCY)
+        ),
+    )
     for index, topology in enumerate(topologies):
         try:
             location_peer = topology.location.peer
@@ -1486,25 +1232,119 @@ async def run(
                 continue
 
             log.info(f"Generation topology {topology.name.value}")
-            batch.add(
+            scheduler.add(
+                name=topology.name.value,
                 task=generate_topology,
                 topology=topology,
                 client=client,
                 branch=branch,
                 log=log,
                 topology_index=index,
-                node=topology,
+                device_concurrency=device_concurrency,
+                artifact_targets=artifact_targets,
+                topology_ids=topology_ids,
+                group_members=group_members,
+                prefix_index=references,
+                location_contexts=location_contexts,
             )
         except ValueError:
             # You should end-up here if topology.location.peer is not set
             continue
 
-    if batch.num_tasks < 1:
+    if scheduler.num_tasks < 1:
         if topology_name:
             log.info(f"{topology_name} doesn't exist or is not associated with a site")
         else:
             log.info(f"No Topologies found")
     else:
-        async for node, _ in batch.execute():
-            accessor = f"{node._schema.human_friendly_id[0].split('__')[0]}"
-            log.info(f"- Created {node._schema.kind} - {getattr(node, accessor).value}")
+        async for name, _ in scheduler.execute():
+            log.info(f"- Created TopologyTopology - {name}")
+        await add_group_members(
+            client=client, log=log, branch=branch, group_members=group_members
+        )
+        set_phase("artifacts")
+        await regenerate_artifacts(
+            client=client,
+            log=log,
+            branch=branch,
+            artifact_targets=artifact_targets,
+            topology_ids=topology_ids,
+        )
+
+
+async def generate_in_memory(
+    log: logging.Logger, branch: str, latency: float, **kwargs
+) -> RequestRecorder:
+    """Generates the topologies in the in-memory stand-in of the tests.
+
+    The stand-in is filled by the bootstrap scripts first. Nothing is read from
+    or sent to Infrahub, the mutations return the ids of the objects created.
+    """
+    sys.path.append(str(PROJECT_DIRECTORY))
+    import create_basic
+    import create_location
+    import create_topology
+    from tests.standin.backend import MemoryBackend
+    from tests.standin.requester import StandInRequester
+    from tests.standin.schema import SchemaRegistry
+
+    requester = StandInRequester(
+        backend=MemoryBackend(SchemaRegistry([PROJECT_DIRECTORY / "schemas"]))
+    )
+    client = InfrahubClient(
+        config=Config(address="http://standin", requester=requester, api_token="x")
+    )
+    bootstrap_log = log.getChild("bootstrap")
+    bootstrap_log.setLevel(logging.WARNING)
+    for module in (create_basic, create_location, create_topology):
+        await module.run(client=client, log=bootstrap_log, branch=branch)
+
+    # Only the generation waits for the latency and is recorded
+    requester.latency = latency
+    recorder = RequestRecorder(client=client, dry_run=True)
+    recorder.install()
+    try:
+        await generate_topologies(client=client, log=log, branch=branch, **kwargs)
+    finally:
+        recorder.uninstall()
+    return recorder
+
+
+# ---------------------------------------------------------------
+# Use the `infrahubctl run` command line to execute this script
+#
+#   infrahubctl run models/infrastructure_edge.py
+#
+# Add dry_run=true to generate the topology in memory instead, from the data of
+# the bootstrap scripts, and count the queries and mutations of each phase. The
+# wall time is estimated with a latency (in seconds) per call.
+#
+# ---------------------------------------------------------------
+@instrument_run
+async def run(
+    client: InfrahubClient, log: logging.Logger, branch: str, **kwargs
+) -> None:
+    if str(kwargs.get("dry_run", False)).lower() not in ("true", "yes", "1"):
+        try:
+            await generate_topologies(client=client, log=log, branch=branch, **kwargs)
+        except ReferenceDataError as e:
+            log.error(e)
+            exit(1)
+        return
+
+    log.info("Dry run, the topology is generated in memory and Infrahub isn't used")
+    # The latency is waited for on a clock of its own, which takes no time
+    try:
+        recorder = await asyncio.to_thread(
+            run_with_virtual_clock,
+            generate_in_memory(
+                log=log,
+                branch=branch,
+                latency=float(kwargs.pop("latency", DRY_RUN_LATENCY)),
+                **kwargs,
+            ),
+        )
+    except ReferenceDataError as e:
+        log.error(e)
+        exit(1)
+    recorder.log_report(log=log)
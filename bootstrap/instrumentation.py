@@ -0,0 +1,261 @@
+import functools
+import json
+import logging
+import os
+import sys
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from infrahub_sdk import InfrahubClient
+from recorder import RequestHook, parse_request
+
+# Opt-in timing of the bootstrap scripts: the calls to the helpers of utils and
+# to client.get / client.filters are measured by kind and calling function,
+# along with the requests they send. The report is logged at the end of run().
+
+# Enables the instrumentation when set
+INSTRUMENTATION_ENV = "INFRAHUB_INSTRUMENTATION"
+
+# File the report is also written to (as JSON), enables the instrumentation when set
+INSTRUMENTATION_FILE_ENV = "INFRAHUB_INSTRUMENTATION_FILE"
+
+# Rows of each table of the report
+INSTRUMENTATION_TOP = 15
+
+# Upper bounds (in ms) of the buckets of the latency histograms
+LATENCY_BUCKETS = (10, 50, 100, 250, 500, 1000)
+BUCKET_NAMES = [f"<{bound}ms" for bound in LATENCY_BUCKETS] + [
+    f">={LATENCY_BUCKETS[-1]}ms"
+]
+
+
+@dataclass
+class CallStats:
+    calls: int = 0
+    total: float = 0.0
+    max: float = 0.0
+    sent: int = 0
+    received: int = 0
+    histogram: Counter = field(default_factory=Counter)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.calls if self.calls else 0.0
+
+    def add(self, elapsed: float, sent: int = 0, received: int = 0) -> None:
+        self.calls += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        self.sent += sent
+        self.received += received
+        bucket = next(
+            (
+                index
+                for index, bound in enumerate(LATENCY_BUCKETS)
+                if elapsed * 1000 < bound
+            ),
+            len(LATENCY_BUCKETS),
+        )
+        self.histogram[BUCKET_NAMES[bucket]] += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "total": self.total,
+            "max": self.max,
+            "sent": self.sent,
+            "received": self.received,
+            "histogram": dict(self.histogram),
+        }
+
+
+# Instrumented function the current task is in, the requests are attributed to it
+_function: ContextVar[str] = ContextVar("instrumented_function", default="-")
+
+_instrumentation: Optional["Instrumentation"] = None
+
+
+def _kind(kind: Any) -> str:
+    if kind is None:
+        return "-"
+    return kind if isinstance(kind, str) else getattr(kind, "__name__", str(kind))
+
+
+class Instrumentation(RequestHook):
+    """Measures the calls and requests of a client until uninstalled."""
+
+    def __init__(self, client: InfrahubClient) -> None:
+        super().__init__(client=client)
+        # (function, caller, kind)
+        self.calls: Dict[Tuple[str, str, str], CallStats] = defaultdict(CallStats)
+        # (function, operation, kind)
+        self.requests: Dict[Tuple[str, str, str], CallStats] = defaultdict(CallStats)
+
+    def install(self) -> None:
+        global _instrumentation
+        super().install()
+        _instrumentation = self
+        # Set on the instance, they hide the methods of the class until uninstalled
+        for name in ("get", "filters"):
+            setattr(
+                self.client,
+                name,
+                self._wrap(f"client.{name}", getattr(self.client, name)),
+            )
+
+    def uninstall(self) -> None:
+        global _instrumentation
+        super().uninstall()
+        _instrumentation = None
+        for name in ("get", "filters"):
+            self.client.__dict__.pop(name, None)
+
+    async def measure(
+        self, function: str, caller: str, kind: Any, awaitable: Awaitable[Any]
+    ) -> Any:
+        token = _function.set(function)
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.calls[(function, caller, _kind(kind))].add(
+                elapsed=time.perf_counter() - start
+            )
+            _function.reset(token)
+
+    def _wrap(
+        self, function: str, method: Callable[..., Awaitable[Any]]
+    ) -> Callable[..., Awaitable[Any]]:
+        @functools.wraps(method)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            return await self.measure(
+                function=function,
+                caller=sys._getframe(1).f_code.co_name,
+                # The kind is the first argument of the client methods
+                kind=kwargs.get("kind", args[0] if args else None),
+                awaitable=method(*args, **kwargs),
+            )
+
+        return wrapper
+
+    async def _request(self, **kwargs: Any) -> Any:
+        operation, kind, _ = parse_request(
+            url=kwargs["url"], payload=kwargs.get("payload")
+        )
+        start = time.perf_counter()
+        response = await self._request_method(**kwargs)
+        self.requests[(_function.get(), operation, kind)].add(
+            elapsed=time.perf_counter() - start,
+            sent=len(json.dumps(kwargs["payload"])) if kwargs.get("payload") else 0,
+            received=len(response.content),
+        )
+        return response
+
+    def log_report(self, log: logging.Logger, top: int = INSTRUMENTATION_TOP) -> None:
+        log.info(f"Top {top} calls by total time")
+        log.info(
+            f"{'function':<26} {'caller':<34} {'kind':<28} {'calls':>6}"
+            f" {'total':>8} {'mean':>8} {'max':>8}"
+        )
+        for (function, caller, kind), stats in self._top(self.calls, top=top):
+            log.info(
+                f"{function:<26} {caller:<34} {kind:<28} {stats.calls:>6}"
+                f" {stats.total:>7.2f}s {stats.mean * 1000:>6.0f}ms"
+                f" {stats.max * 1000:>6.0f}ms"
+            )
+
+        log.info(f"Top {top} requests by total time")
+        log.info(
+            f"{'function':<26} {'operation':<9} {'kind':<34} {'calls':>6}"
+            f" {'total':>8} {'sent':>9} {'received':>9}  latency"
+        )
+        for (function, operation, kind), stats in self._top(self.requests, top=top):
+            histogram = " ".join(
+                f"{bucket}:{stats.histogram[bucket]}"
+                for bucket in BUCKET_NAMES
+                if stats.histogram[bucket]
+            )
+            log.info(
+                f"{function:<26} {operation:<9} {kind:<34} {stats.calls:>6}"
+                f" {stats.total:>7.2f}s {stats.sent:>9} {stats.received:>9}"
+                f"  {histogram}"
+            )
+
+    def write(self, path: Path) -> None:
+        report: Dict[str, List[Dict[str, Any]]] = {
+            "calls": [
+                {
+                    "function": function,
+                    "caller": caller,
+                    "kind": kind,
+                    **stats.to_dict(),
+                }
+                for (function, caller, kind), stats in self._top(self.calls)
+            ],
+            "requests": [
+                {
+                    "function": function,
+                    "operation": operation,
+                    "kind": kind,
+                    **stats.to_dict(),
+                }
+                for (function, operation, kind), stats in self._top(self.requests)
+            ],
+        }
+        path.write_text(json.dumps(report, indent=2))
+
+    @staticmethod
+    def _top(
+        stats: Dict[Tuple[str, str, str], CallStats], top: Optional[int] = None
+    ) -> List[Tuple[Tuple[str, str, str], CallStats]]:
+        return sorted(stats.items(), key=lambda item: -item[1].total)[:top]
+
+
+def instrumented(func: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+    """Measures the calls to the function while an instrumentation is installed."""
+
+    @functools.wraps(func)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        if _instrumentation is None:
+            return await func(*args, **kwargs)
+        return await _instrumentation.measure(
+            function=func.__name__,
+            caller=sys._getframe(1).f_code.co_name,
+            kind=kwargs.get("kind_name"),
+            awaitable=func(*args, **kwargs),
+        )
+
+    return wrapper
+
+
+def instrument_run(
+    run: Callable[..., Awaitable[None]],
+) -> Callable[..., Awaitable[None]]:
+    """Instruments the run() of a script when enabled by the environment.
+
+    When scripts run each other (run_all.py), the outermost one reports for all of them.
+    """
+
+    @functools.wraps(run)
+    async def wrapper(
+        client: InfrahubClient, log: logging.Logger, branch: str, **kwargs: Any
+    ) -> None:
+        path = os.getenv(INSTRUMENTATION_FILE_ENV)
+        if _instrumentation is not None or not (os.getenv(INSTRUMENTATION_ENV) or path):
+            return await run(client=client, log=log, branch=branch, **kwargs)
+
+        instrumentation = Instrumentation(client=client)
+        instrumentation.install()
+        try:
+            await run(client=client, log=log, branch=branch, **kwargs)
+        finally:
+            instrumentation.uninstall()
+            instrumentation.log_report(log=log)
+            if path:
+                instrumentation.write(path=Path(path))
+
+    return wrapper
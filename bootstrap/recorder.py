@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import re
+import selectors
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Coroutine, Dict, Optional, Tuple
+
+import httpx
+from infrahub_sdk import InfrahubClient
+
+# Records the requests a script sends to Infrahub, by phase and by kind, with the
+# time spent waiting for the requests of each phase. A dry run is executed on
+# a VirtualClockLoop, where waiting for the latency of a call takes no time.
+
+# Latency (in seconds) of each call used to estimate the wall time of a dry run
+DRY_RUN_LATENCY = 0.05
+
+MUTATION_ACTIONS = ("Create", "Update", "Upsert", "Delete")
+
+OPERATION_RE = re.compile(r"^\s*(query|mutation)?[^{]*\{\s*(\w+)")
+
+# Phase of the generation the current task works on, inherited by the tasks it starts
+_phase: ContextVar[str] = ContextVar("phase", default="setup")
+
+
+def set_phase(name: str) -> None:
+    """Attributes the requests sent from now on by the current task to the phase."""
+    _phase.set(name)
+
+
+def parse_request(
+    url: str, payload: Optional[Dict[str, Any]]
+) -> Tuple[str, str, Optional[str]]:
+    """Returns the type of a request (query or mutation), its kind and mutation name."""
+    path = httpx.URL(url).path
+    if not path.startswith("/graphql"):
+        # REST endpoints, the ones receiving a payload change something (but the login)
+        if payload and not path.startswith("/api/auth"):
+            return "mutation", path.rstrip("/"), None
+        return "query", path.rstrip("/"), None
+
+    match = OPERATION_RE.match((payload or {}).get("query", ""))
+    if not match:
+        return "query", "unknown", None
+    operation, name = match.group(1) or "query", match.group(2)
+    if operation == "query":
+        return "query", name, None
+    for action in MUTATION_ACTIONS:
+        if name.endswith(action):
+            return "mutation", name[: -len(action)], name
+    return "mutation", name, name
+
+
+class RequestHook:
+    """Wraps the method sending the requests of a client until uninstalled.
+
+    The hooks installed on the same client (recorder, instrumentation, scheduler)
+    wrap each other, so they have to be uninstalled in the reverse order.
+    """
+
+    def __init__(self, client: InfrahubClient) -> None:
+        self.client = client
+        self._request_method: Optional[Callable[..., Awaitable[Any]]] = None
+
+    def install(self) -> None:
+        if self._request_method is not None:
+            raise RuntimeError(f"{type(self).__name__} is already installed")
+        self._request_method = self.client._request_method
+        self.client._request_method = self._request
+
+    def uninstall(self) -> None:
+        if self._request_method is None:
+            return
+        # Restoring the wrapped method would drop the hooks installed after this one
+        if self.client._request_method != self._request:
+            raise RuntimeError(
+                f"{type(self).__name__} is wrapped by another hook, "
+                "the hooks must be uninstalled in the reverse order"
+            )
+        self.client._request_method = self._request_method
+        self._request_method = None
+
+    async def _request(self, **kwargs: Any) -> httpx.Response:
+        return await self._request_method(**kwargs)
+
+
+class RequestRecorder(RequestHook):
+    """Counts the requests of a client by phase and kind, and times each phase.
+
+    In dry run, the times are estimates from the clock of a VirtualClockLoop.
+    """
+
+    def __init__(self, client: InfrahubClient, dry_run: bool = False) -> None:
+        super().__init__(client=client)
+        self.dry_run = dry_run
+        self.counts: Dict[str, Counter] = defaultdict(Counter)
+        # Time during which requests of the phase were in flight, from loop.time()
+        self.durations: Counter = Counter()
+        self._in_flight: Counter = Counter()
+        self._busy_since: Dict[str, float] = {}
+        self.started: Optional[float] = None
+        self.elapsed = 0.0
+
+    def install(self) -> None:
+        super().install()
+        self.started = asyncio.get_running_loop().time()
+
+    def uninstall(self) -> None:
+        super().uninstall()
+        if self.started is not None:
+            self.elapsed = asyncio.get_running_loop().time() - self.started
+
+    @property
+    def calls(self) -> int:
+        return sum(sum(counter.values()) for counter in self.counts.values())
+
+    async def _request(self, **kwargs: Any) -> httpx.Response:
+        operation, kind, _ = parse_request(
+            url=kwargs["url"], payload=kwargs.get("payload")
+        )
+        phase = _phase.get()
+        self.counts[phase][(operation, kind)] += 1
+        loop = asyncio.get_running_loop()
+        if not self._in_flight[phase]:
+            self._busy_since[phase] = loop.time()
+        self._in_flight[phase] += 1
+        try:
+            return await self._request_method(**kwargs)
+        finally:
+            self._in_flight[phase] -= 1
+            if not self._in_flight[phase]:
+                self.durations[phase] += loop.time() - self._busy_since[phase]
+
+    def log_report(self, log: logging.Logger) -> None:
+        # The concurrent requests of a phase are timed once, but the phases of
+        # concurrent topologies overlap
+        timing = "estimated" if self.dry_run else "in"
+        for phase, counter in self.counts.items():
+            queries = sum(
+                count
+                for (operation, _), count in counter.items()
+                if operation == "query"
+            )
+            mutations = sum(counter.values()) - queries
+            log.info(
+                f"{phase}: {queries} queries, {mutations} mutations,"
+                f" {timing} {self.durations[phase]:.2f}s"
+            )
+            for (operation, kind), count in sorted(counter.items()):
+                log.info(f"- {operation} {kind}: {count}")
+
+        if self.dry_run:
+            log.info(f"Estimated wall time {self.elapsed:.2f}s for {self.calls} calls")
+        else:
+            log.info(f"{self.calls} calls in {self.elapsed:.2f}s")
+
+
+class VirtualClockSelector(selectors.DefaultSelector):
+    """Selector moving a clock forward by the time it's asked to wait for."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.clock = 0.0
+
+    def select(self, timeout: Optional[float] = None) -> Any:
+        if timeout is not None and timeout > 0:
+            self.clock += timeout
+            timeout = 0
+        return super().select(timeout)
+
+
+class VirtualClockLoop(asyncio.SelectorEventLoop):
+    """Event loop on which asyncio.sleep() returns at once and moves the clock instead.
+
+    The tasks still wait for each other, the semaphores and the batches limit the
+    concurrency as usual: once everything waits for a timer, the clock jumps to it.
+    The time measured is the critical path of the run with these latencies.
+    """
+
+    def __init__(self) -> None:
+        self._virtual_selector = VirtualClockSelector()
+        super().__init__(selector=self._virtual_selector)
+
+    def time(self) -> float:
+        return self._virtual_selector.clock
+
+
+def run_with_virtual_clock(coroutine: Coroutine[Any, Any, Any]) -> Any:
+    """Runs a coroutine to completion on a new VirtualClockLoop."""
+    loop = VirtualClockLoop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
@@ -0,0 +1,88 @@
+import asyncio
+import logging
+import time
+
+from graphlib import TopologicalSorter
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from infrahub_sdk import InfrahubClient
+
+import create_basic
+import create_location
+import create_security_nodes
+import create_topology
+from instrumentation import instrument_run
+
+Stage = Callable[..., Awaitable[None]]
+
+# Stage name: (coroutine, stages it depends on)
+STAGES: Dict[str, Tuple[Stage, List[str]]] = {
+    "create_basic": (create_basic.run, []),
+    "create_location": (create_location.bootstrap_locations, ["create_basic"]),
+    "create_topology": (
+        create_topology.bootstrap_topologies,
+        ["create_basic", "create_location"],
+    ),
+    "create_security_policies": (create_security_nodes.create_security_policies, []),
+    "create_firewall": (
+        create_security_nodes.create_firewall,
+        ["create_basic", "create_location", "create_security_policies"],
+    ),
+}
+
+
+async def run_stages(
+    client: InfrahubClient,
+    log: logging.Logger,
+    branch: str,
+    stages: Optional[Dict[str, Tuple[Stage, List[str]]]] = None,
+) -> None:
+    """Runs each stage as soon as the stages it depends on are done.
+
+    All the stages share the same client, and thus the same schema cache and store.
+    """
+    stages = stages or STAGES
+    sorter = TopologicalSorter(
+        {name: dependencies for name, (_, dependencies) in stages.items()}
+    )
+    sorter.prepare()
+
+    async def run_stage(name: str) -> None:
+        log.info(f"Running {name}")
+        start = time.perf_counter()
+        func, _ = stages[name]
+        await func(client=client, log=log, branch=branch)
+        log.info(f"- {name} done in {time.perf_counter() - start:.1f}s")
+
+    running: Dict[asyncio.Task, str] = {}
+    try:
+        while sorter.is_active():
+            for name in sorter.get_ready():
+                running[asyncio.create_task(run_stage(name))] = name
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                name = running.pop(task)
+                if task.exception() is not None:
+                    log.error(f"- {name} failed: {task.exception()}")
+                task.result()
+                sorter.done(name)
+    finally:
+        # The stages still running are stopped before returning
+        for task in running:
+            task.cancel()
+        if running:
+            log.error(f"- Cancelled {', '.join(sorted(running.values()))}")
+            await asyncio.gather(*running, return_exceptions=True)
+
+
+# ---------------------------------------------------------------
+# Use the `infrahubctl run` command line to execute this script
+#
+#   infrahubctl run bootstrap/run_all.py
+#
+# ---------------------------------------------------------------
+@instrument_run
+async def run(
+    client: InfrahubClient, log: logging.Logger, branch: str, **kwargs
+) -> None:
+    await run_stages(client=client, log=log, branch=branch)
@@ -0,0 +1,212 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+
+from infrahub_sdk import InfrahubClient
+from recorder import RequestHook
+
+# Runs several topologies concurrently while keeping the number of requests
+# in flight against Infrahub under a single budget. The topologies started
+# first get the free slots first, the others only use the slots left idle.
+
+# Requests in flight across all the topologies
+REQUEST_BUDGET = 20
+
+# Topologies generated at the same time
+TOPOLOGY_CONCURRENCY = 4
+
+# Seconds between two progress reports
+PROGRESS_INTERVAL = 10.0
+
+
+@dataclass
+class TopologyProgress:
+    name: str
+    priority: int = 0
+    state: str = "pending"
+    requests: int = 0
+    started: Optional[float] = None
+    finished: Optional[float] = None
+
+    @property
+    def elapsed(self) -> float:
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.perf_counter()) - self.started
+
+    def __str__(self) -> str:
+        return f"{self.name}: {self.state}, {self.requests} requests in {self.elapsed:.1f}s"
+
+
+# Progress of the topology the current task works for, inherited by the
+# tasks the topology starts (batches, filters, ...)
+_current: ContextVar[Optional[TopologyProgress]] = ContextVar(
+    "current_topology", default=None
+)
+
+
+class RequestBudget:
+    """Limits the requests in flight, a freed slot goes to the waiter with the lowest priority value."""
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self.in_flight = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+
+    @asynccontextmanager
+    async def slot(self, priority: int = 0) -> AsyncIterator[None]:
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (priority, next(self._sequence), waiter))
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # The slot may have been handed over right before the cancellation
+                if waiter.done() and not waiter.cancelled():
+                    self._release()
+                raise
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _release(self) -> None:
+        while self._waiters:
+            _, _, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                # The slot is handed over, the requests in flight don't change
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+
+class BudgetedRequests(RequestHook):
+    """Sends the requests of a client within the budget, by priority of their topology."""
+
+    def __init__(self, client: InfrahubClient, budget: RequestBudget) -> None:
+        super().__init__(client=client)
+        self.budget = budget
+
+    async def _request(self, **kwargs: Any) -> Any:
+        progress = _current.get()
+        # Requests made outside of a topology go first
+        priority = -1 if progress is None else progress.priority
+        async with self.budget.slot(priority=priority):
+            if progress is not None:
+                progress.requests += 1
+            return await self._request_method(**kwargs)
+
+
+class TopologyScheduler:
+    """Generates topologies concurrently under a global request budget.
+
+    The budget is applied to every request of the client, whichever batch sends it.
+    Unlike an InfrahubBatch built with client.create_batch(), the scheduler doesn't
+    hold the client semaphore, which the batches of each topology use.
+    """
+
+    def __init__(
+        self,
+        client: InfrahubClient,
+        log: logging.Logger,
+        request_budget: int = REQUEST_BUDGET,
+        topology_concurrency: int = TOPOLOGY_CONCURRENCY,
+        progress_interval: float = PROGRESS_INTERVAL,
+    ) -> None:
+        self.client = client
+        self.log = log
+        self.budget = RequestBudget(limit=request_budget)
+        self.topology_concurrency = topology_concurrency
+        self.progress_interval = progress_interval
+        self.progress: Dict[str, TopologyProgress] = {}
+        self._pending: Deque[
+            Tuple[str, Callable[..., Awaitable[Any]], Dict[str, Any]]
+        ] = deque()
+        self._priorities = itertools.count()
+
+    @property
+    def num_tasks(self) -> int:
+        return len(self.progress)
+
+    def add(
+        self, name: str, task: Callable[..., Awaitable[Any]], **kwargs: Any
+    ) -> None:
+        self.progress[name] = TopologyProgress(name=name)
+        self._pending.append((name, task, kwargs))
+
+    async def execute(self) -> AsyncIterator[Tuple[str, Any]]:
+        """Yields the name and result of each topology as it completes."""
+        results: asyncio.Queue = asyncio.Queue()
+        hook = BudgetedRequests(client=self.client, budget=self.budget)
+        hook.install()
+        workers = [
+            asyncio.create_task(self._worker(results=results))
+            for _ in range(min(self.topology_concurrency, len(self._pending)))
+        ]
+        reporter = asyncio.create_task(self._report())
+        try:
+            for _ in range(self.num_tasks):
+                name, result = await results.get()
+                if isinstance(result, BaseException):
+                    raise result
+                yield name, result
+        finally:
+            for task in [*workers, reporter]:
+                task.cancel()
+            hook.uninstall()
+            self.log_summary()
+
+    def log_summary(self) -> None:
+        for progress in self.progress.values():
+            self.log.info(f"- {progress}")
+
+    async def _worker(self, results: asyncio.Queue) -> None:
+        while self._pending:
+            name, task, kwargs = self._pending.popleft()
+            progress = self.progress[name]
+            # Topologies started first keep the priority until they are done
+            progress.priority = next(self._priorities)
+            progress.state = "running"
+            progress.started = time.perf_counter()
+            token = _current.set(progress)
+            try:
+                result = await task(**kwargs)
+                progress.state = "done"
+            except Exception as exc:
+                progress.state = "failed"
+                result = exc
+            finally:
+                progress.finished = time.perf_counter()
+                _current.reset(token)
+            await results.put((name, result))
+
+    async def _report(self) -> None:
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            done = sum(1 for progress in self.progress.values() if progress.finished)
+            self.log.info(
+                f"Topologies: {done}/{self.num_tasks} done, {self.budget.in_flight} requests in flight"
+            )
+            for progress in self.progress.values():
+                if progress.state == "running":
+                    self.log.info(f"- {progress}")
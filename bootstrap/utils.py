@@ -1,14 +1,35 @@
+import json
 import logging
 import ipaddress
+import os
+import sys
 
-from typing import Dict, List, Optional
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    Hashable,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
 
 from infrahub_sdk import InfrahubClient
 from infrahub_sdk.batch import InfrahubBatch
 from infrahub_sdk.exceptions import GraphQLError
+from infrahub_sdk.graphql import Query
 from infrahub_sdk.node import InfrahubNode
 from infrahub_sdk.store import NodeStore
 
+from instrumentation import instrumented
+
+# Number of full-table reads sent at the same time
+READ_CONCURRENCY = 5
+
 
 def extract_common_prefix(prefix: str) -> str:
     # Create an IP network object
@@ -53,6 +74,275 @@ def extract_common_prefix(prefix: str) -> str:
             return ":".join(net_str.split(":")[:full_hextets]) + f"/{net.prefixlen}"
 
 
+def _node_id(value: Any) -> Any:
+    if isinstance(value, dict):
+        return value.get("id")
+    return getattr(value, "id", value)
+
+
+def _same_value(current: Any, desired: Any) -> bool:
+    if current in (None, "") or desired in (None, ""):
+        return current in (None, "") and desired in (None, "")
+    return current == desired or str(current) == str(desired)
+
+
+def _properties_differ(current: Any, desired: Dict) -> bool:
+    for prop in ("source", "owner"):
+        if prop in desired and _node_id(desired[prop]) != _node_id(
+            getattr(current, prop)
+        ):
+            return True
+    if "is_protected" in desired:
+        return bool(desired["is_protected"]) != bool(current.is_protected)
+    return False
+
+
+def node_differs(node: InfrahubNode, data: Dict) -> bool:
+    """Compares the data given to client.create() with the current state of a node."""
+    schema = node._schema
+    for name, desired in data.items():
+        if name in schema.attribute_names:
+            # Hashed values can't be read back
+            if schema.get_attribute(name).kind == "HashedPassword":
+                continue
+            attribute = getattr(node, name)
+            if not isinstance(desired, dict):
+                desired = {"value": desired}
+            value = desired.get("value")
+            # Values coming from a resource pool are only allocated on creation
+            from_pool = isinstance(value, InfrahubNode) and value.is_resource_pool()
+            if "value" in desired and not from_pool:
+                if not _same_value(attribute.value, value):
+                    return True
+            if _properties_differ(attribute, desired):
+                return True
+        elif name in schema.relationship_names:
+            relationship = getattr(node, name)
+            if schema.get_relationship(name).cardinality == "many":
+                # Peers are only known when the relationship was included in the query
+                if not relationship.initialized:
+                    return True
+                desired_ids = {_node_id(peer) for peer in desired or []}
+                if desired_ids != {peer.id for peer in relationship.peers}:
+                    return True
+            else:
+                if _node_id(desired) != relationship.id:
+                    return True
+                if isinstance(desired, dict) and _properties_differ(
+                    relationship, desired
+                ):
+                    return True
+    return False
+
+
+async def fetch_all(
+    client: InfrahubClient,
+    branch: str,
+    kinds: List[str],
+    max_concurrent_execution: int = READ_CONCURRENCY,
+    **kwargs: Any,
+) -> Dict[str, List[InfrahubNode]]:
+    """Retrieves all the objects of several kinds concurrently."""
+    # Load the schema once instead of once per concurrent query
+    await client.schema.all(branch=branch)
+    batch = InfrahubBatch(max_concurrent_execution=max_concurrent_execution)
+    for kind in kinds:
+        batch.add(task=client.all, kind=kind, branch=branch, node=kind, **kwargs)
+    results = {kind: nodes async for kind, nodes in batch.execute()}
+    return {kind: results[kind] for kind in kinds}
+
+
+class NodeRecord(NamedTuple):
+    """Compact copy of a node: its id, kind and the few values read from it."""
+
+    id: str
+    kind: str
+    values: Dict[str, Any]
+
+
+async def iter_records(
+    client: InfrahubClient,
+    branch: str,
+    kind: str,
+    attributes: List[str],
+    relationships: Optional[List[str]] = None,
+    page_size: Optional[int] = None,
+) -> AsyncIterator[NodeRecord]:
+    """Pages through all the objects of a kind and yields a record for each of them.
+
+    Only the value of the attributes and the id of the relationships (cardinality
+    one) listed are queried, and no InfrahubNode is built, so the memory used by a
+    page doesn't depend on the total number of objects.
+    """
+    relationships = relationships or []
+    page_size = page_size or client.pagination_size
+    node_query: Dict[str, Any] = {"id": None, "__typename": None}
+    node_query.update({name: {"value": None} for name in attributes})
+    node_query.update({name: {"node": {"id": None}} for name in relationships})
+
+    offset = 0
+    while True:
+        query = Query(
+            query={
+                kind: {
+                    "@filters": {"offset": offset, "limit": page_size},
+                    "count": None,
+                    "edges": {"node": node_query},
+                }
+            }
+        )
+        response = await client.execute_graphql(
+            query=query.render(),
+            branch_name=branch,
+            tracker=f"records-{kind.lower()}-{offset}",
+        )
+        for edge in response[kind]["edges"]:
+            node = edge["node"]
+            values = {name: (node[name] or {}).get("value") for name in attributes}
+            for name in relationships:
+                values[name] = ((node[name] or {}).get("node") or {}).get("id")
+            yield NodeRecord(id=node["id"], kind=node["__typename"], values=values)
+        offset += page_size
+        if offset >= response[kind]["count"]:
+            break
+
+
+class NodeIndex:
+    """Nodes indexed by kind under several keys, with lookups returning None when missing.
+
+    A node is indexed under each of its kinds, generics included, by id, human
+    friendly id and the value of the KEY_ATTRIBUTES it has. Nodes with a device,
+    like interfaces, are also indexed by (device id, name). When a store is given,
+    the nodes are added to it as well so that client.store lookups keep working.
+    """
+
+    KEY_ATTRIBUTES = ("name", "prefix", "address")
+
+    def __init__(self, store: Optional[NodeStore] = None) -> None:
+        self.store = store
+        # kind -> key -> node, the nodes indexed without kind are under ""
+        self._keys: Dict[str, Dict[Hashable, Union[InfrahubNode, NodeRecord]]] = (
+            defaultdict(dict)
+        )
+        self._nodes: Dict[str, Dict[str, Union[InfrahubNode, NodeRecord]]] = (
+            defaultdict(dict)
+        )
+
+    def add(self, node: InfrahubNode, key: Optional[str] = None) -> None:
+        keys: List[Hashable] = [key] if key else []
+        if node.id:
+            keys.append(node.id)
+        hfid = node.get_human_friendly_id()
+        if hfid:
+            keys.append(tuple(hfid))
+        for attribute in self.KEY_ATTRIBUTES:
+            if attribute in node._schema.attribute_names:
+                value = getattr(node, attribute).value
+                if value is not None:
+                    keys.append(str(value))
+        if (
+            "device" in node._schema.relationship_names
+            and "name" in node._schema.attribute_names
+            and node.device.id
+        ):
+            keys.append((node.device.id, node.name.value))
+
+        for kind in ["", *node.get_all_kinds()]:
+            self._nodes[kind][node._internal_id] = node
+            for item in keys:
+                self._keys[kind][item] = node
+        if self.store is not None:
+            self.store.set(node=node, key=key)
+
+    def add_record(self, record: NodeRecord, key: Optional[Hashable] = None) -> None:
+        """Indexes a record by id and by the given key, records are not added to the store."""
+        keys = [record.id, key] if key else [record.id]
+        for kind in ("", record.kind):
+            self._nodes[kind][record.id] = record
+            for item in keys:
+                self._keys[kind][item] = record
+
+    def extend(self, nodes: List[InfrahubNode], key_attribute: str) -> None:
+        for node in nodes:
+            value = getattr(node, key_attribute).value
+            self.add(node=node, key=str(value) if value is not None else None)
+
+    def get(
+        self, key: Hashable, kind: str = ""
+    ) -> Optional[Union[InfrahubNode, NodeRecord]]:
+        if isinstance(key, list):
+            key = tuple(key)
+        return self._keys.get(kind, {}).get(key)
+
+    def has(self, key: Hashable, kind: str = "") -> bool:
+        return self.get(key=key, kind=kind) is not None
+
+    def all(self, kind: str) -> List[Union[InfrahubNode, NodeRecord]]:
+        return list(self._nodes.get(kind, {}).values())
+
+    def footprint(self) -> Dict[str, int]:
+        """Number of nodes and keys, and size in bytes of the index itself (nodes excluded)."""
+        size = sys.getsizeof(self._keys) + sys.getsizeof(self._nodes)
+        keys = 0
+        for index in self._keys.values():
+            keys += len(index)
+            size += sys.getsizeof(index) + sum(sys.getsizeof(item) for item in index)
+        for nodes in self._nodes.values():
+            size += sys.getsizeof(nodes)
+        return {"nodes": len(self._nodes.get("", {})), "keys": keys, "bytes": size}
+
+
+class NodeCache(NodeIndex):
+    """Existing nodes indexed by kind and name, loaded with one query per kind.
+
+    Used by create_and_save and create_and_add_to_batch to only send the
+    objects that are missing or differ from the desired data.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.results: Dict[str, Counter] = defaultdict(Counter)
+        # Nodes left untouched aren't part of any mutation, they have to be
+        # added to the tracking group explicitly to stay members
+        self.unchanged_ids: List[str] = []
+
+    async def load(
+        self,
+        client: InfrahubClient,
+        branch: str,
+        kinds: List[str],
+        key_attribute: str = "name",
+        include: Optional[List[str]] = None,
+    ) -> None:
+        nodes_by_kind = await fetch_all(
+            client=client, branch=branch, kinds=kinds, include=include, property=True
+        )
+        for nodes in nodes_by_kind.values():
+            self.extend(nodes=nodes, key_attribute=key_attribute)
+
+    def reconcile(
+        self, kind: str, name: str, data: Dict
+    ) -> Tuple[Optional[InfrahubNode], Dict]:
+        """Returns the existing node if it's up to date, otherwise the data to save."""
+        existing = self.get(key=name, kind=kind)
+        if existing is None:
+            self.results[kind]["created"] += 1
+            return None, data
+        if node_differs(existing, data):
+            self.results[kind]["updated"] += 1
+            return None, {**data, "id": existing.id}
+        self.results[kind]["unchanged"] += 1
+        self.unchanged_ids.append(existing.id)
+        return existing, data
+
+    def log_summary(self, log: logging.Logger) -> None:
+        for kind, results in self.results.items():
+            log.info(
+                f"- {kind}: {results['created']} created, "
+                f"{results['updated']} updated, {results['unchanged']} unchanged"
+            )
+
+
 async def create_ipam_pool(
     client: InfrahubClient,
     log: logging.Logger,
@@ -63,6 +353,7 @@ async def create_ipam_pool(
     batch: Optional[InfrahubBatch] = None,
     location: Optional[str] = None,
     vrf: Optional[str] = None,
+    cache: Optional[NodeCache] = None,
 ) -> InfrahubNode:
     """
     Helper function to create a single IP pool.
@@ -118,6 +409,7 @@ async def create_ipam_pool(
             kind_name=kind,
             data=pool_data,
             batch=batch,
+            cache=cache,
         )
     else:
         pool = await create_and_save(
@@ -127,10 +419,12 @@ async def create_ipam_pool(
             object_name=pool_name,
             kind_name=kind,
             data=pool_data,
+            cache=cache,
         )
     return pool
 
 
+@instrumented
 async def create_and_save(
     client: InfrahubClient,
     log: logging.Logger,
@@ -140,8 +434,18 @@ async def create_and_save(
     data: Dict,
     allow_upsert: Optional[bool] = True,
     retrieved_on_failure: Optional[bool] = False,
+    cache: Optional[NodeCache] = None,
 ) -> InfrahubNode:
-    """Creates an object, saves it and handles failures."""
+    """Creates an object, saves it and handles failures.
+
+    With a cache, an object already up to date is returned without sending the mutation.
+    """
+    if cache:
+        obj, data = cache.reconcile(kind=kind_name, name=object_name, data=data)
+        if obj:
+            client.store.set(key=object_name, node=obj)
+            log.info(f"- Unchanged {obj._schema.kind} - {object_name}")
+            return obj
     try:
         obj = await client.create(branch=branch, kind=kind_name, data=data)
         await obj.save(allow_upsert=allow_upsert)
@@ -155,9 +459,12 @@ async def create_and_save(
             obj = await client.get(kind=kind_name, name__value=object_name)
             client.store.set(key=object_name, node=obj)
             log.info(f"- Retrieved {obj._schema.kind} - {object_name}")
+    if cache and obj.id:
+        cache.add(node=obj, key=object_name)
     return obj
 
 
+@instrumented
 async def create_and_add_to_batch(
     client: InfrahubClient,
     log: logging.Logger,
@@ -167,8 +474,18 @@ async def create_and_add_to_batch(
     data: Dict,
     batch: InfrahubBatch,
     allow_upsert: Optional[bool] = True,
+    cache: Optional[NodeCache] = None,
 ) -> InfrahubNode:
-    """Creates an object and adds it to a batch for deferred saving."""
+    """Creates an object and adds it to a batch for deferred saving.
+
+    With a cache, an object already up to date is returned without being added to the batch.
+    """
+    if cache:
+        obj, data = cache.reconcile(kind=kind_name, name=object_name, data=data)
+        if obj:
+            client.store.set(key=object_name, node=obj)
+            log.debug(f"- Unchanged {obj._schema.kind} - {object_name}")
+            return obj
     obj = await client.create(branch=branch, kind=kind_name, data=data)
     batch.add(task=obj.save, allow_upsert=allow_upsert, node=obj)
     log.debug(f"- Added to batch: {obj._schema.kind} - {object_name}")
@@ -176,6 +493,7 @@ async def create_and_add_to_batch(
     return obj
 
 
+@instrumented
 async def execute_batch(batch: InfrahubBatch, log: logging.Logger) -> None:
     try:
         async for node, _ in batch.execute():
@@ -193,8 +511,164 @@ async def execute_batch(batch: InfrahubBatch, log: logging.Logger) -> None:
         log.debug(f"- Creation failed due to {exc}")
 
 
-def populate_local_store(objects: List[InfrahubNode], key_type: str, store: NodeStore):
-    for obj in objects:
-        key = getattr(obj, key_type)
-        if key:
-            store.set(key=key.value, node=obj)
+# Directory holding the reference data snapshots, disabled when not set
+SNAPSHOT_DIRECTORY_ENV = "INFRAHUB_SNAPSHOT_DIRECTORY"
+
+
+class ReferenceSnapshot:
+    """On-disk copy of the reference kinds of a branch.
+
+    The snapshot is dropped when the schema hash of the branch changes. A kind is
+    only reused when its version didn't change since it was saved: its count, and
+    the object updated last with the time of its last update.
+    """
+
+    def __init__(self, directory: Path, branch: str) -> None:
+        self.path = directory / f"{branch.replace('/', '_')}.json"
+        self.branch = branch
+        self.schema_hash = ""
+        self.data: Dict[str, Any] = {}
+        self.versions: Dict[str, str] = {}
+
+    async def open(self, client: InfrahubClient) -> None:
+        # Downloaded once per client, the scripts then use the cached schema
+        await client.schema.all(branch=self.branch)
+        self.schema_hash = client.schema.cache[self.branch].hash
+        if self.path.is_file():
+            data = json.loads(self.path.read_text())
+            if data.get("schema_hash") == self.schema_hash:
+                self.data = data
+        if not self.data:
+            self.data = {"schema_hash": self.schema_hash, "kinds": {}, "versions": {}}
+
+    async def _versions(self, client: InfrahubClient, kinds: List[str]) -> None:
+        """Computes the current version of each kind with a single query.
+
+        Only the count of each kind and the object updated last are retrieved.
+        """
+        fields = []
+        for kind in kinds:
+            schema = await client.schema.get(kind=kind, branch=self.branch)
+            selection = [f"{name} {{ updated_at }}" for name in schema.attribute_names]
+            selection.extend(
+                f"{rel.name} {{ properties {{ updated_at }} }}"
+                for rel in schema.relationships
+                if rel.cardinality == "one"
+            )
+            fields.append(
+                f"{kind}(limit: 1, order: {{ node_metadata: {{ updated_at: DESC }} }})"
+                f" {{ count edges {{ node {{ id {' '.join(selection)} }} }} }}"
+            )
+        try:
+            response = await client.execute_graphql(
+                query="query {" + " ".join(fields) + "}", branch_name=self.branch
+            )
+        except GraphQLError:
+            # Ordering by node_metadata isn't supported, all the kinds are reloaded
+            return
+
+        for kind in kinds:
+            edges = response[kind]["edges"]
+            latest = ""
+            updated_at = ""
+            for edge in edges:
+                latest = edge["node"].pop("id")
+                for field in edge["node"].values():
+                    if field and "properties" in field:
+                        field = field["properties"]
+                    if field and field.get("updated_at"):
+                        updated_at = max(updated_at, field["updated_at"])
+            self.versions[kind] = f"{response[kind]['count']}:{latest}@{updated_at}"
+
+    async def get(
+        self, client: InfrahubClient, kinds: List[str]
+    ) -> Dict[str, List[InfrahubNode]]:
+        """Returns the nodes of the kinds still up to date in the snapshot."""
+        await self._versions(client=client, kinds=kinds)
+
+        nodes: Dict[str, List[InfrahubNode]] = {}
+        saved_versions = self.data.get("versions", {})
+        for kind in kinds:
+            if kind not in self.versions or kind not in self.data["kinds"]:
+                continue
+            if saved_versions.get(kind) != self.versions[kind]:
+                continue
+            nodes[kind] = []
+            for item in self.data["kinds"][kind]:
+                schema = await client.schema.get(kind=item["kind"], branch=self.branch)
+                nodes[kind].append(
+                    InfrahubNode(
+                        client=client,
+                        schema=schema,
+                        branch=self.branch,
+                        data=item["data"],
+                    )
+                )
+        return nodes
+
+    def save(self, nodes: Dict[str, List[InfrahubNode]]) -> None:
+        # Merge with what other scripts saved in the meantime
+        if self.path.is_file():
+            current = json.loads(self.path.read_text())
+            if current.get("schema_hash") == self.schema_hash:
+                self.data["kinds"] = {**current["kinds"], **self.data["kinds"]}
+                self.data["versions"] = {
+                    **current.get("versions", {}),
+                    **self.data.get("versions", {}),
+                }
+        for kind, objects in nodes.items():
+            if kind not in self.versions:
+                continue
+            # The version was computed before the nodes were retrieved, an update
+            # made in between invalidates the kind on the next run
+            self.data.setdefault("versions", {})[kind] = self.versions[kind]
+            self.data["kinds"][kind] = [
+                {"kind": obj.get_kind(), "data": obj.get_raw_graphql_data()}
+                for obj in objects
+            ]
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(self.data))
+        tmp_path.replace(self.path)
+
+
+class ReferenceDataError(Exception):
+    """The objects a script starts from could not be retrieved from Infrahub."""
+
+
+async def load_reference_data(
+    client: InfrahubClient,
+    log: logging.Logger,
+    branch: str,
+    kinds: Dict[str, str],
+) -> NodeIndex:
+    """Retrieves all the objects of each kind and indexes them, and adds them to the store, under the given key.
+
+    When INFRAHUB_SNAPSHOT_DIRECTORY is set, the objects are reused from the
+    snapshot of the branch if they are still up to date.
+    """
+    snapshot = None
+    nodes: Dict[str, List[InfrahubNode]] = {}
+    if os.environ.get(SNAPSHOT_DIRECTORY_ENV):
+        snapshot = ReferenceSnapshot(
+            directory=Path(os.environ[SNAPSHOT_DIRECTORY_ENV]), branch=branch
+        )
+        await snapshot.open(client=client)
+        nodes = await snapshot.get(client=client, kinds=list(kinds))
+        if nodes:
+            log.info(f"- Reused {', '.join(nodes)} from {snapshot.path}")
+
+    missing = await fetch_all(
+        client=client,
+        branch=branch,
+        kinds=[kind for kind in kinds if kind not in nodes],
+    )
+    if snapshot and missing:
+        snapshot.save(nodes=missing)
+    nodes.update(missing)
+
+    index = NodeIndex(store=client.store)
+    for kind, key_type in kinds.items():
+        index.extend(nodes=nodes[kind], key_attribute=key_type)
+    log.debug(f"- Reference data index: {index.footprint()}")
+    return index
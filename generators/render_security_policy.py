@@ -1,49 +1,113 @@
 #!/usr/bin/env python3
+import asyncio
 import logging
 
-from typing import List, Set
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set
 
 from infrahub_sdk import InfrahubClient
 from infrahub_sdk.node import InfrahubNode
 
-
-async def get_devices_from_location_hierarchy(
-    location: InfrahubNode,
-) -> List[InfrahubNode]:
-    devices = []
-
-    await location.devices.fetch()
-
-    if len(location.devices.peers):
-        devices.extend([rel_node.peer for rel_node in location.devices.peers])
-
-    if hasattr(location, "children"):
-        await location.children.fetch()
-        if len(location.children.peers):
-            for child in location.children.peers:
-                devices.extend(await get_devices_from_location_hierarchy(child.peer))
-    return devices
-
-
-async def get_policies_from_location_hierarchy(
-    location: InfrahubNode,
-) -> List[InfrahubNode]:
-    policies = []
-
-    if location.policy.id:
-        await location.policy.fetch()
-        policies.append(location.policy.peer)
-
-    if hasattr(location, "parent") and location.parent.id:
-        await location.parent.fetch()
-        policies.extend(
-            await get_policies_from_location_hierarchy(location.parent.peer)
+# Devices whose policies are rendered at the same time, overridden by the concurrency argument
+RENDER_CONCURRENCY = 10
+
+
+class LocationHierarchy:
+    """The location tree, loaded once per run with one query per location kind.
+
+    The policies that apply to a location and the devices of a subtree are
+    memoized, the render of each device walks the tree without fetching it again.
+    """
+
+    def __init__(self, client: InfrahubClient) -> None:
+        self.client = client
+        self.locations: Dict[str, InfrahubNode] = {}
+        self.children: Dict[str, List[str]] = defaultdict(list)
+        self._loading: Optional[asyncio.Future] = None
+        self._policies: Dict[str, List[InfrahubNode]] = {}
+        self._devices: Dict[str, asyncio.Future] = {}
+        self._fetched_devices: Set[str] = set()
+
+    async def load(self) -> None:
+        # Devices rendered at the same time wait for the same load
+        if self._loading is None:
+            self._loading = asyncio.ensure_future(self._load())
+        await self._loading
+
+    async def _load(self) -> None:
+        generic = await self.client.schema.get(kind="LocationGeneric")
+        results = await asyncio.gather(
+            *(
+                self.client.all(kind=kind, include=["devices"], populate_store=True)
+                for kind in generic.used_by
+            )
         )
-
-    return policies
+        for location in (location for nodes in results for location in nodes):
+            self.locations[location.id] = location
+        for location in self.locations.values():
+            if hasattr(location, "parent") and location.parent.id:
+                self.children[location.parent.id].append(location.id)
+
+        # The policies of the locations are retrieved with a single query
+        policy_ids = [
+            location.policy.id
+            for location in self.locations.values()
+            if hasattr(location, "policy") and location.policy.id
+        ]
+        if policy_ids:
+            await self.client.filters(
+                kind="SecurityPolicy", ids=policy_ids, populate_store=True
+            )
+
+    async def policies(self, location_id: str) -> List[InfrahubNode]:
+        """Policies of the location and its ancestors, from the location up to the root."""
+        await self.load()
+        if location_id not in self._policies:
+            location = self.locations[location_id]
+            policies = []
+            if hasattr(location, "policy") and location.policy.id:
+                policies.append(location.policy.peer)
+            if hasattr(location, "parent") and location.parent.id:
+                policies.extend(await self.policies(location.parent.id))
+            self._policies[location_id] = policies
+        return self._policies[location_id]
+
+    async def devices(self, location_id: str) -> List[InfrahubNode]:
+        """Devices of the location and of all its descendants."""
+        await self.load()
+        if location_id not in self._devices:
+            self._devices[location_id] = asyncio.ensure_future(
+                self._load_devices(location_id=location_id)
+            )
+        return await self._devices[location_id]
+
+    async def _load_devices(self, location_id: str) -> List[InfrahubNode]:
+        peers = []
+        subtree = [location_id]
+        while subtree:
+            location = self.locations[subtree.pop(0)]
+            peers.extend(location.devices.peers)
+            subtree.extend(self.children[location.id])
+
+        # The devices of the subtree not retrieved yet are retrieved with one query per kind
+        ids_per_kind: Dict[str, List[str]] = defaultdict(list)
+        for peer in peers:
+            if peer.id not in self._fetched_devices:
+                ids_per_kind[peer.typename].append(peer.id)
+                self._fetched_devices.add(peer.id)
+        await asyncio.gather(
+            *(
+                self.client.filters(kind=kind, ids=ids, populate_store=True)
+                for kind, ids in ids_per_kind.items()
+            )
+        )
+        return [peer.peer for peer in peers]
 
 
-async def find_policy_targets(policy: InfrahubNode) -> List[InfrahubNode]:
+async def find_policy_targets(
+    policy: InfrahubNode, hierarchy: LocationHierarchy
+) -> List[InfrahubNode]:
     targets = []
 
     if policy.device_target.initialized:
@@ -51,10 +115,7 @@ async def find_policy_targets(policy: InfrahubNode) -> List[InfrahubNode]:
         targets.append(policy.device_target.peer)
 
     if policy.location_target.initialized:
-        await policy.location_target.fetch()
-        targets.extend(
-            await get_devices_from_location_hierarchy(policy.location_target.peer)
-        )
+        targets.extend(await hierarchy.devices(policy.location_target.id))
 
     return targets
 
@@ -71,12 +132,14 @@ async def get_device_security_zones(device: InfrahubNode) -> Set[InfrahubNode]:
     return zones
 
 
-async def find_device_policies(device: InfrahubNode) -> List[InfrahubNode]:
-    await device.location.fetch()
-
+async def find_device_policies(
+    device: InfrahubNode, hierarchy: LocationHierarchy
+) -> List[InfrahubNode]:
     if device.policy.initialized:
         await device.policy.fetch()
-    policies = await get_policies_from_location_hierarchy(device.location.peer)
+    policies = []
+    if device.location.id:
+        policies = list(await hierarchy.policies(device.location.id))
     if device.policy.initialized and device.policy.peer:
         policies.insert(0, device.policy.peer)
     return policies[::-1]
@@ -193,6 +256,41 @@ async def render_policy_for_device(
     await device.save()
 
 
+@dataclass
+class RenderProgress:
+    total: int
+    done: int = 0
+    failed: Dict[str, Exception] = field(default_factory=dict)
+
+    def __str__(self) -> str:
+        return f"{self.done}/{self.total} devices, {len(self.failed)} failed"
+
+
+async def render_device(
+    client: InfrahubClient,
+    log: logging.Logger,
+    device: InfrahubNode,
+    hierarchy: LocationHierarchy,
+    semaphore: asyncio.Semaphore,
+    progress: RenderProgress,
+) -> None:
+    """Renders the policies of a device, a failure is recorded and doesn't stop the other devices."""
+    name = device.name.value
+    async with semaphore:
+        try:
+            policies = await find_device_policies(device, hierarchy)
+            await render_policy_for_device(client, device, policies)
+        except Exception as exc:
+            progress.failed[name] = exc
+        progress.done += 1
+        if name in progress.failed:
+            log.error(
+                f"- Failed to render {name} ({progress}): {progress.failed[name]}"
+            )
+        else:
+            log.info(f"- Rendered {name} ({progress})")
+
+
 async def run(
     client: InfrahubClient, log: logging.Logger, branch: str, **kwargs
 ) -> None:
@@ -200,10 +298,25 @@ async def run(
         raise ValueError("no policy argument provided")
 
     policy_name = kwargs["policy"]
+    concurrency = int(kwargs.get("concurrency", RENDER_CONCURRENCY))
 
     policy = await client.get(kind="SecurityPolicy", name__value=policy_name)
-    targets = await find_policy_targets(policy)
+    hierarchy = LocationHierarchy(client=client)
+    # A device can be targeted directly and through its location, it is only rendered once
+    targets = {
+        target.id: target for target in await find_policy_targets(policy, hierarchy)
+    }
+
+    semaphore = asyncio.Semaphore(concurrency)
+    progress = RenderProgress(total=len(targets))
+    await asyncio.gather(
+        *(
+            render_device(client, log, target, hierarchy, semaphore, progress)
+            for target in targets.values()
+        )
+    )
 
-    for target in targets:
-        policies = await find_device_policies(target)
-        await render_policy_for_device(client, target, policies)
+    if progress.failed:
+        raise RuntimeError(
+            f"Failed to render the policies of {', '.join(sorted(progress.failed))} ({progress})"
+        )
@@ -47,8 +47,13 @@ def load_schema(context: Context, schema: Path = Path("./schemas/*.yml")) -> Non
 
 
 @task
-def load_data(context: Context) -> None:
+def load_data(context: Context, sequential: bool = False) -> None:
+    """Load the bootstrap data, in a single process unless sequential is set."""
     with context.cd(MAIN_DIRECTORY_PATH):
+        if not sequential:
+            context.run("infrahubctl run bootstrap/run_all.py")
+            return
+
         for generator in DATA_GENERATORS:
             context.run(f"infrahubctl run bootstrap/{generator}")
 
@@ -75,6 +80,18 @@ def restart(context: Context, component: str = "") -> None:
         context.run(f"{get_docker_command()} restart")
 
 
+@task
+def benchmark(context: Context, scenarios: str = "", update: bool = False) -> None:
+    """Run the benchmarks (comma separated scenarios) and compare them to the baselines."""
+    exec_cmd = "python -m benchmarks.run"
+    for scenario in filter(None, scenarios.split(",")):
+        exec_cmd += f" --scenario {scenario}"
+    if update:
+        exec_cmd += " --update"
+    with context.cd(MAIN_DIRECTORY_PATH):
+        context.run(exec_cmd)
+
+
 @task
 def format(context: Context) -> None:
     """Run RUFF to format all Python files."""
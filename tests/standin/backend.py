@@ -0,0 +1,927 @@
+import ipaddress
+import re
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from graphql import parse
+from graphql.language import ast as gql
+
+from .schema import SchemaRegistry
+
+
+def _as_list(value: Any) -> List[Any]:
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return value
+    return [value]
+
+
+def _ip_properties(value: Any) -> Dict[str, Any]:
+    """Properties Infrahub computes for the values of the IP host and IP network attributes."""
+    if not isinstance(value, str) or "/" not in value:
+        return {}
+    try:
+        interface = ipaddress.ip_interface(value)
+    except ValueError:
+        return {}
+    network = interface.network
+    return {
+        "ip": str(interface.ip),
+        "prefixlen": network.prefixlen,
+        "netmask": str(network.netmask),
+        "hostmask": str(network.hostmask),
+        "network_address": str(network.network_address),
+        "broadcast_address": str(network.broadcast_address),
+        "num_addresses": network.num_addresses,
+        "version": network.version,
+        "with_hostmask": interface.with_hostmask,
+        "with_netmask": interface.with_netmask,
+    }
+
+
+class StandInError(Exception):
+    """Error returned to the client in the errors of the GraphQL response."""
+
+
+class StoredNode:
+    __slots__ = ("id", "kind", "attributes", "updated_at")
+
+    def __init__(self, node_id: str, kind: str) -> None:
+        self.id = node_id
+        self.kind = kind
+        self.attributes: Dict[str, Dict[str, Any]] = {}
+        # Last change of an attribute or a relationship, for order: {node_metadata}
+        self.updated_at = datetime.now(timezone.utc).isoformat()
+
+
+class MemoryBackend:
+    """Stores nodes and relationships in memory and answers the GraphQL documents the SDK sends."""
+
+    def __init__(self, schema: SchemaRegistry) -> None:
+        self.schema = schema
+        self.nodes: Dict[str, StoredNode] = {}
+        self.by_kind: Dict[str, Dict[str, StoredNode]] = defaultdict(dict)
+        # identifier -> {(source, destination)}; adjacency kept per node for fast lookups
+        self.out_edges: Dict[Tuple[str, str], Set[str]] = defaultdict(set)
+        self.in_edges: Dict[Tuple[str, str], Set[str]] = defaultdict(set)
+        self.pool_allocations: Dict[Tuple[str, str], str] = {}
+        self.stats: Dict[str, int] = defaultdict(int)
+        self.artifact_generate_calls: List[Dict[str, Any]] = []
+        self.edge_props: Dict[Any, Dict[str, Any]] = {}
+        # (kind, attribute) -> normalized value -> node ids, for the uniqueness lookups
+        self.attribute_index: Dict[Tuple[str, str], Dict[Any, Set[str]]] = defaultdict(
+            lambda: defaultdict(set)
+        )
+        self._ensure_default_namespace()
+
+    # ------------------------------------------------------------------ storage
+    def _ensure_default_namespace(self) -> None:
+        node = self._new_node("IpamNamespace")
+        self._set_attribute(node, "name", {"value": "default"})
+        self._set_attribute(node, "default", {"value": True})
+        self.default_namespace = node.id
+
+    def _new_node(self, kind: str, node_id: Optional[str] = None) -> StoredNode:
+        node = StoredNode(node_id or str(uuid.uuid4()), kind)
+        self.nodes[node.id] = node
+        for parent_kind in self.schema.kinds_of(kind):
+            self.by_kind[parent_kind][node.id] = node
+        for attr in self.schema.api[kind]["attributes"]:
+            if attr.get("default_value") is not None:
+                self._set_attribute(
+                    node,
+                    attr["name"],
+                    {"value": attr["default_value"], "is_default": True},
+                )
+        return node
+
+    def _set_attribute(
+        self, node: StoredNode, name: str, stored: Optional[Dict[str, Any]]
+    ) -> None:
+        """Stores an attribute of a node, or removes it when stored is None."""
+        previous = node.attributes.get(name)
+        if stored is not None and "updated_at" not in stored:
+            # Like Infrahub, an attribute set to the same value is left untouched
+            if previous is not None and previous.get("value") == stored.get("value"):
+                stored["updated_at"] = previous.get("updated_at")
+            else:
+                stored["updated_at"] = datetime.now(timezone.utc).isoformat()
+                node.updated_at = stored["updated_at"]
+        for kind in self.schema.kinds_of(node.kind):
+            index = self.attribute_index[(kind, name)]
+            if previous is not None:
+                index[self._normalize(previous.get("value"))].discard(node.id)
+            if stored is not None:
+                index[self._normalize(stored.get("value"))].add(node.id)
+        if stored is None:
+            node.attributes.pop(name, None)
+        else:
+            node.attributes[name] = stored
+
+    def _indexed(self, kind: str, name: str, value: Any) -> List[StoredNode]:
+        """Returns the nodes of a kind whose attribute has the value.
+
+        The nodes without the attribute are not indexed, a None value matches
+        all the nodes of the kind.
+        """
+        if value is None:
+            return list(self.by_kind.get(kind, {}).values())
+        ids = self.attribute_index[(kind, name)].get(self._normalize(value), ())
+        return [self.nodes[node_id] for node_id in ids]
+
+    def _delete_node(self, node_id: str) -> None:
+        node = self.nodes.pop(node_id, None)
+        if not node:
+            return
+        for name in list(node.attributes):
+            self._set_attribute(node, name, None)
+        for parent_kind in self.schema.kinds_of(node.kind):
+            self.by_kind[parent_kind].pop(node_id, None)
+        for (src, ident), dsts in list(self.out_edges.items()):
+            if src == node_id:
+                for dst in dsts:
+                    self.in_edges[(dst, ident)].discard(src)
+                del self.out_edges[(src, ident)]
+        for (dst, ident), srcs in list(self.in_edges.items()):
+            if dst == node_id:
+                for src in srcs:
+                    self.out_edges[(src, ident)].discard(dst)
+                del self.in_edges[(dst, ident)]
+
+    def _peer_ids(self, node: StoredNode, rel: Dict[str, Any]) -> List[str]:
+        ident = rel["identifier"]
+        direction = rel.get("direction", "bidirectional")
+        if rel["name"] in ("ancestors", "descendants") and rel.get("hierarchical"):
+            return self._hierarchy_walk(node.id, upward=rel["name"] == "ancestors")
+        peers: List[str] = []
+        if direction in ("outbound", "bidirectional"):
+            peers.extend(self.out_edges.get((node.id, ident), ()))
+        if direction in ("inbound", "bidirectional"):
+            peers.extend(self.in_edges.get((node.id, ident), ()))
+        peer_kind = rel["peer"]
+        result = []
+        seen = set()
+        for peer_id in peers:
+            if (
+                peer_id in seen
+                or peer_id == node.id
+                and direction == "bidirectional"
+                and rel["peer"] not in self.schema.kinds_of(node.kind)
+            ):
+                continue
+            peer = self.nodes.get(peer_id)
+            if peer and peer_kind in self.schema.kinds_of(peer.kind):
+                seen.add(peer_id)
+                result.append(peer_id)
+        return result
+
+    def _hierarchy_walk(self, node_id: str, upward: bool) -> List[str]:
+        result: List[str] = []
+        frontier = [node_id]
+        while frontier:
+            current = frontier.pop()
+            if upward:
+                nxt = list(self.out_edges.get((current, "parent__child"), ()))
+            else:
+                nxt = list(self.in_edges.get((current, "parent__child"), ()))
+            result.extend(nxt)
+            frontier.extend(nxt)
+        return result
+
+    def _set_relationship(
+        self,
+        node: StoredNode,
+        rel: Dict[str, Any],
+        peer_ids: List[str],
+        replace: bool = True,
+    ) -> None:
+        ident = rel["identifier"]
+        direction = rel.get("direction", "bidirectional")
+        previous = set(self._peer_ids(node, rel))
+        if set(peer_ids) != previous and (replace or set(peer_ids) - previous):
+            node.updated_at = datetime.now(timezone.utc).isoformat()
+        if replace:
+            for peer_id in previous:
+                self._unlink(node.id, peer_id, ident)
+        for peer_id in peer_ids:
+            if direction == "inbound":
+                self.out_edges[(peer_id, ident)].add(node.id)
+                self.in_edges[(node.id, ident)].add(peer_id)
+            else:
+                self.out_edges[(node.id, ident)].add(peer_id)
+                self.in_edges[(peer_id, ident)].add(node.id)
+
+    def _edge_props(
+        self, node: StoredNode, rel: Dict[str, Any], peer_id: str
+    ) -> Dict[str, Any]:
+        ident = rel["identifier"]
+        return (
+            self.edge_props.get((node.id, ident, peer_id))
+            or self.edge_props.get((peer_id, ident, node.id))
+            or {}
+        )
+
+    def _unlink(self, a: str, b: str, ident: str) -> None:
+        self.out_edges[(a, ident)].discard(b)
+        self.in_edges[(b, ident)].discard(a)
+        self.out_edges[(b, ident)].discard(a)
+        self.in_edges[(a, ident)].discard(b)
+
+    # ------------------------------------------------------------------ helpers
+    def _attr_value(self, node: StoredNode, name: str) -> Any:
+        return node.attributes.get(name, {}).get("value")
+
+    def _path_values(self, node: StoredNode, path: List[str]) -> List[Any]:
+        """Resolve a `rel__attr__value` style path to a list of values."""
+        field = self.schema.field(node.kind, path[0])
+        if field is None:
+            return []
+        if field["_type"] == "attribute":
+            if len(path) == 1 or path[1] == "value":
+                return [self._attr_value(node, path[0])]
+            return [node.attributes.get(path[0], {}).get(path[1])]
+        peers = [self.nodes[pid] for pid in self._peer_ids(node, field)]
+        rest = path[1:]
+        if not rest or rest == ["id"]:
+            return [peer.id for peer in peers]
+        values: List[Any] = []
+        for peer in peers:
+            values.extend(self._path_values(peer, rest))
+        return values
+
+    def peers(self, node: StoredNode, name: str) -> List[StoredNode]:
+        """Returns the peers of the relationship of a node."""
+        return [
+            self.nodes[peer_id]
+            for peer_id in self._peer_ids(node, self.schema.field(node.kind, name))
+        ]
+
+    def hfid(self, node: StoredNode) -> Optional[List[str]]:
+        hfid = self.schema.api[node.kind].get("human_friendly_id")
+        if not hfid:
+            return None
+        values = []
+        for item in hfid:
+            found = self._path_values(node, item.split("__"))
+            values.append(str(found[0]) if found and found[0] is not None else None)
+        if any(v is None for v in values):
+            return None
+        return values
+
+    def display_label(self, node: StoredNode) -> str:
+        labels = self.schema.api[node.kind].get("display_labels") or []
+        parts = []
+        for label in labels:
+            found = self._path_values(node, label.split("__"))
+            if found and found[0] is not None:
+                parts.append(str(found[0]))
+        return " ".join(parts) or node.kind
+
+    def _check_filters(self, kind: str, filters: Dict[str, Any]) -> None:
+        """Rejects the filters Infrahub does not generate, they go one relationship deep."""
+        for key in filters:
+            path = key.split("__")
+            field = self.schema.field(kind, path[0])
+            if field is None or field["_type"] != "relationship" or len(path) < 3:
+                continue
+            if field["peer"] not in self.schema.api:
+                continue
+            peer_field = self.schema.field(field["peer"], path[1])
+            if peer_field is not None and peer_field["_type"] == "relationship":
+                raise StandInError(f"Unknown argument '{key}' on field '{kind}'")
+
+    def _matches(self, node: StoredNode, filters: Dict[str, Any]) -> bool:
+        for key, expected in filters.items():
+            if key in ("offset", "limit", "partial_match", "order"):
+                continue
+            if key == "ids":
+                if node.id not in _as_list(expected):
+                    return False
+                continue
+            if key == "hfid":
+                if self.hfid(node) != _as_list(expected):
+                    return False
+                continue
+            if key == "any__value":
+                continue
+            path = key.split("__")
+            suffix = path[-1]
+            if suffix in ("value", "values", "ids", "id"):
+                lookup = path[:-1]
+            else:
+                lookup = path
+            if suffix == "ids" and len(lookup) >= 1:
+                field = self.schema.field(node.kind, lookup[0])
+                if field and field["_type"] == "relationship":
+                    values = (
+                        self._path_values(node, lookup)
+                        if len(lookup) > 1
+                        else self._path_values(node, [lookup[0]])
+                    )
+                    if not set(map(str, values)) & set(map(str, _as_list(expected))):
+                        return False
+                    continue
+            if len(lookup) == 0:
+                return False
+            if len(lookup) == 1:
+                field = self.schema.field(node.kind, lookup[0])
+                if field and field["_type"] == "relationship":
+                    values = self._path_values(node, [lookup[0]])
+                else:
+                    values = self._path_values(node, lookup)
+            else:
+                values = self._path_values(node, lookup)
+            candidates = (
+                _as_list(expected) if suffix in ("values", "ids") else [expected]
+            )
+            normalized = {self._normalize(v) for v in values}
+            if not any(self._normalize(c) in normalized for c in candidates):
+                return False
+        return True
+
+    @staticmethod
+    def _normalize(value: Any) -> Any:
+        if isinstance(value, bool) or value is None:
+            return value
+        if isinstance(value, (int, float)):
+            return str(value)
+        text = str(value)
+        try:
+            if "/" in text:
+                return str(ipaddress.ip_interface(text))
+        except ValueError:
+            pass
+        return text
+
+    # ------------------------------------------------------------------ graphql
+    def execute(
+        self, document: str, variables: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        ast = parse(document)
+        variables = variables or {}
+        result: Dict[str, Any] = {}
+        for definition in ast.definitions:
+            if not isinstance(definition, gql.OperationDefinitionNode):
+                continue
+            for field in definition.selection_set.selections:
+                name = field.name.value
+                alias = field.alias.value if field.alias else name
+                args = {
+                    arg.name.value: self._value(arg.value, variables)
+                    for arg in field.arguments
+                }
+                if definition.operation == gql.OperationType.MUTATION:
+                    self.stats["mutation"] += 1
+                    self.stats[f"m:{name}"] += 1
+                    result[alias] = self._mutation(
+                        name, args, field.selection_set, variables
+                    )
+                else:
+                    self.stats["query"] += 1
+                    self.stats[f"q:{name}"] += 1
+                    result[alias] = self._query(name, args, field.selection_set)
+        return result
+
+    def _value(self, node: gql.ValueNode, variables: Dict[str, Any]) -> Any:
+        if isinstance(node, gql.VariableNode):
+            return variables.get(node.name.value)
+        if isinstance(node, gql.IntValueNode):
+            return int(node.value)
+        if isinstance(node, gql.FloatValueNode):
+            return float(node.value)
+        if isinstance(node, gql.BooleanValueNode):
+            return node.value
+        if isinstance(node, gql.NullValueNode):
+            return None
+        if isinstance(node, (gql.StringValueNode, gql.EnumValueNode)):
+            return node.value
+        if isinstance(node, gql.ListValueNode):
+            return [self._value(item, variables) for item in node.values]
+        if isinstance(node, gql.ObjectValueNode):
+            return {f.name.value: self._value(f.value, variables) for f in node.fields}
+        raise StandInError(f"Unsupported value {node}")
+
+    def _query(
+        self, name: str, args: Dict[str, Any], selection: gql.SelectionSetNode
+    ) -> Any:
+        if name == "InfrahubStatus":
+            return {"summary": {"schema_hash_synced": True}}
+        if name == "InfrahubInfo":
+            return {"version": "1.4.0"}
+        if name not in self.schema.api:
+            raise StandInError(f"Unknown query field {name}")
+        self._check_filters(name, args)
+        nodes = [
+            n for n in self.by_kind.get(name, {}).values() if self._matches(n, args)
+        ]
+        order = (args.get("order") or {}).get("node_metadata") or {}
+        if order.get("updated_at"):
+            nodes.sort(
+                key=lambda n: n.updated_at, reverse=order["updated_at"] == "DESC"
+            )
+        count = len(nodes)
+        offset = args.get("offset") or 0
+        limit = args.get("limit")
+        page = nodes[offset : offset + limit] if limit else nodes[offset:]
+        response: Dict[str, Any] = {}
+        for sel in selection.selections:
+            key = sel.alias.value if sel.alias else sel.name.value
+            if sel.name.value == "count":
+                response[key] = count
+            elif sel.name.value == "edges":
+                response[key] = [self._edge(n, sel.selection_set) for n in page]
+        return response
+
+    def _edge(
+        self,
+        node: StoredNode,
+        selection: gql.SelectionSetNode,
+        properties: Optional[Dict] = None,
+    ) -> Dict[str, Any]:
+        data: Dict[str, Any] = {}
+        for sel in selection.selections:
+            key = sel.alias.value if sel.alias else sel.name.value
+            if sel.name.value == "node":
+                data[key] = self._render(node, sel.selection_set)
+            elif sel.name.value == "properties":
+                data[key] = self._properties(properties or {}, sel.selection_set)
+        return data
+
+    def _properties(
+        self, props: Dict[str, Any], selection: Optional[gql.SelectionSetNode]
+    ) -> Dict[str, Any]:
+        data: Dict[str, Any] = {}
+        if not selection:
+            return data
+        for sel in selection.selections:
+            key = sel.alias.value if sel.alias else sel.name.value
+            name = sel.name.value
+            if name in ("source", "owner"):
+                ref = props.get(name)
+                data[key] = (
+                    self._render(self.nodes[ref], sel.selection_set)
+                    if ref in self.nodes
+                    else None
+                )
+            else:
+                data[key] = props.get(name, False if name.startswith("is_") else None)
+        return data
+
+    def _render(
+        self, node: StoredNode, selection: Optional[gql.SelectionSetNode]
+    ) -> Dict[str, Any]:
+        data: Dict[str, Any] = {}
+        if selection is None:
+            return data
+        for sel in selection.selections:
+            if isinstance(sel, gql.InlineFragmentNode):
+                if sel.type_condition.name.value in self.schema.kinds_of(node.kind):
+                    data.update(self._render(node, sel.selection_set))
+                continue
+            name = sel.name.value
+            key = sel.alias.value if sel.alias else name
+            if name == "id":
+                data[key] = node.id
+            elif name == "__typename":
+                data[key] = node.kind
+            elif name == "hfid":
+                data[key] = self.hfid(node)
+            elif name == "display_label":
+                data[key] = self.display_label(node)
+            elif name in ("kind", "identifier"):
+                data[key] = node.kind if name == "kind" else None
+            else:
+                field = self.schema.field(node.kind, name)
+                if field is None:
+                    data[key] = None
+                elif field["_type"] == "attribute":
+                    stored = node.attributes.get(name, {"value": None})
+                    data[key] = (
+                        self._properties(
+                            {
+                                "is_default": False,
+                                "is_from_profile": False,
+                                **_ip_properties(stored.get("value")),
+                                **stored,
+                            },
+                            sel.selection_set,
+                        )
+                        if sel.selection_set
+                        else stored.get("value")
+                    )
+                elif field["cardinality"] == "one":
+                    peer_ids = self._peer_ids(node, field)
+                    if not peer_ids:
+                        data[key] = None
+                    else:
+                        data[key] = self._edge(
+                            self.nodes[peer_ids[0]],
+                            sel.selection_set,
+                            self._edge_props(node, field, peer_ids[0]),
+                        )
+                else:
+                    peer_ids = self._peer_ids(node, field)
+                    rel_data: Dict[str, Any] = {}
+                    for sub in sel.selection_set.selections:
+                        sub_key = sub.alias.value if sub.alias else sub.name.value
+                        if sub.name.value == "count":
+                            rel_data[sub_key] = len(peer_ids)
+                        elif sub.name.value == "edges":
+                            rel_data[sub_key] = [
+                                self._edge(
+                                    self.nodes[p],
+                                    sub.selection_set,
+                                    self._edge_props(node, field, p),
+                                )
+                                for p in peer_ids
+                            ]
+                    data[key] = rel_data
+        return data
+
+    # ---------------------------------------------------------------- mutations
+    def _mutation(
+        self,
+        name: str,
+        args: Dict[str, Any],
+        selection: Optional[gql.SelectionSetNode],
+        variables: Dict[str, Any],
+    ) -> Any:
+        data = args.get("data") or {}
+        if name in ("RelationshipAdd", "RelationshipRemove"):
+            node = self.nodes[data["id"]]
+            field = self.schema.field(node.kind, data["name"])
+            peers = [item["id"] for item in data.get("nodes", [])]
+            if name == "RelationshipAdd":
+                self._set_relationship(node, field, peers, replace=False)
+            else:
+                for peer in peers:
+                    self._unlink(node.id, peer, field["identifier"])
+            return {"ok": True}
+        if name == "IPPrefixPoolGetResource":
+            node = self._allocate_prefix(data)
+            return {
+                "ok": True,
+                "node": {
+                    "id": node.id,
+                    "kind": node.kind,
+                    "identifier": data.get("identifier"),
+                    "display_label": self.display_label(node),
+                },
+            }
+        if name == "IPAddressPoolGetResource":
+            node = self._allocate_address(data)
+            return {
+                "ok": True,
+                "node": {
+                    "id": node.id,
+                    "kind": node.kind,
+                    "identifier": data.get("identifier"),
+                    "display_label": self.display_label(node),
+                },
+            }
+
+        match = re.match(
+            r"^(?P<kind>[A-Z]\w+?)(?P<action>Create|Upsert|Update|Delete)$", name
+        )
+        if not match or match.group("kind") not in self.schema.nodes:
+            raise StandInError(f"Unknown mutation {name}")
+        kind, action = match.group("kind"), match.group("action")
+        if action == "Delete":
+            self._delete_node(data["id"])
+            return {"ok": True}
+
+        existing = self._find_existing(kind, data)
+        if action == "Create" and existing is not None:
+            raise StandInError(
+                f"An object already exist with this value: {kind} {self.display_label(existing)}"
+            )
+        if action == "Update" and existing is None:
+            raise StandInError(
+                f"Unable to find the node {data.get('id') or data.get('hfid')} / {kind}"
+            )
+        node = existing or self._new_node(kind, None)
+        self._apply(node, data)
+        self.stats[f"{kind}.{action}"] += 1
+        response: Dict[str, Any] = {"ok": True, "object": {"id": node.id}}
+        if selection is not None:
+            for sel in selection.selections:
+                if sel.name.value == "object" and sel.selection_set:
+                    response["object"] = self._render(node, sel.selection_set)
+                    response["object"]["id"] = node.id
+        return response
+
+    def _find_existing(self, kind: str, data: Dict[str, Any]) -> Optional[StoredNode]:
+        if data.get("id"):
+            node = self.nodes.get(data["id"])
+            if node:
+                return node
+        candidates = self.by_kind.get(kind, {})
+        schema = self.schema.api[kind]
+        if data.get("hfid"):
+            for node in candidates.values():
+                if self.hfid(node) == [str(v) for v in data["hfid"]]:
+                    return node
+        # unique attributes
+        for attr in schema["attributes"]:
+            if attr.get("unique") and attr["name"] in data:
+                wanted = self._input_value(data[attr["name"]])
+                for node in self._indexed(kind, attr["name"], wanted):
+                    if node.kind == kind and self._normalize(
+                        self._attr_value(node, attr["name"])
+                    ) == self._normalize(wanted):
+                        return node
+        # uniqueness constraints / hfid built from input
+        constraints = list(schema.get("uniqueness_constraints") or [])
+        if schema.get("human_friendly_id"):
+            constraints.append(schema["human_friendly_id"])
+        for constraint in constraints:
+            wanted: Dict[str, Any] = {}
+            ok = True
+            for item in constraint:
+                parts = item.split("__")
+                if parts[0] not in data and parts[0] not in ("ip_namespace",):
+                    ok = False
+                    break
+                wanted[item] = data.get(parts[0])
+            if not ok:
+                continue
+            # Only the nodes sharing the value of an attribute of the constraint
+            # can match it
+            nodes: Iterable[StoredNode] = candidates.values()
+            for item, value in wanted.items():
+                field = self.schema.field(kind, item.split("__")[0])
+                if (
+                    field is not None
+                    and field["_type"] == "attribute"
+                    and self._input_value(value) is not None
+                ):
+                    nodes = self._indexed(kind, field["name"], self._input_value(value))
+                    break
+            for node in nodes:
+                if all(
+                    self._constraint_match(node, item, value)
+                    for item, value in wanted.items()
+                ):
+                    return node
+        return None
+
+    def _constraint_match(self, node: StoredNode, item: str, value: Any) -> bool:
+        parts = item.split("__")
+        field = self.schema.field(node.kind, parts[0])
+        if field is None:
+            return False
+        if field["_type"] == "attribute":
+            return self._normalize(self._attr_value(node, parts[0])) == self._normalize(
+                self._input_value(value)
+            )
+        current = self._peer_ids(node, field)
+        if value is None:
+            if parts[0] == "ip_namespace":
+                return self.default_namespace in current or not current
+            return not current
+        target = self._resolve_ref(value, field["peer"])
+        if len(parts) > 1 and parts[1] != "ids":
+            if target is None:
+                return False
+            return bool(set(current) & {target})
+        return target in current
+
+    @staticmethod
+    def _input_value(value: Any) -> Any:
+        if isinstance(value, dict):
+            return value.get("value")
+        return value
+
+    def _resolve_ref(self, ref: Any, peer_kind: str) -> Optional[str]:
+        if ref is None:
+            return None
+        if isinstance(ref, str):
+            if ref in self.nodes:
+                return ref
+            for node in self.by_kind.get(peer_kind, {}).values():
+                if self.hfid(node) == [ref] or self.display_label(node) == ref:
+                    return node.id
+            return None
+        if isinstance(ref, dict):
+            if ref.get("id"):
+                return ref["id"] if ref["id"] in self.nodes else None
+            if ref.get("hfid"):
+                kind = ref.get("kind") or peer_kind
+                for node in self.by_kind.get(kind, {}).values():
+                    if self.hfid(node) == [str(v) for v in ref["hfid"]]:
+                        return node.id
+        return None
+
+    def _apply(self, node: StoredNode, data: Dict[str, Any]) -> None:
+        for key, value in data.items():
+            if key in ("id", "hfid"):
+                continue
+            field = self.schema.field(node.kind, key)
+            if field is None:
+                continue
+            if field["_type"] == "attribute":
+                if isinstance(value, dict):
+                    if "from_pool" in value:
+                        stored = {
+                            "value": self._allocate_number(
+                                value["from_pool"]["id"], node
+                            )
+                        }
+                    else:
+                        stored = {k: v for k, v in value.items()}
+                else:
+                    stored = {"value": value}
+                if field["kind"] in ("IPNetwork",) and stored.get("value") is not None:
+                    stored["value"] = str(
+                        ipaddress.ip_network(stored["value"], strict=False)
+                    )
+                if field["kind"] in ("IPHost",) and stored.get("value") is not None:
+                    stored["value"] = str(ipaddress.ip_interface(stored["value"]))
+                stored["is_default"] = False
+                self._set_attribute(node, key, stored)
+            else:
+                refs = (
+                    value
+                    if isinstance(value, list)
+                    else ([value] if value is not None else [])
+                )
+                peer_ids = []
+                for ref in refs:
+                    if isinstance(ref, dict) and "from_pool" in ref:
+                        allocated = self._allocate_from_pool_ref(
+                            ref["from_pool"]["id"], node
+                        )
+                        peer_ids.append(allocated)
+                        continue
+                    resolved = self._resolve_ref(ref, field["peer"])
+                    if resolved is None:
+                        if (
+                            isinstance(ref, dict)
+                            and not ref.get("id")
+                            and not ref.get("hfid")
+                        ):
+                            continue
+                        raise StandInError(
+                            f"Unable to find the node {ref} for {node.kind}.{key}"
+                        )
+                    peer_ids.append(resolved)
+                    if isinstance(ref, dict):
+                        props = {
+                            k[len("_relation__") :]: v
+                            for k, v in ref.items()
+                            if k.startswith("_relation__")
+                        }
+                        self.edge_props[(node.id, field["identifier"], resolved)] = (
+                            props
+                        )
+                self._set_relationship(node, field, peer_ids, replace=True)
+        if "BuiltinIPPrefix" in self.schema.kinds_of(
+            node.kind
+        ) or "BuiltinIPAddress" in self.schema.kinds_of(node.kind):
+            field = self.schema.field(node.kind, "ip_namespace")
+            if not self._peer_ids(node, field):
+                self._set_relationship(node, field, [self.default_namespace])
+            if "BuiltinIPAddress" in self.schema.kinds_of(node.kind):
+                self._link_address_prefix(node)
+
+    def _link_address_prefix(self, node: StoredNode) -> None:
+        address = ipaddress.ip_interface(self._attr_value(node, "address"))
+        best = None
+        for prefix in self.by_kind.get("BuiltinIPPrefix", {}).values():
+            network = ipaddress.ip_network(self._attr_value(prefix, "prefix"))
+            if address.ip in network and (best is None or network.prefixlen > best[0]):
+                best = (network.prefixlen, prefix.id)
+        field = self.schema.field(node.kind, "ip_prefix")
+        if best:
+            self._set_relationship(node, field, [best[1]])
+
+    # ------------------------------------------------------------------ pools
+    def _used_networks(self) -> List[ipaddress._BaseNetwork]:
+        return [
+            ipaddress.ip_network(self._attr_value(p, "prefix"))
+            for p in self.by_kind.get("BuiltinIPPrefix", {}).values()
+        ]
+
+    def _allocate_prefix(self, data: Dict[str, Any]) -> StoredNode:
+        pool = self.nodes[data["id"]]
+        key = (pool.id, data.get("identifier") or str(uuid.uuid4()))
+        if key in self.pool_allocations and self.pool_allocations[key] in self.nodes:
+            return self.nodes[self.pool_allocations[key]]
+        length = data.get("prefix_length") or self._attr_value(
+            pool, "default_prefix_length"
+        )
+        kind = (
+            data.get("prefix_type")
+            or self._attr_value(pool, "default_prefix_type")
+            or "InfraPrefix"
+        )
+        used = self._used_networks()
+        resources = self._peer_ids(pool, self.schema.field(pool.kind, "resources"))
+        for resource_id in resources:
+            resource = ipaddress.ip_network(
+                self._attr_value(self.nodes[resource_id], "prefix")
+            )
+            for candidate in resource.subnets(new_prefix=int(length)):
+                if any(
+                    candidate.overlaps(u)
+                    and u != resource
+                    and u.prefixlen >= resource.prefixlen
+                    for u in used
+                ):
+                    continue
+                node = self._new_node(kind)
+                payload = dict(data.get("data") or {})
+                payload["prefix"] = str(candidate)
+                if data.get("member_type"):
+                    payload["member_type"] = data["member_type"]
+                self._apply(node, payload)
+                self.pool_allocations[key] = node.id
+                return node
+        raise StandInError(f"No more resources in pool {self.display_label(pool)}")
+
+    def _allocate_address(self, data: Dict[str, Any]) -> StoredNode:
+        pool = self.nodes[data["id"]]
+        key = (pool.id, data.get("identifier") or str(uuid.uuid4()))
+        if key in self.pool_allocations and self.pool_allocations[key] in self.nodes:
+            return self.nodes[self.pool_allocations[key]]
+        node_id = self._allocate_from_pool_ref(pool.id, None, payload=data.get("data"))
+        self.pool_allocations[key] = node_id
+        return self.nodes[node_id]
+
+    def _allocate_from_pool_ref(
+        self, pool_id: str, owner: Optional[StoredNode], payload: Optional[Dict] = None
+    ) -> str:
+        pool = self.nodes[pool_id]
+        if pool.kind == "CoreIPPrefixPool":
+            return self._allocate_prefix({"id": pool_id, "data": payload}).id
+        kind = self._attr_value(pool, "default_address_type") or "InfraIPAddress"
+        used = {
+            str(ipaddress.ip_interface(self._attr_value(a, "address")).ip)
+            for a in self.by_kind.get("BuiltinIPAddress", {}).values()
+        }
+        length = self._attr_value(pool, "default_prefix_length")
+        for resource_id in self._peer_ids(
+            pool, self.schema.field(pool.kind, "resources")
+        ):
+            network = ipaddress.ip_network(
+                self._attr_value(self.nodes[resource_id], "prefix")
+            )
+            for host in network.hosts():
+                if str(host) in used:
+                    continue
+                node = self._new_node(kind)
+                data = dict(payload or {})
+                data["address"] = f"{host}/{length or network.prefixlen}"
+                self._apply(node, data)
+                return node.id
+        raise StandInError(f"No more resources in pool {self.display_label(pool)}")
+
+    def _allocate_number(self, pool_id: str, owner: StoredNode) -> int:
+        pool = self.nodes[pool_id]
+        kind = self._attr_value(pool, "node")
+        attribute = self._attr_value(pool, "node_attribute")
+        used = {
+            self._attr_value(n, attribute)
+            for n in self.by_kind.get(kind, {}).values()
+            if n.id != owner.id
+        }
+        for number in range(
+            int(self._attr_value(pool, "start_range")),
+            int(self._attr_value(pool, "end_range")) + 1,
+        ):
+            if number not in used:
+                return number
+        raise StandInError(f"No more resources in pool {self.display_label(pool)}")
+
+    # -------------------------------------------------------------------- http
+    def handle(
+        self, method: str, path: str, payload: Optional[Dict[str, Any]]
+    ) -> Tuple[int, Dict[str, Any]]:
+        if path.startswith("/api/schema/summary"):
+            return 200, {"main": "standin-schema", "nodes": {}, "generics": {}}
+        if path.startswith("/api/schema/load"):
+            return 200, {
+                "hash": "standin-schema",
+                "previous_hash": "standin-schema",
+                "diff": {},
+            }
+        if path.startswith("/api/schema"):
+            return 200, self.schema.payload()
+        if path.startswith("/api/artifact/generate/"):
+            self.artifact_generate_calls.append(
+                {
+                    "definition": path.rsplit("/", 1)[-1],
+                    "nodes": (payload or {}).get("nodes", []),
+                }
+            )
+            return 200, {}
+        if path.startswith("/graphql"):
+            try:
+                data = self.execute(payload["query"], payload.get("variables"))
+            except StandInError as exc:
+                return 200, {"data": None, "errors": [{"message": str(exc)}]}
+            return 200, {"data": data}
+        return 404, {"errors": [{"message": f"{path} not found"}]}
@@ -0,0 +1,48 @@
+import os
+import random
+import sys
+from pathlib import Path
+
+import pytest
+from infrahub_sdk import Config, InfrahubClient
+
+from .backend import MemoryBackend
+from .requester import RecordedResponses, StandInRequester
+from .schema import SchemaRegistry
+
+PROJECT_DIRECTORY = Path(__file__).parent.parent.parent
+
+# Latency (in seconds) added to each request sent to the stand-in
+LATENCY_ENV = "INFRAHUB_STANDIN_LATENCY"
+
+# JSON file with the responses recorded from an Infrahub instance
+RECORDING_ENV = "INFRAHUB_STANDIN_RECORDING"
+
+# The bootstrap scripts and the generators are executed by `infrahubctl run`, which
+# puts their directory on the path; do the same so that they can be imported here.
+sys.path.append(str(PROJECT_DIRECTORY / "bootstrap"))
+sys.path.append(str(PROJECT_DIRECTORY / "generators"))
+
+
+@pytest.fixture
+def backend() -> MemoryBackend:
+    return MemoryBackend(SchemaRegistry([PROJECT_DIRECTORY / "schemas"]))
+
+
+@pytest.fixture
+def requester(backend: MemoryBackend) -> StandInRequester:
+    recording = os.getenv(RECORDING_ENV)
+    return StandInRequester(
+        backend=backend,
+        latency=float(os.getenv(LATENCY_ENV, "0")),
+        recorded=RecordedResponses(Path(recording)) if recording else None,
+    )
+
+
+@pytest.fixture
+def client(requester: StandInRequester) -> InfrahubClient:
+    # The locations are built with random values
+    random.seed(0)
+    return InfrahubClient(
+        config=Config(address="http://standin", requester=requester, api_token="x")
+    )
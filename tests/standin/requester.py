@@ -0,0 +1,145 @@
+import asyncio
+import hashlib
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from .backend import MemoryBackend
+
+# The stand-in plugs into the SDK as the requester of the client configuration:
+#
+#   backend = MemoryBackend(SchemaRegistry([Path("schemas")]))
+#   client = InfrahubClient(config=Config(address="http://standin", requester=StandInRequester(backend)))
+#
+# Queries recorded from an Infrahub instance with a RecordingRequester are
+# answered from the recording, everything else is answered by the backend.
+
+
+def _is_mutation(payload: Optional[Dict[str, Any]]) -> bool:
+    return (payload or {}).get("query", "").lstrip().startswith("mutation")
+
+
+class RecordedResponses:
+    """Responses of an Infrahub instance, indexed by request and kept in a JSON file."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.responses: Dict[str, Dict[str, Any]] = {}
+        if path.exists():
+            self.responses = json.loads(path.read_text())
+
+    @staticmethod
+    def key(method: str, url: str, payload: Optional[Dict[str, Any]]) -> str:
+        request = json.dumps(
+            [method.upper(), httpx.URL(url).path, payload], sort_keys=True
+        ).encode()
+        return hashlib.sha256(request).hexdigest()
+
+    def get(
+        self, method: str, url: str, payload: Optional[Dict[str, Any]]
+    ) -> Optional[Dict[str, Any]]:
+        return self.responses.get(self.key(method=method, url=url, payload=payload))
+
+    def add(
+        self,
+        method: str,
+        url: str,
+        payload: Optional[Dict[str, Any]],
+        status_code: int,
+        body: Any,
+    ) -> None:
+        self.responses[self.key(method=method, url=url, payload=payload)] = {
+            "status_code": status_code,
+            "body": body,
+        }
+
+    def save(self) -> None:
+        self.path.write_text(json.dumps(self.responses, indent=2, sort_keys=True))
+
+
+class StandInRequester:
+    """Requester answering the requests of an InfrahubClient from a MemoryBackend.
+
+    Each request waits for the latency (in seconds) first, so that fewer round
+    trips show up as a shorter run.
+    """
+
+    def __init__(
+        self,
+        backend: MemoryBackend,
+        latency: float = 0.0,
+        recorded: Optional[RecordedResponses] = None,
+    ) -> None:
+        self.backend = backend
+        self.latency = latency
+        self.recorded = recorded
+        self.requests: List[Tuple[str, str]] = []
+
+    async def __call__(
+        self,
+        url: str,
+        method: Any,
+        headers: Dict[str, Any],
+        timeout: int,
+        payload: Optional[Dict] = None,
+    ) -> httpx.Response:
+        method_name = getattr(method, "value", method)
+        request = httpx.Request(
+            method=method_name,
+            url=url,
+            headers=headers,
+            content=json.dumps(payload).encode() if payload else None,
+        )
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.requests.append((method_name, request.url.path))
+
+        recorded = None
+        if self.recorded and not _is_mutation(payload):
+            recorded = self.recorded.get(method=method_name, url=url, payload=payload)
+        if recorded:
+            status_code, body = recorded["status_code"], recorded["body"]
+        else:
+            status_code, body = self.backend.handle(
+                method=method_name, path=request.url.path, payload=payload
+            )
+        return httpx.Response(
+            status_code=status_code, content=json.dumps(body).encode(), request=request
+        )
+
+
+class RecordingRequester:
+    """Requester sending the requests to Infrahub and recording the responses of the queries."""
+
+    def __init__(self, recorded: RecordedResponses, verify: bool = True) -> None:
+        self.recorded = recorded
+        self.verify = verify
+
+    async def __call__(
+        self,
+        url: str,
+        method: Any,
+        headers: Dict[str, Any],
+        timeout: int,
+        payload: Optional[Dict] = None,
+    ) -> httpx.Response:
+        method_name = getattr(method, "value", method)
+        async with httpx.AsyncClient(verify=self.verify) as client:
+            response = await client.request(
+                method=method_name,
+                url=url,
+                headers=headers,
+                timeout=timeout,
+                json=payload,
+            )
+        if response.status_code == 200 and not _is_mutation(payload):
+            self.recorded.add(
+                method=method_name,
+                url=url,
+                payload=payload,
+                status_code=response.status_code,
+                body=response.json(),
+            )
+        return response
@@ -0,0 +1,573 @@
+import copy
+import uuid
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+import yaml
+
+# Minimal core schema of Infrahub, enough for the kinds of schemas/*.yml and
+# for what the bootstrap scripts and the generator use.
+
+CORE_GENERICS: List[Dict[str, Any]] = [
+    {"namespace": "Core", "name": "Node", "attributes": [], "relationships": []},
+    {"namespace": "Lineage", "name": "Owner", "attributes": [], "relationships": []},
+    {"namespace": "Lineage", "name": "Source", "attributes": [], "relationships": []},
+    {
+        "namespace": "Core",
+        "name": "Group",
+        "human_friendly_id": ["name__value"],
+        "attributes": [
+            {"name": "name", "kind": "Text", "unique": True},
+            {"name": "label", "kind": "Text", "optional": True},
+            {"name": "description", "kind": "Text", "optional": True},
+            {
+                "name": "group_type",
+                "kind": "Text",
+                "optional": True,
+                "default_value": "default",
+            },
+        ],
+        "relationships": [
+            {
+                "name": "members",
+                "peer": "CoreNode",
+                "cardinality": "many",
+                "kind": "Generic",
+                "identifier": "group_member",
+            },
+            {
+                "name": "subscribers",
+                "peer": "CoreNode",
+                "cardinality": "many",
+                "kind": "Generic",
+                "identifier": "group_subscriber",
+            },
+        ],
+    },
+    {
+        "namespace": "Core",
+        "name": "ArtifactTarget",
+        "attributes": [],
+        "relationships": [],
+    },
+    {
+        "namespace": "Core",
+        "name": "GenericAccount",
+        "human_friendly_id": ["name__value"],
+        "attributes": [
+            {"name": "name", "kind": "Text", "unique": True},
+            {"name": "password", "kind": "HashedPassword", "optional": True},
+            {"name": "label", "kind": "Text", "optional": True},
+            {"name": "description", "kind": "Text", "optional": True},
+            {
+                "name": "account_type",
+                "kind": "Text",
+                "optional": True,
+                "default_value": "User",
+            },
+            {
+                "name": "status",
+                "kind": "Dropdown",
+                "optional": True,
+                "default_value": "active",
+            },
+        ],
+        "relationships": [],
+    },
+    {
+        "namespace": "Builtin",
+        "name": "IPNamespace",
+        "human_friendly_id": ["name__value"],
+        "attributes": [
+            {"name": "name", "kind": "Text", "unique": True},
+            {"name": "description", "kind": "Text", "optional": True},
+        ],
+        "relationships": [],
+    },
+    {
+        "namespace": "Builtin",
+        "name": "IPPrefix",
+        "attributes": [
+            {"name": "prefix", "kind": "IPNetwork"},
+            {"name": "description", "kind": "Text", "optional": True},
+            {
+                "name": "member_type",
+                "kind": "Dropdown",
+                "optional": True,
+                "default_value": "address",
+            },
+            {
+                "name": "is_pool",
+                "kind": "Boolean",
+                "optional": True,
+                "default_value": False,
+            },
+        ],
+        "relationships": [
+            {
+                "name": "ip_namespace",
+                "peer": "BuiltinIPNamespace",
+                "cardinality": "one",
+                "kind": "Generic",
+                "identifier": "ip_namespace__ip_prefix",
+            },
+            {
+                "name": "ip_addresses",
+                "peer": "BuiltinIPAddress",
+                "cardinality": "many",
+                "kind": "Generic",
+                "read_only": True,
+                "identifier": "ip_prefix__ip_address",
+            },
+        ],
+    },
+    {
+        "namespace": "Builtin",
+        "name": "IPAddress",
+        "attributes": [
+            {"name": "address", "kind": "IPHost"},
+            {"name": "description", "kind": "Text", "optional": True},
+        ],
+        "relationships": [
+            {
+                "name": "ip_namespace",
+                "peer": "BuiltinIPNamespace",
+                "cardinality": "one",
+                "kind": "Generic",
+                "identifier": "ip_namespace__ip_address",
+            },
+            {
+                "name": "ip_prefix",
+                "peer": "BuiltinIPPrefix",
+                "cardinality": "one",
+                "kind": "Generic",
+                "read_only": True,
+                "identifier": "ip_prefix__ip_address",
+            },
+        ],
+    },
+    {
+        "namespace": "Core",
+        "name": "ResourcePool",
+        "human_friendly_id": ["name__value"],
+        "attributes": [
+            {"name": "name", "kind": "Text", "unique": True},
+            {"name": "description", "kind": "Text", "optional": True},
+        ],
+        "relationships": [],
+    },
+]
+
+CORE_NODES: List[Dict[str, Any]] = [
+    {
+        "namespace": "Core",
+        "name": "Account",
+        "inherit_from": ["LineageOwner", "LineageSource", "CoreGenericAccount"],
+        "attributes": [{"name": "role", "kind": "Text", "optional": True}],
+        "relationships": [],
+    },
+    {
+        "namespace": "Core",
+        "name": "StandardGroup",
+        "inherit_from": ["CoreGroup"],
+        "attributes": [],
+        "relationships": [],
+    },
+    {
+        "namespace": "Core",
+        "name": "GeneratorGroup",
+        "inherit_from": ["CoreGroup"],
+        "attributes": [],
+        "relationships": [],
+    },
+    {
+        "namespace": "Builtin",
+        "name": "Tag",
+        "human_friendly_id": ["name__value"],
+        "attributes": [
+            {"name": "name", "kind": "Text", "unique": True},
+            {"name": "description", "kind": "Text", "optional": True},
+        ],
+        "relationships": [],
+    },
+    {
+        "namespace": "Ipam",
+        "name": "Namespace",
+        "inherit_from": ["BuiltinIPNamespace"],
+        "attributes": [{"name": "default", "kind": "Boolean", "optional": True}],
+        "relationships": [],
+    },
+    {
+        "namespace": "Core",
+        "name": "IPPrefixPool",
+        "inherit_from": ["CoreResourcePool", "LineageSource"],
+        "attributes": [
+            {"name": "default_prefix_length", "kind": "Number", "optional": True},
+            {
+                "name": "default_member_type",
+                "kind": "Text",
+                "optional": True,
+                "default_value": "prefix",
+            },
+            {"name": "default_prefix_type", "kind": "Text", "optional": True},
+        ],
+        "relationships": [
+            {
+                "name": "resources",
+                "peer": "BuiltinIPPrefix",
+                "cardinality": "many",
+                "kind": "Attribute",
+                "identifier": "prefixpool__resource",
+            },
+            {
+                "name": "ip_namespace",
+                "peer": "BuiltinIPNamespace",
+                "cardinality": "one",
+                "kind": "Attribute",
+                "identifier": "prefixpool__ipnamespace",
+            },
+        ],
+    },
+    {
+        "namespace": "Core",
+        "name": "IPAddressPool",
+        "inherit_from": ["CoreResourcePool", "LineageSource"],
+        "attributes": [
+            {"name": "default_address_type", "kind": "Text"},
+            {"name": "default_prefix_length", "kind": "Number", "optional": True},
+            {"name": "default_member_type", "kind": "Text", "optional": True},
+        ],
+        "relationships": [
+            {
+                "name": "resources",
+                "peer": "BuiltinIPPrefix",
+                "cardinality": "many",
+                "kind": "Attribute",
+                "identifier": "ipaddresspool__resource",
+            },
+            {
+                "name": "ip_namespace",
+                "peer": "BuiltinIPNamespace",
+                "cardinality": "one",
+                "kind": "Attribute",
+                "identifier": "ipaddresspool__ipnamespace",
+            },
+        ],
+    },
+    {
+        "namespace": "Core",
+        "name": "NumberPool",
+        "inherit_from": ["CoreResourcePool", "LineageSource"],
+        "attributes": [
+            {"name": "node", "kind": "Text"},
+            {"name": "node_attribute", "kind": "Text"},
+            {"name": "start_range", "kind": "Number"},
+            {"name": "end_range", "kind": "Number"},
+        ],
+        "relationships": [],
+    },
+    {
+        "namespace": "Core",
+        "name": "ArtifactDefinition",
+        "human_friendly_id": ["name__value"],
+        "attributes": [
+            {"name": "name", "kind": "Text", "unique": True},
+            {"name": "artifact_name", "kind": "Text"},
+            {"name": "description", "kind": "Text", "optional": True},
+            {"name": "parameters", "kind": "JSON", "optional": True},
+            {"name": "content_type", "kind": "Text"},
+        ],
+        "relationships": [
+            {
+                "name": "targets",
+                "peer": "CoreGroup",
+                "cardinality": "one",
+                "kind": "Attribute",
+                "identifier": "artifact_definition___group",
+            },
+        ],
+    },
+    {
+        "namespace": "Core",
+        "name": "Artifact",
+        "attributes": [
+            {"name": "name", "kind": "Text"},
+            {"name": "status", "kind": "Text", "optional": True},
+            {"name": "storage_id", "kind": "Text", "optional": True},
+        ],
+        "relationships": [
+            {
+                "name": "object",
+                "peer": "CoreArtifactTarget",
+                "cardinality": "one",
+                "kind": "Attribute",
+                "identifier": "artifact__node",
+            },
+            {
+                "name": "definition",
+                "peer": "CoreArtifactDefinition",
+                "cardinality": "one",
+                "kind": "Attribute",
+                "identifier": "artifact__artifact_definition",
+            },
+        ],
+    },
+]
+
+
+class SchemaRegistry:
+    """Turns schemas/*.yml (plus the minimal core schema) into /api/schema payloads."""
+
+    def __init__(self, schema_dirs: List[Path]) -> None:
+        generics: Dict[str, Dict[str, Any]] = {}
+        nodes: Dict[str, Dict[str, Any]] = {}
+        extensions: List[Dict[str, Any]] = []
+
+        for definition in CORE_GENERICS:
+            generics[definition["namespace"] + definition["name"]] = copy.deepcopy(
+                definition
+            )
+        for definition in CORE_NODES:
+            nodes[definition["namespace"] + definition["name"]] = copy.deepcopy(
+                definition
+            )
+
+        for schema_dir in schema_dirs:
+            for path in sorted(Path(schema_dir).glob("*.yml")):
+                content = yaml.safe_load(path.read_text())
+                for definition in content.get("generics", []) or []:
+                    generics[definition["namespace"] + definition["name"]] = (
+                        copy.deepcopy(definition)
+                    )
+                for definition in content.get("nodes", []) or []:
+                    nodes[definition["namespace"] + definition["name"]] = copy.deepcopy(
+                        definition
+                    )
+                extensions.extend(
+                    (content.get("extensions", {}) or {}).get("nodes", []) or []
+                )
+
+        for extension in extensions:
+            target = nodes.get(extension["kind"]) or generics.get(extension["kind"])
+            target.setdefault("attributes", []).extend(extension.get("attributes", []))
+            target.setdefault("relationships", []).extend(
+                extension.get("relationships", [])
+            )
+
+        self.generics = generics
+        self.nodes = nodes
+        self.used_by: Dict[str, List[str]] = defaultdict(list)
+        self.api: Dict[str, Dict[str, Any]] = {}
+        self._build()
+
+    @staticmethod
+    def _identifier(kind: str, rel: Dict[str, Any]) -> str:
+        if rel.get("identifier"):
+            return rel["identifier"]
+        return "__".join(sorted([kind.lower(), rel["peer"].lower()]))
+
+    def _normalize_attr(self, attr: Dict[str, Any], inherited: bool) -> Dict[str, Any]:
+        data = {
+            "name": attr["name"],
+            "kind": attr["kind"],
+            "optional": attr.get("optional", False),
+            "unique": attr.get("unique", False) or False,
+            "default_value": attr.get("default_value"),
+            "inherited": inherited,
+            "read_only": attr.get("read_only", False),
+        }
+        if attr.get("choices"):
+            data["choices"] = attr["choices"]
+        return data
+
+    def _normalize_rel(
+        self, owner_kind: str, rel: Dict[str, Any], inherited: bool
+    ) -> Dict[str, Any]:
+        return {
+            "name": rel["name"],
+            "peer": rel["peer"],
+            "kind": rel.get("kind") or "Generic",
+            "cardinality": rel.get("cardinality") or "many",
+            "optional": rel.get("optional", True),
+            "identifier": self._identifier(owner_kind, rel),
+            "direction": rel.get("direction", "bidirectional"),
+            "inherited": inherited,
+            "read_only": rel.get("read_only", False),
+        }
+
+    def _build(self) -> None:
+        for kind, definition in self.nodes.items():
+            for generic in definition.get("inherit_from", []) or []:
+                self.used_by[generic].append(kind)
+            self.used_by["CoreNode"].append(kind)
+
+        hierarchy_roots = {
+            kind for kind, gen in self.generics.items() if gen.get("hierarchical")
+        }
+
+        for kind, definition in list(self.generics.items()) + list(self.nodes.items()):
+            is_node = kind in self.nodes
+            attributes: List[Dict[str, Any]] = []
+            relationships: List[Dict[str, Any]] = []
+            seen: Set[str] = set()
+            for attr in definition.get("attributes", []) or []:
+                attributes.append(self._normalize_attr(attr, inherited=False))
+                seen.add(attr["name"])
+            for rel in definition.get("relationships", []) or []:
+                relationships.append(self._normalize_rel(kind, rel, inherited=False))
+                seen.add(rel["name"])
+            inherit_from = list(definition.get("inherit_from", []) or [])
+            hfid = definition.get("human_friendly_id")
+            uniqueness = definition.get("uniqueness_constraints")
+            hierarchy = None
+            for generic_kind in inherit_from:
+                generic = self.generics.get(generic_kind, {})
+                if hfid is None and generic.get("human_friendly_id"):
+                    hfid = generic["human_friendly_id"]
+                if uniqueness is None and generic.get("uniqueness_constraints"):
+                    uniqueness = generic["uniqueness_constraints"]
+                if generic_kind in hierarchy_roots:
+                    hierarchy = generic_kind
+                for attr in generic.get("attributes", []) or []:
+                    if attr["name"] not in seen:
+                        attributes.append(self._normalize_attr(attr, inherited=True))
+                        seen.add(attr["name"])
+                for rel in generic.get("relationships", []) or []:
+                    if rel["name"] not in seen:
+                        relationships.append(
+                            self._normalize_rel(generic_kind, rel, inherited=True)
+                        )
+                        seen.add(rel["name"])
+
+            if kind in hierarchy_roots or hierarchy:
+                root = hierarchy or kind
+                parent = definition.get("parent") if is_node else None
+                children = definition.get("children") if is_node else None
+                if "parent" not in seen:
+                    relationships.append(
+                        {
+                            "name": "parent",
+                            "peer": parent or root,
+                            "kind": "Hierarchy",
+                            "cardinality": "one",
+                            "optional": True,
+                            "identifier": "parent__child",
+                            "direction": "outbound",
+                            "inherited": False,
+                            "read_only": False,
+                            "hierarchical": root,
+                        }
+                    )
+                if "children" not in seen:
+                    relationships.append(
+                        {
+                            "name": "children",
+                            "peer": children or root,
+                            "kind": "Hierarchy",
+                            "cardinality": "many",
+                            "optional": True,
+                            "identifier": "parent__child",
+                            "direction": "inbound",
+                            "inherited": False,
+                            "read_only": False,
+                            "hierarchical": root,
+                        }
+                    )
+                for name in ("ancestors", "descendants"):
+                    relationships.append(
+                        {
+                            "name": name,
+                            "peer": root,
+                            "kind": "Hierarchy",
+                            "cardinality": "many",
+                            "optional": True,
+                            "identifier": "parent__child",
+                            "direction": "outbound",
+                            "inherited": False,
+                            "read_only": True,
+                            "hierarchical": root,
+                        }
+                    )
+
+            if (
+                kind != "CoreNode"
+                and "member_of_groups" not in seen
+                and not kind.startswith("Lineage")
+            ):
+                relationships.append(
+                    {
+                        "name": "member_of_groups",
+                        "peer": "CoreGroup",
+                        "kind": "Group",
+                        "cardinality": "many",
+                        "optional": True,
+                        "identifier": "group_member",
+                        "direction": "bidirectional",
+                        "inherited": False,
+                        "read_only": False,
+                    }
+                )
+
+            if hfid is None:
+                uniques = [a["name"] for a in attributes if a.get("unique")]
+                if len(uniques) == 1:
+                    hfid = [f"{uniques[0]}__value"]
+            display_labels = definition.get("display_labels")
+            if display_labels is None and any(a["name"] == "name" for a in attributes):
+                display_labels = ["name__value"]
+            api = {
+                "id": str(uuid.uuid5(uuid.NAMESPACE_OID, kind)),
+                "name": definition["name"],
+                "namespace": definition["namespace"],
+                "label": definition.get("label"),
+                "description": definition.get("description"),
+                "display_labels": display_labels,
+                "human_friendly_id": hfid,
+                "default_filter": definition.get("default_filter")
+                or (
+                    "name__value"
+                    if any(a["name"] == "name" for a in attributes)
+                    else None
+                ),
+                "uniqueness_constraints": uniqueness
+                if is_node
+                else definition.get("uniqueness_constraints"),
+                "attributes": attributes,
+                "relationships": relationships,
+            }
+            if is_node:
+                api["inherit_from"] = inherit_from
+                api["hierarchy"] = hierarchy
+                api["parent"] = definition.get("parent")
+                api["children"] = definition.get("children")
+            else:
+                api["used_by"] = list(self.used_by.get(kind, []))
+            self.api[kind] = api
+
+    def payload(self) -> Dict[str, Any]:
+        return {
+            "main": "standin-schema",
+            "nodes": [self.api[kind] for kind in self.nodes],
+            "generics": [self.api[kind] for kind in self.generics],
+            "profiles": [],
+            "templates": [],
+        }
+
+    def kinds_of(self, kind: str) -> Set[str]:
+        definition = self.nodes.get(kind, {})
+        return {kind, "CoreNode", *(definition.get("inherit_from", []) or [])}
+
+    def concrete(self, kind: str) -> List[str]:
+        if kind in self.nodes:
+            return [kind]
+        return list(self.used_by.get(kind, []))
+
+    def field(self, kind: str, name: str) -> Optional[Dict[str, Any]]:
+        for attr in self.api[kind]["attributes"]:
+            if attr["name"] == name:
+                return dict(attr, _type="attribute")
+        for rel in self.api[kind]["relationships"]:
+            if rel["name"] == name:
+                return dict(rel, _type="relationship")
+        return None
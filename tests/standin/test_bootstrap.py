@@ -0,0 +1,277 @@
+import logging
+import time
+from pathlib import Path
+
+import pytest
+from infrahub_sdk import Config, InfrahubClient
+
+from .backend import MemoryBackend
+from .requester import StandInRequester
+
+LOG = logging.getLogger(__name__)
+
+TOPOLOGY = "fra05-pod1"
+
+STABLE_KINDS = (
+    "LocationGeneric",
+    "InfraVLAN",
+    "InfraPrefix",
+    "InfraIPAddress",
+    "InfraDevice",
+    "InfraInterface",
+    "InfraAutonomousSystem",
+    "InfraBGPPeerGroup",
+    "InfraBGPSession",
+    "TopologyTopology",
+    "SecurityPolicy",
+    "SecurityPolicyRule",
+    "CoreStandardGroup",
+)
+
+
+async def bootstrap(
+    client: InfrahubClient, requester: StandInRequester, **kwargs
+) -> None:
+    import create_basic
+    import create_location
+    import create_security_nodes
+    import create_topology
+    import generate_topology
+
+    for module in (
+        create_basic,
+        create_location,
+        create_topology,
+        create_security_nodes,
+    ):
+        start, before = time.perf_counter(), len(requester.requests)
+        await module.run(client=client, log=LOG, branch="main")
+        LOG.info(
+            f"{module.__name__}: {len(requester.requests) - before} requests in {time.perf_counter() - start:.2f}s"
+        )
+    await generate_topology.run(client=client, log=LOG, branch="main", **kwargs)
+
+
+def group_sizes(backend: MemoryBackend) -> dict:
+    return {
+        group.attributes["name"]["value"]: len(backend.peers(group, "members"))
+        for group in backend.by_kind["CoreStandardGroup"].values()
+    }
+
+
+def node_counts(backend: MemoryBackend) -> dict:
+    return {kind: len(nodes) for kind, nodes in backend.by_kind.items()}
+
+
+async def test_bootstrap_and_generate_topology(
+    client: InfrahubClient, backend: MemoryBackend, requester: StandInRequester
+):
+    await bootstrap(client=client, requester=requester, topology=TOPOLOGY)
+
+    counts = node_counts(backend)
+    topology = next(
+        node
+        for node in backend.by_kind["TopologyTopology"].values()
+        if node.attributes["name"]["value"] == TOPOLOGY
+    )
+    devices = [
+        device
+        for device in backend.by_kind["InfraDevice"].values()
+        if topology in backend.peers(device, "topology")
+    ]
+    assert devices
+    assert all(backend.peers(device, "interfaces") for device in devices)
+    assert counts["SecurityPolicy"] > 0
+    assert counts["InfraBGPSession"] > 0
+
+    # Running everything again finds the data in place
+    sizes = group_sizes(backend)
+    await bootstrap(client=client, requester=requester, topology=TOPOLOGY)
+    rerun_counts = node_counts(backend)
+    for kind in STABLE_KINDS:
+        assert rerun_counts[kind] == counts[kind], kind
+    assert group_sizes(backend) == sizes
+
+    # Once in place, the security nodes are not sent again
+    import create_security_nodes
+
+    mutations = backend.stats["mutation"]
+    await create_security_nodes.run(client=client, log=LOG, branch="main")
+    assert backend.stats["mutation"] == mutations
+
+    # Nor the topology, only its tracking group is upserted with the same members
+    # (the stand-in schema has no dropdown choices, the Client role is added again)
+    import generate_topology
+
+    stats = dict(backend.stats)
+    await generate_topology.run(
+        client=client, log=LOG, branch="main", topology=TOPOLOGY
+    )
+    assert backend.stats["mutation"] - stats["mutation"] == 2
+    assert backend.stats["m:CoreStandardGroupUpsert"] == (
+        stats["m:CoreStandardGroupUpsert"] + 1
+    )
+    assert group_sizes(backend) == sizes
+
+
+async def test_firewall_addresses_are_added(
+    client: InfrahubClient, backend: MemoryBackend, requester: StandInRequester
+):
+    import create_security_nodes
+
+    await bootstrap(client=client, requester=requester, topology=TOPOLOGY)
+    interface = await client.get(
+        kind="SecurityFirewallInterface",
+        name__value="ge-0/0/1",
+        include=["ip_addresses"],
+    )
+    extra = await client.create(kind="InfraIPAddress", address="10.0.1.2/24")
+    await extra.save()
+    interface.ip_addresses.add(extra)
+    await interface.save()
+
+    # The addresses set outside of the bootstrap are left on the interface
+    await create_security_nodes.run(client=client, log=LOG, branch="main")
+    interface = await client.get(
+        kind="SecurityFirewallInterface",
+        name__value="ge-0/0/1",
+        include=["ip_addresses"],
+    )
+    addresses = []
+    for peer in interface.ip_addresses.peers:
+        await peer.fetch()
+        addresses.append(str(peer.peer.address.value))
+    assert sorted(addresses) == ["10.0.1.1/24", "10.0.1.2/24"]
+
+
+async def test_bootstrap_and_generate_all_topologies(
+    client: InfrahubClient, backend: MemoryBackend, requester: StandInRequester
+):
+    # Without topology, the topologies are generated concurrently and share the groups
+    await bootstrap(client=client, requester=requester)
+
+    sizes = group_sizes(backend)
+    # fra05-pod1 is all Arista, de1-pod1 and de2-pod1 have Arista spines and borderleafs
+    assert sizes["arista_devices"] == 4 + 2 + 4
+    assert sizes["cisco_devices"] == 4 + 4
+    # The topology itself is a member of its group too
+    assert sizes["fra05-pod1_topology"] == 4 + 1
+    assert sizes["de1-pod1_topology"] == 6 + 1
+    assert sizes["de2-pod1_topology"] == 8 + 1
+
+
+async def test_reference_snapshot(
+    client: InfrahubClient,
+    backend: MemoryBackend,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    caplog: pytest.LogCaptureFixture,
+):
+    import create_basic
+    from utils import SNAPSHOT_DIRECTORY_ENV, load_reference_data
+
+    await create_basic.run(client=client, log=LOG, branch="main")
+    monkeypatch.setenv(SNAPSHOT_DIRECTORY_ENV, str(tmp_path))
+    kinds = {"InfraPlatform": "name"}
+
+    await load_reference_data(client=client, log=LOG, branch="main", kinds=kinds)
+    with caplog.at_level(logging.INFO):
+        await load_reference_data(client=client, log=LOG, branch="main", kinds=kinds)
+    assert "Reused InfraPlatform" in caplog.text
+
+    # Editing an object invalidates its kind, even if the count is the same
+    platform = await client.get(kind="InfraPlatform", name__value="Arista EOS")
+    platform.description.value = "edited"
+    await platform.save()
+    caplog.clear()
+    with caplog.at_level(logging.INFO):
+        index = await load_reference_data(
+            client=client, log=LOG, branch="main", kinds=kinds
+        )
+    assert "Reused" not in caplog.text
+    assert index.get(key="Arista EOS", kind="InfraPlatform").description.value == (
+        "edited"
+    )
+
+    # As well as removing one
+    caplog.clear()
+    with caplog.at_level(logging.INFO):
+        await load_reference_data(client=client, log=LOG, branch="main", kinds=kinds)
+    assert "Reused InfraPlatform" in caplog.text
+    await platform.delete()
+    caplog.clear()
+    with caplog.at_level(logging.INFO):
+        index = await load_reference_data(
+            client=client, log=LOG, branch="main", kinds=kinds
+        )
+    assert "Reused" not in caplog.text
+    assert index.get(key="Arista EOS", kind="InfraPlatform") is None
+
+
+async def test_regenerate_artifacts_of_incomplete_topology(
+    client: InfrahubClient, backend: MemoryBackend
+):
+    import create_basic
+    import create_location
+    import create_topology
+    import generate_topology
+
+    for module in (create_basic, create_location, create_topology):
+        await module.run(client=client, log=LOG, branch="main")
+    definitions = {}
+    for name, group_name in (
+        ("Startup Config for Arista devices", "arista_devices"),
+        ("Containerlab Topology", "all_topologies"),
+    ):
+        group = await client.get(kind="CoreStandardGroup", name__value=group_name)
+        definition = await client.create(
+            kind="CoreArtifactDefinition",
+            name=name,
+            artifact_name=name,
+            content_type="text/plain",
+            targets=group.id,
+        )
+        await definition.save()
+        definitions[definition.id] = name
+
+    # Without its spines, the leafs of the topology are written but not cabled
+    topology = await client.get(kind="TopologyTopology", name__value=TOPOLOGY)
+    for element in await client.filters(
+        kind="TopologyPhysicalElement", topology__ids=[topology.id]
+    ):
+        if element.device_role.value == "spine":
+            await element.delete()
+    await generate_topology.run(
+        client=client, log=LOG, branch="main", topology=TOPOLOGY
+    )
+
+    targets = {
+        definitions[call["definition"]]: call["nodes"]
+        for call in backend.artifact_generate_calls
+    }
+    assert targets["Containerlab Topology"] == [topology.id]
+    leafs = [
+        device.id
+        for device in backend.by_kind["InfraDevice"].values()
+        if device.attributes["role"]["value"] == "leaf"
+    ]
+    assert leafs
+    assert sorted(targets["Startup Config for Arista devices"]) == sorted(leafs)
+
+
+async def test_dry_run_doesnt_use_infrahub(caplog: pytest.LogCaptureFixture):
+    import generate_topology
+
+    async def requester(**kwargs):
+        raise AssertionError("The dry run doesn't send anything to Infrahub")
+
+    client = InfrahubClient(
+        config=Config(address="http://infrahub", requester=requester, api_token="x")
+    )
+    with caplog.at_level(logging.INFO):
+        await generate_topology.run(
+            client=client, log=LOG, branch="main", topology=TOPOLOGY, dry_run="true"
+        )
+
+    assert "devices: " in caplog.text
+    assert "Estimated wall time" in caplog.text
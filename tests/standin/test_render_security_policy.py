@@ -0,0 +1,42 @@
+import logging
+
+from infrahub_sdk import InfrahubClient
+
+from .requester import StandInRequester
+
+LOG = logging.getLogger(__name__)
+
+
+async def test_location_hierarchy_is_fetched_once(
+    client: InfrahubClient, requester: StandInRequester
+):
+    import create_basic
+    import create_location
+    import create_security_nodes
+    from render_security_policy import LocationHierarchy, find_device_policies
+
+    for module in (create_basic, create_location, create_security_nodes):
+        await module.run(client=client, log=LOG, branch="main")
+    firewall = await client.get(kind="SecurityFirewall", name__value="fra-fw1")
+
+    hierarchy = LocationHierarchy(client=client)
+    await hierarchy.load()
+    frankfurt = hierarchy.locations[firewall.location.id]
+    root = frankfurt
+    while root.parent.id:
+        root = hierarchy.locations[root.parent.id]
+
+    devices = await hierarchy.devices(root.id)
+    assert "fra-fw1" in [device.name.value for device in devices]
+
+    # Everything below is served from the memoized tree
+    before = len(requester.requests)
+    assert await hierarchy.devices(root.id) == devices
+    assert [device.id for device in await hierarchy.devices(frankfurt.id)] == [
+        firewall.id
+    ]
+    assert await hierarchy.policies(frankfurt.id) == []
+    assert len(requester.requests) == before
+
+    policies = await find_device_policies(firewall, hierarchy)
+    assert [policy.name.value for policy in policies] == ["FRA_FW1_POLICY"]
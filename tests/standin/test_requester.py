@@ -0,0 +1,47 @@
+from pathlib import Path
+
+import pytest
+
+from infrahub_sdk import Config, InfrahubClient
+from infrahub_sdk.exceptions import GraphQLError
+
+from .backend import MemoryBackend
+from .requester import RecordedResponses, StandInRequester
+
+INFO_QUERY = "query { InfrahubInfo { version }}"
+
+
+async def test_recorded_responses_are_replayed(tmp_path: Path, backend: MemoryBackend):
+    url = "http://standin/graphql/main"
+    recorded = RecordedResponses(path=tmp_path / "recording.json")
+    recorded.add(
+        method="POST",
+        url=url,
+        payload={"query": INFO_QUERY},
+        status_code=200,
+        body={"data": {"InfrahubInfo": {"version": "1.5.0"}}},
+    )
+    recorded.save()
+
+    requester = StandInRequester(
+        backend=backend, recorded=RecordedResponses(path=tmp_path / "recording.json")
+    )
+    client = InfrahubClient(
+        config=Config(address="http://standin", requester=requester, api_token="x")
+    )
+
+    # Recorded
+    assert await client.get_version() == "1.5.0"
+    # Not recorded, answered by the backend
+    tag = await client.create(kind="BuiltinTag", name="red")
+    await tag.save()
+    assert [node.name.value for node in await client.all(kind="BuiltinTag")] == ["red"]
+    assert len(requester.requests) == 4
+
+
+async def test_filters_go_one_relationship_deep(client: InfrahubClient):
+    query = 'query { InfraIPAddress(%s: ["1234"]) { count }}'
+    data = await client.execute_graphql(query=query % "interface__ids")
+    assert data["InfraIPAddress"]["count"] == 0
+    with pytest.raises(GraphQLError):
+        await client.execute_graphql(query=query % "interface__device__ids")
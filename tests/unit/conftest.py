@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# The bootstrap scripts and the generators are executed by `infrahubctl run`, which
+# puts their directory on the path; do the same so that they can be imported here.
+sys.path.append(str(Path(__file__).parent.parent.parent / "bootstrap"))
+sys.path.append(str(Path(__file__).parent.parent.parent / "generators"))
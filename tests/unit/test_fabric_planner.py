@@ -0,0 +1,585 @@
+from fabric_planner import (
+    L2_INTERFACE_KIND,
+    L3_INTERFACE_KIND,
+    PORT_TEMPLATES,
+    InterconnectAllocator,
+    PrefixPools,
+    TopologyElement,
+    generate_asn,
+    paired_port,
+    plan_fabric,
+    port_map,
+)
+
+POOLS = PrefixPools(
+    loopback="10.1.0.0/24",
+    loopback_vtep="10.1.1.0/24",
+    management="172.16.0.0/24",
+    technical="10.1.2.0/24",
+)
+# Technical pool of 128 leafs
+LARGE_POOLS = PrefixPools(
+    loopback="10.1.0.0/24",
+    loopback_vtep="10.1.1.0/24",
+    management="172.16.0.0/24",
+    technical="10.2.0.0/20",
+)
+
+
+def small_fabric(border_leafs: int = 0) -> list:
+    elements = [
+        TopologyElement(
+            role="spine",
+            quantity=2,
+            device_type="CCS-720DP-48S-2F",
+            platform="Arista EOS",
+            mtu=1500,
+        ),
+        TopologyElement(
+            role="leaf",
+            quantity=2,
+            device_type="CCS-720DP-48S-2F",
+            platform="Arista EOS",
+            mtu=1500,
+        ),
+    ]
+    if border_leafs:
+        elements.append(
+            TopologyElement(
+                role="leaf",
+                quantity=border_leafs,
+                device_type="CCS-720DP-48S-2F",
+                platform="Arista EOS",
+                mtu=1500,
+                border=True,
+            )
+        )
+    return elements
+
+
+def test_generate_asn():
+    assert (
+        generate_asn(location_index=0, element_type_index=0, element_index=0) == 65100
+    )
+    assert (
+        generate_asn(location_index=0, element_type_index=1, element_index=1) == 65111
+    )
+    assert (
+        generate_asn(location_index=0, element_type_index=1, element_index=2) == 65111
+    )
+    assert (
+        generate_asn(location_index=2, element_type_index=1, element_index=3) == 65312
+    )
+
+
+def test_paired_port():
+    ports = ["p1", "p2", "p3", "p4"]
+    assert [paired_port(ports, idx) for idx in range(1, 6)] == [
+        "p1",
+        "p2",
+        "p3",
+        "p4",
+        None,
+    ]
+    assert paired_port(["p1"], 1) is None
+
+
+def test_port_map():
+    interfaces = PORT_TEMPLATES["CCS-720DP-48S-2F"].interfaces()
+    assert len(interfaces) == 56
+    assert interfaces[47:50] == ["Ethernet48", "Ethernet49/1", "Ethernet49/2"]
+    assert PORT_TEMPLATES["QFX5110-48S-S"].interfaces()[48] == "xe-0/0/48:0"
+    assert len(PORT_TEMPLATES["DCS-7060DX5-64S"].interfaces()) == 128
+    chassis = PORT_TEMPLATES["DCS-7816R3"].interfaces()
+    assert len(chassis) == 576
+    assert (chassis[0], chassis[-1]) == ("Ethernet3/1", "Ethernet18/36")
+
+    leaf = port_map("CCS-720DP-48S-2F", "leaf")
+    assert len(leaf.ports) == 14
+    assert leaf.by_role["peer"] == ("Ethernet8", "Ethernet9")
+    assert leaf.by_role["uplink"] == tuple(f"Ethernet{i}" for i in range(10, 14))
+    assert port_map("CCS-720DP-48S-2F", "leaf") is leaf
+    assert port_map("CCS-720DP-48S-2F", "firewall") is None
+
+    # The scalable groups grow to the demand, up to the ports of the device type
+    spine = port_map("CCS-720DP-48S-2F", "spine", (("leaf", 32), ("uplink", 0)))
+    assert len(spine.by_role["leaf"]) == 32
+    assert spine.by_role["leaf"][9:11] == ("Ethernet10", "Ethernet15")
+    assert spine.by_role["uplink"] == ("Ethernet11", "Ethernet12")
+    spine = port_map("CCS-720DP-48S-2F", "spine", (("leaf", 100),))
+    assert len(spine.by_role["leaf"]) == 52
+    assert len(spine.ports) == 56
+
+    # Growing the fabric never moves the ports already assigned
+    small = port_map("CCS-720DP-48S-2F", "spine", (("leaf", 10), ("uplink", 2)))
+    large = port_map("CCS-720DP-48S-2F", "spine", (("leaf", 12), ("uplink", 4)))
+    assert large.by_role["uplink"] == (
+        "Ethernet11",
+        "Ethernet12",
+        "Ethernet50/4",
+        "Ethernet50/3",
+    )
+    assert set(small.ports) <= set(large.ports)
+    for role, names in small.by_role.items():
+        assert large.by_role[role][: len(names)] == names
+
+
+def test_plan_devices_and_interfaces():
+    plan = plan_fabric(
+        topology_name="fra05-pod1",
+        topology_index=0,
+        location_shortname="FRA05",
+        elements=small_fabric(),
+        pools=POOLS,
+        underlay="ebgp",
+        overlay="ebgp",
+    )
+
+    assert plan.complete
+    assert [device.name for device in plan.devices] == [
+        "fra05-pod1-spine1",
+        "fra05-pod1-spine2",
+        "fra05-pod1-leaf1",
+        "fra05-pod1-leaf2",
+    ]
+    assert [device.asn for device in plan.devices] == [65100, 65100, 65111, 65111]
+
+    spine1 = plan.get_device("fra05-pod1-spine1")
+    assert len(spine1.interfaces) == 17
+    loopback, vtep, mgmt = spine1.interfaces[:3]
+    assert (loopback.name, loopback.address) == ("Loopback0", "10.1.0.1/32")
+    assert (vtep.name, vtep.address) == ("Loopback1", "10.1.1.1/32")
+    assert (mgmt.name, mgmt.address) == ("Management0", "172.16.0.1/24")
+    assert mgmt.description == "management0.fra05-pod1-spine1"
+
+    leaf1 = plan.get_device("fra05-pod1-leaf1")
+    kinds = {interface.name: interface.kind for interface in leaf1.interfaces}
+    assert kinds["Ethernet1"] == L2_INTERFACE_KIND
+    assert kinds["Ethernet8"] == L2_INTERFACE_KIND
+    assert kinds["Ethernet10"] == L3_INTERFACE_KIND
+
+
+def test_plan_cabling():
+    plan = plan_fabric(
+        topology_name="fra05-pod1",
+        topology_index=0,
+        location_shortname="FRA05",
+        elements=small_fabric(),
+        pools=POOLS,
+        underlay="ebgp",
+    )
+
+    uplinks = [link for link in plan.links if link.kind == L3_INTERFACE_KIND]
+    peer_links = [link for link in plan.links if link.kind == L2_INTERFACE_KIND]
+    assert len(uplinks) == 4
+    assert len(peer_links) == 2
+
+    first = uplinks[0]
+    assert (first.a_device, first.a_interface) == ("fra05-pod1-spine1", "Ethernet1")
+    assert (first.b_device, first.b_interface) == ("fra05-pod1-leaf1", "Ethernet10")
+    assert first.prefix == "10.1.2.0/31"
+    assert (first.a_address, first.b_address) == ("10.1.2.0/31", "10.1.2.1/31")
+    assert (
+        first.a_description
+        == "ethernet1.fra05-pod1-spine1 to ethernet10.fra05-pod1-leaf1"
+    )
+    assert first.prefix_description == "fra05-ico-10.1.2.0"
+    assert [link.prefix for link in uplinks] == [
+        "10.1.2.0/31",
+        "10.1.2.2/31",
+        "10.1.2.4/31",
+        "10.1.2.6/31",
+    ]
+
+    assert len(plan.bgp_sessions) == 8
+    assert sorted(group.name for group in plan.bgp_groups) == [
+        "fra05-pod1-underlay-leaf-pair1-spine",
+        "fra05-pod1-underlay-spine-leaf-pair1",
+    ]
+    spine_session, leaf_session = plan.bgp_sessions[:2]
+    assert spine_session.peer_session is None
+    assert leaf_session.peer_session == spine_session.name
+    assert (leaf_session.local_address, leaf_session.remote_address) == (
+        "10.1.2.1/31",
+        "10.1.2.0/31",
+    )
+
+
+def test_plan_border_leafs():
+    plan = plan_fabric(
+        topology_name="de2-pod1",
+        topology_index=2,
+        location_shortname="DE2",
+        elements=small_fabric(border_leafs=2),
+        pools=POOLS,
+        underlay="ebgp",
+    )
+
+    assert "de2-pod1-borderleaf1" in [device.name for device in plan.devices]
+    border_links = [
+        link for link in plan.links if link.b_device.startswith("de2-pod1-borderleaf")
+    ]
+    assert [(link.a_interface, link.b_interface) for link in border_links] == [
+        ("Ethernet11", "Ethernet10"),
+        ("Ethernet11", "Ethernet11"),
+        ("Ethernet12", "Ethernet10"),
+        ("Ethernet12", "Ethernet11"),
+    ]
+    assert {session.name for session in plan.bgp_sessions} >= {
+        f"borderleaf-{link.prefix}" for link in border_links
+    }
+
+
+def test_interconnect_allocator():
+    allocator = InterconnectAllocator("10.1.2.0/29", block_size=2)
+    assert str(allocator.subnet("sp1", "lf1", leaf_idx=1, spine_idx=1)) == (
+        "10.1.2.0/31"
+    )
+    assert str(allocator.subnet("sp2", "lf1", leaf_idx=1, spine_idx=2)) == (
+        "10.1.2.2/31"
+    )
+    assert str(
+        allocator.subnet("sp1", "blf1", leaf_idx=1, spine_idx=1, border=True)
+    ) == ("10.1.2.4/31")
+    # The second block is shared with the first border leaf
+    assert str(allocator.subnet("sp1", "lf2", leaf_idx=2, spine_idx=1)) == (
+        "10.1.2.6/31"
+    )
+    assert allocator.subnet("sp2", "lf2", leaf_idx=2, spine_idx=2) is None
+    # A link keeps its /31
+    assert str(allocator.subnet("sp1", "lf1", leaf_idx=1, spine_idx=1)) == (
+        "10.1.2.0/31"
+    )
+
+
+def test_interconnect_allocator_existing():
+    allocator = InterconnectAllocator(
+        "10.1.2.0/24",
+        block_size=2,
+        existing={("sp1", "lf2"): "10.1.2.64/31", ("sp1", "lf9"): "10.2.0.0/31"},
+    )
+    assert str(allocator.subnet("sp1", "lf2", leaf_idx=2, spine_idx=1)) == (
+        "10.1.2.64/31"
+    )
+    assert str(allocator.subnet("sp2", "lf2", leaf_idx=2, spine_idx=2)) == (
+        "10.1.2.6/31"
+    )
+    # Outside of the pool, the link gets a new /31
+    assert str(allocator.subnet("sp1", "lf9", leaf_idx=9, spine_idx=1)) == (
+        "10.1.2.32/31"
+    )
+    # The position of lf17 is taken by lf2, it gets the first free /31
+    assert str(allocator.subnet("sp1", "lf17", leaf_idx=17, spine_idx=1)) == (
+        "10.1.2.0/31"
+    )
+
+
+def test_plan_interconnects_are_stable():
+    def uplink_prefixes(border_leafs: int) -> dict:
+        plan = plan_fabric(
+            topology_name="de2-pod1",
+            topology_index=2,
+            location_shortname="DE2",
+            elements=small_fabric(border_leafs=border_leafs),
+            pools=POOLS,
+        )
+        return {
+            (link.a_device, link.b_device): link.prefix
+            for link in plan.links
+            if link.prefix
+        }
+
+    with_border = uplink_prefixes(border_leafs=2)
+    assert with_border[("de2-pod1-spine2", "de2-pod1-borderleaf2")] == ("10.1.2.250/31")
+    assert uplink_prefixes(border_leafs=0).items() <= with_border.items()
+
+    plan = plan_fabric(
+        topology_name="de2-pod1",
+        topology_index=2,
+        location_shortname="DE2",
+        elements=small_fabric(border_leafs=2),
+        pools=PrefixPools(
+            loopback="10.1.0.0/24",
+            loopback_vtep="10.1.1.0/24",
+            management="172.16.0.0/24",
+            technical="10.1.2.0/29",
+        ),
+    )
+    assert not plan.complete
+    assert "too small" in plan.errors[0]
+
+
+def test_plan_interconnects_survive_growth():
+    def uplink_prefixes(
+        spines: int, leafs: int, border_leafs: int, existing: dict
+    ) -> dict:
+        elements = [
+            TopologyElement(
+                role="spine",
+                quantity=spines,
+                device_type="CCS-720DP-48S-2F",
+                platform="Arista EOS",
+            ),
+            TopologyElement(
+                role="leaf",
+                quantity=leafs,
+                device_type="NCS-5501-SE",
+                platform="Cisco IOS",
+            ),
+            TopologyElement(
+                role="leaf",
+                quantity=border_leafs,
+                device_type="NCS-5501-SE",
+                platform="Cisco IOS",
+                border=True,
+            ),
+        ]
+        plan = plan_fabric(
+            topology_name="pod",
+            topology_index=0,
+            location_shortname="POD",
+            elements=elements,
+            pools=LARGE_POOLS,
+            existing_interconnects=existing,
+        )
+        assert plan.complete and not plan.errors
+        return {
+            (link.a_device, link.b_device): link.prefix
+            for link in plan.links
+            if link.prefix
+        }
+
+    small = uplink_prefixes(spines=2, leafs=4, border_leafs=2, existing={})
+    large = uplink_prefixes(spines=4, leafs=8, border_leafs=4, existing=small)
+    assert len(large) == 4 * 12
+    assert len(set(large.values())) == 4 * 12
+    assert small.items() <= large.items()
+
+
+def test_plan_interconnects_fill_the_pool():
+    def plan(spines: int, leafs: int, border_leafs: int = 0, **kwargs):
+        elements = [
+            TopologyElement(
+                role="spine",
+                quantity=spines,
+                device_type="CCS-720DP-48S-2F",
+                platform="Arista EOS",
+            ),
+            TopologyElement(
+                role="leaf",
+                quantity=leafs,
+                device_type="CCS-720DP-48S-2F",
+                platform="Arista EOS",
+            ),
+        ]
+        if border_leafs:
+            elements.append(
+                TopologyElement(
+                    role="leaf",
+                    quantity=border_leafs,
+                    device_type="CCS-720DP-48S-2F",
+                    platform="Arista EOS",
+                    border=True,
+                )
+            )
+        return plan_fabric(
+            topology_name="pod",
+            topology_index=0,
+            location_shortname="POD",
+            elements=elements,
+            pools=POOLS,
+            **kwargs,
+        )
+
+    two_by_ten = plan(spines=2, leafs=10)
+    assert two_by_ten.complete and not two_by_ten.errors
+    prefixes = [link.prefix for link in two_by_ten.links if link.prefix]
+    assert prefixes[:4] == ["10.1.2.0/31", "10.1.2.2/31", "10.1.2.4/31", "10.1.2.6/31"]
+    assert prefixes[-1] == "10.1.2.38/31"
+
+    four_by_eight = plan(spines=4, leafs=8, border_leafs=2)
+    assert four_by_eight.complete and not four_by_eight.errors
+    assert len({link.prefix for link in four_by_eight.links if link.prefix}) == 40
+
+    # The reserved spines are capped by the size of the pool
+    reserved = plan(spines=2, leafs=10, max_spines=16)
+    assert reserved.complete and not reserved.errors
+    leaf2 = [
+        link.prefix
+        for link in reserved.links
+        if link.prefix and link.b_device == "pod-leaf2"
+    ]
+    assert leaf2 == ["10.1.2.24/31", "10.1.2.26/31"]
+
+
+def test_plan_scaled_fabric():
+    elements = [
+        TopologyElement(
+            role="spine",
+            quantity=4,
+            device_type="CCS-720DP-48S-2F",
+            platform="Arista EOS",
+        ),
+        TopologyElement(
+            role="leaf",
+            quantity=32,
+            device_type="CCS-720DP-48S-2F",
+            platform="Arista EOS",
+        ),
+    ]
+    plan = plan_fabric(
+        topology_name="pod",
+        topology_index=0,
+        location_shortname="POD",
+        elements=elements,
+        pools=LARGE_POOLS,
+        underlay="ebgp",
+    )
+
+    assert plan.complete and not plan.errors
+    uplinks = [link for link in plan.links if link.kind == L3_INTERFACE_KIND]
+    assert len(uplinks) == 4 * 32
+    assert (uplinks[-1].a_interface, uplinks[-1].b_interface) == (
+        "Ethernet36",
+        "Ethernet13",
+    )
+
+
+def test_plan_fabric_over_port_capacity():
+    elements = [
+        TopologyElement(
+            role="spine",
+            quantity=2,
+            device_type="CCS-720DP-48S-2F",
+            platform="Arista EOS",
+        ),
+        TopologyElement(
+            role="leaf",
+            quantity=60,
+            device_type="NCS-5501-SE",
+            platform="Cisco IOS",
+        ),
+    ]
+    plan = plan_fabric(
+        topology_name="pod",
+        topology_index=0,
+        location_shortname="POD",
+        elements=elements,
+        pools=LARGE_POOLS,
+    )
+
+    assert not plan.complete
+    assert plan.errors[0] == (
+        "A spine CCS-720DP-48S-2F has 52 interfaces flagged as 'leaf', 60 are needed by the topology"
+    )
+
+    elements[0] = TopologyElement(
+        role="spine", quantity=2, device_type="DCS-7060DX5-64S", platform="Arista EOS"
+    )
+    plan = plan_fabric(
+        topology_name="pod",
+        topology_index=0,
+        location_shortname="POD",
+        elements=elements,
+        pools=LARGE_POOLS,
+    )
+    assert plan.complete and not plan.errors
+
+
+def test_plan_every_device_type():
+    for device_type in PORT_TEMPLATES:
+        elements = [
+            TopologyElement(
+                role=role,
+                quantity=2,
+                device_type=device_type,
+                platform="Arista EOS",
+            )
+            for role in ("spine", "leaf")
+        ]
+        plan = plan_fabric(
+            topology_name="pod",
+            topology_index=0,
+            location_shortname="POD",
+            elements=elements,
+            pools=POOLS,
+        )
+
+        assert plan.complete and not plan.errors, device_type
+        assert len(plan.devices) == 4, device_type
+
+
+def test_plan_fabric_pool_exhausted():
+    plan = plan_fabric(
+        topology_name="fra05-pod1",
+        topology_index=1,
+        location_shortname="FRA05",
+        elements=small_fabric(),
+        pools=PrefixPools(
+            loopback="10.1.0.0/24",
+            loopback_vtep="10.1.1.0/30",
+            management="172.16.0.0/24",
+            technical="10.1.2.0/24",
+        ),
+    )
+
+    assert not plan.complete
+    assert not plan.devices
+    assert plan.errors == [
+        "The loopback VTEP pool 10.1.1.0/30 is too small for the 4 devices of fra05-pod1"
+    ]
+
+
+def test_plan_without_spines():
+    plan = plan_fabric(
+        topology_name="lab",
+        topology_index=0,
+        location_shortname="LAB",
+        elements=small_fabric()[1:],
+        pools=POOLS,
+    )
+
+    assert not plan.complete
+    assert not plan.links
+    assert len(plan.devices) == 2
+
+
+def test_plan_large_fabric():
+    elements = [
+        TopologyElement(
+            role="spine",
+            quantity=8,
+            device_type="CCS-720DP-48S-2F",
+            platform="Arista EOS",
+        ),
+        TopologyElement(
+            role="leaf",
+            quantity=48,
+            device_type="NCS-5501-SE",
+            platform="Cisco IOS",
+        ),
+    ]
+
+    plan = plan_fabric(
+        topology_name="big",
+        topology_index=0,
+        location_shortname="BIG",
+        elements=elements,
+        pools=PrefixPools(
+            loopback="10.0.0.0/16",
+            loopback_vtep="10.1.0.0/16",
+            management="10.2.0.0/16",
+            technical="10.3.0.0/16",
+        ),
+        underlay="ebgp",
+    )
+
+    assert plan.complete and not plan.errors
+    assert len(plan.devices) == 56
+    uplinks = [link for link in plan.links if link.kind == L3_INTERFACE_KIND]
+    peer_links = [link for link in plan.links if link.kind == L2_INTERFACE_KIND]
+    assert len(uplinks) == 8 * 48
+    assert len(peer_links) == 24 * 2
+    assert len({link.prefix for link in uplinks}) == len(uplinks)
+    # Every spine port facing a leaf is used once
+    assert len({(link.a_device, link.a_interface) for link in uplinks}) == len(uplinks)
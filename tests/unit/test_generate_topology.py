@@ -0,0 +1,162 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from generate_topology import (
+    InterfaceIndex,
+    LocationContexts,
+    existing_interconnects,
+    prefetch_addresses,
+)
+
+
+def fake_node(**values) -> SimpleNamespace:
+    return SimpleNamespace(
+        **{name: SimpleNamespace(value=value) for name, value in values.items()}
+    )
+
+
+class FilteringClient:
+    def __init__(self, failures: int = 0) -> None:
+        self.queries: list = []
+        self.failures = failures
+        self.store = SimpleNamespace(get=lambda key, kind: fake_node(name=key))
+
+    async def filters(self, kind: str, location__shortname__value: str, branch: str):
+        self.queries.append((kind, location__shortname__value))
+        await asyncio.sleep(0)
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("Infrahub is unreachable")
+        if kind == "InfraVLAN":
+            return [
+                fake_node(name="den1_server-pxe", role="server"),
+                fake_node(name="den1_management", role="management"),
+            ]
+        return [
+            fake_node(prefix="10.0.0.0/24", role="management"),
+            fake_node(prefix="10.1.0.0/24", role="loopback"),
+        ]
+
+
+async def test_location_contexts_are_loaded_once():
+    client = FilteringClient()
+    contexts = LocationContexts(client=client, branch="main")
+
+    first, second = await asyncio.gather(
+        contexts.get(location_shortname="DEN1"),
+        contexts.get(location_shortname="DEN1"),
+    )
+
+    assert first is second
+    assert sorted(client.queries) == [("InfraPrefix", "DEN1"), ("InfraVLAN", "DEN1")]
+    assert first.vlan(name="den1_server-pxe").role.value == "server"
+    assert len(first.vlans_with_role(role="server")) == 1
+    assert first.prefixes["loopback"][0].prefix.value == "10.1.0.0/24"
+    assert first.backbone_vrf.name.value == "Backbone"
+
+
+async def test_location_contexts_retry_a_failed_load():
+    client = FilteringClient(failures=1)
+    contexts = LocationContexts(client=client, branch="main")
+
+    with pytest.raises(ConnectionError):
+        await contexts.get(location_shortname="DEN1")
+    context = await contexts.get(location_shortname="DEN1")
+
+    assert context.prefixes["management"][0].prefix.value == "10.0.0.0/24"
+    assert len(client.queries) == 4
+
+
+def fake_interface(id: str, device_id: str, name: str, role: str) -> SimpleNamespace:
+    interface = fake_node(name=name, role=role)
+    interface.id = id
+    interface.device = SimpleNamespace(id=device_id)
+    interface.get_kind = lambda: "InfraInterfaceL3"
+    return interface
+
+
+class AddressClient:
+    def __init__(self, addresses: dict) -> None:
+        self.addresses = addresses
+        self.queries: list = []
+
+    async def filters(
+        self,
+        kind: str,
+        interface__ids: list,
+        branch: str,
+        property: bool,
+        parallel: bool,
+    ):
+        self.queries.append((kind, sorted(interface__ids)))
+        return [
+            SimpleNamespace(
+                address=SimpleNamespace(value=address),
+                interface=SimpleNamespace(id=interface_id),
+            )
+            for address, interface_id in self.addresses.items()
+        ]
+
+
+def interface_index_fixture() -> InterfaceIndex:
+    interface_index = InterfaceIndex()
+    for device_id, name, role in (
+        ("d1", "pod-spine1", "spine"),
+        ("d2", "pod-leaf2", "leaf"),
+        ("d3", "pod-leaf1", "leaf"),
+    ):
+        device = fake_node(name=name, role=role)
+        device.id = device_id
+        interface_index.devices[device_id] = device
+    for interface in (
+        fake_interface("i1", "d1", "Ethernet2", "leaf"),
+        fake_interface("i2", "d2", "Ethernet10", "uplink"),
+        fake_interface("i3", "d3", "Ethernet12", "peer"),
+        fake_interface("i4", "d1", "Loopback0", "loopback"),
+    ):
+        interface_index.add(interface)
+    return interface_index
+
+
+async def test_prefetch_addresses():
+    client = AddressClient(addresses={"10.1.2.4/31": "i1"})
+
+    addresses = await prefetch_addresses(
+        client=client, branch="main", interface_index=interface_index_fixture()
+    )
+
+    assert [address.address.value for address in addresses] == ["10.1.2.4/31"]
+    assert client.queries == [("InfraIPAddress", ["i1", "i2", "i3", "i4"])]
+
+
+async def test_prefetch_addresses_without_interfaces():
+    client = AddressClient(addresses={})
+
+    addresses = await prefetch_addresses(
+        client=client, branch="main", interface_index=InterfaceIndex()
+    )
+
+    assert addresses == []
+    assert client.queries == []
+
+
+def test_existing_interconnects():
+    addresses = [
+        SimpleNamespace(
+            address=SimpleNamespace(value=address),
+            interface=SimpleNamespace(id=interface_id),
+        )
+        for address, interface_id in (
+            ("10.1.2.4/31", "i1"),
+            ("10.1.2.5/31", "i2"),
+            ("10.1.2.6/31", "i3"),
+            ("10.1.0.1/32", "i4"),
+        )
+    ]
+
+    links = existing_interconnects(
+        interface_index=interface_index_fixture(), addresses=addresses
+    )
+
+    assert links == {("pod-spine1", "pod-leaf2"): "10.1.2.4/31"}
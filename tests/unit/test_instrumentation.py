@@ -0,0 +1,72 @@
+import json
+
+import httpx
+from infrahub_sdk import Config, InfrahubClient
+
+from instrumentation import Instrumentation, instrumented
+
+
+async def requester(url: str, method, headers, timeout, payload=None) -> httpx.Response:
+    body = {"data": {"InfraDeviceCreate": {"ok": True, "object": {"id": "1234"}}}}
+    return httpx.Response(
+        status_code=200,
+        content=json.dumps(body).encode(),
+        request=httpx.Request(method="POST", url=url),
+    )
+
+
+@instrumented
+async def save_device(client: InfrahubClient, kind_name: str) -> dict:
+    return await client.execute_graphql(
+        query='mutation {\n    InfraDeviceCreate(data: {name: {value: "leaf1"}}) {\n ok\n }\n}'
+    )
+
+
+async def build_devices(client: InfrahubClient) -> None:
+    for _ in range(2):
+        await save_device(client, kind_name="InfraDevice")
+
+
+async def test_instrumentation(tmp_path):
+    client = InfrahubClient(
+        config=Config(address="http://infrahub", requester=requester, api_token="x")
+    )
+    instrumentation = Instrumentation(client=client)
+    instrumentation.install()
+    await build_devices(client=client)
+    instrumentation.uninstall()
+    # Not measured once uninstalled
+    await build_devices(client=client)
+
+    calls = instrumentation.calls[("save_device", "build_devices", "InfraDevice")]
+    assert calls.calls == 2
+    requests = instrumentation.requests[("save_device", "mutation", "InfraDevice")]
+    assert requests.calls == 2
+    assert requests.sent > 0 and requests.received > 0
+    assert sum(requests.histogram.values()) == 2
+    assert "filters" not in client.__dict__
+
+    instrumentation.write(path=tmp_path / "report.json")
+    report = json.loads((tmp_path / "report.json").read_text())
+    assert report["calls"][0]["function"] == "save_device"
+
+
+async def test_instrumentation_positional_kind():
+    client = InfrahubClient(
+        config=Config(address="http://infrahub", requester=requester, api_token="x")
+    )
+    instrumentation = Instrumentation(client=client)
+
+    async def get(kind: str, **kwargs) -> str:
+        return kind
+
+    get_device = instrumentation._wrap(function="get", method=get)
+    assert await get_device("InfraDevice", name__value="leaf1") == "InfraDevice"
+    await get_device(kind="InfraInterfaceL3")
+
+    assert ("get", "test_instrumentation_positional_kind", "InfraDevice") in (
+        instrumentation.calls
+    )
+    assert ("get", "test_instrumentation_positional_kind", "InfraInterfaceL3") in (
+        instrumentation.calls
+    )
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import time
+
+import httpx
+import pytest
+from infrahub_sdk import Config, InfrahubClient
+from instrumentation import Instrumentation
+from recorder import (
+    RequestRecorder,
+    parse_request,
+    run_with_virtual_clock,
+    set_phase,
+)
+
+GRAPHQL_URL = "http://infrahub/graphql/main"
+
+
+def test_parse_request():
+    assert parse_request(
+        url=GRAPHQL_URL, payload={"query": "query {\n    InfraDevice {\n"}
+    ) == ("query", "InfraDevice", None)
+    assert parse_request(
+        url=GRAPHQL_URL,
+        payload={"query": "mutation ($name: String) {\n    InfraDeviceUpsert(data: {"},
+    ) == ("mutation", "InfraDevice", "InfraDeviceUpsert")
+    assert parse_request(
+        url="http://infrahub/api/artifact/generate/1234", payload={"nodes": []}
+    ) == ("mutation", "/api/artifact/generate/1234", None)
+    assert parse_request(
+        url="http://infrahub/api/auth/login", payload={"username": "admin"}
+    ) == ("query", "/api/auth/login", None)
+
+
+def mutation(name: str) -> str:
+    return f'mutation {{\n    InfraDeviceCreate(data: {{name: {{value: "{name}"}}}}) {{\n ok\n }}\n}}'
+
+
+def test_recorder_times_the_phases_on_a_virtual_clock(
+    caplog: pytest.LogCaptureFixture,
+):
+    async def requester(**kwargs):
+        await asyncio.sleep(10)
+        return httpx.Response(
+            status_code=200,
+            json={"data": {"InfraDeviceCreate": {"ok": True}}},
+            request=httpx.Request(method="POST", url=kwargs["url"]),
+        )
+
+    async def generate() -> RequestRecorder:
+        client = InfrahubClient(
+            config=Config(address="http://infrahub", requester=requester, api_token="x")
+        )
+        recorder = RequestRecorder(client=client, dry_run=True)
+        recorder.install()
+        set_phase("devices")
+        await asyncio.gather(
+            *(client.execute_graphql(query=mutation(name)) for name in ("l1", "l2"))
+        )
+        set_phase("cabling")
+        for name in ("leaf1", "leaf2"):
+            await client.execute_graphql(query=mutation(name))
+        recorder.uninstall()
+        return recorder
+
+    start = time.perf_counter()
+    recorder = run_with_virtual_clock(generate())
+
+    # The latency is not waited for, the concurrent requests overlap
+    assert time.perf_counter() - start < 10
+    with caplog.at_level(logging.INFO):
+        recorder.log_report(log=logging.getLogger(__name__))
+    assert "devices: 0 queries, 2 mutations, estimated 10.00s" in caplog.text
+    assert "cabling: 0 queries, 2 mutations, estimated 20.00s" in caplog.text
+    assert "Estimated wall time 30.00s for 4 calls" in caplog.text
+
+
+async def test_hooks_are_uninstalled_in_reverse_order():
+    async def requester(**kwargs):
+        raise AssertionError("No request is sent")
+
+    client = InfrahubClient(
+        config=Config(address="http://infrahub", requester=requester, api_token="x")
+    )
+    recorder = RequestRecorder(client=client)
+    instrumentation = Instrumentation(client=client)
+    recorder.install()
+    instrumentation.install()
+
+    with pytest.raises(RuntimeError, match="reverse order"):
+        recorder.uninstall()
+    instrumentation.uninstall()
+    recorder.uninstall()
+    assert client._request_method is requester
@@ -0,0 +1,61 @@
+import asyncio
+import logging
+from types import SimpleNamespace
+
+import pytest
+
+import render_security_policy
+
+
+def device(name: str) -> SimpleNamespace:
+    return SimpleNamespace(id=name, name=SimpleNamespace(value=name))
+
+
+class PolicyClient:
+    async def get(self, kind: str, **kwargs) -> SimpleNamespace:
+        return SimpleNamespace(id="policy")
+
+
+async def test_run_renders_devices_concurrently(monkeypatch):
+    targets = [device(f"fw{index}") for index in range(6)]
+    rendered: list = []
+    in_flight = {"now": 0, "max": 0}
+
+    async def find_policy_targets(policy, hierarchy):
+        # fw0 is also targeted through its location
+        return [*targets, targets[0]]
+
+    async def find_device_policies(target, hierarchy):
+        return []
+
+    async def render_policy_for_device(client, target, policies):
+        in_flight["now"] += 1
+        in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        await asyncio.sleep(0.01)
+        in_flight["now"] -= 1
+        if target.name.value == "fw2":
+            raise ValueError("no zone")
+        rendered.append(target.name.value)
+
+    monkeypatch.setattr(
+        render_security_policy, "find_policy_targets", find_policy_targets
+    )
+    monkeypatch.setattr(
+        render_security_policy, "find_device_policies", find_device_policies
+    )
+    monkeypatch.setattr(
+        render_security_policy, "render_policy_for_device", render_policy_for_device
+    )
+
+    with pytest.raises(RuntimeError, match="fw2"):
+        await render_security_policy.run(
+            client=PolicyClient(),
+            log=logging.getLogger(),
+            branch="main",
+            policy="GLOBAL_POLICY",
+            concurrency=3,
+        )
+
+    # One bad device doesn't stop the others
+    assert sorted(rendered) == ["fw0", "fw1", "fw3", "fw4", "fw5"]
+    assert in_flight["max"] == 3
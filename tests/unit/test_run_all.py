@@ -0,0 +1,73 @@
+import asyncio
+import logging
+
+import pytest
+
+from run_all import run_stages
+
+
+def recording_stage(name: str, events: list, delay: float = 0):
+    async def stage(client, log, branch) -> None:
+        events.append(f"start {name}")
+        await asyncio.sleep(delay)
+        events.append(f"end {name}")
+
+    return stage
+
+
+async def test_run_stages_follows_dependencies():
+    events: list = []
+    stages = {
+        "basic": (recording_stage("basic", events, delay=0.01), []),
+        "location": (recording_stage("location", events), ["basic"]),
+        "security": (recording_stage("security", events), []),
+        "firewall": (recording_stage("firewall", events), ["location", "security"]),
+    }
+    await run_stages(client=None, log=logging.getLogger(), branch="main", stages=stages)
+
+    assert events.index("end basic") < events.index("start location")
+    assert events.index("end location") < events.index("start firewall")
+    # Independent stages don't wait for each other
+    assert events.index("end security") < events.index("end basic")
+
+
+async def test_run_stages_stops_on_failure():
+    events: list = []
+
+    async def failing(client, log, branch) -> None:
+        raise ValueError("boom")
+
+    stages = {
+        "basic": (failing, []),
+        "location": (recording_stage("location", events), ["basic"]),
+    }
+    with pytest.raises(ValueError):
+        await run_stages(
+            client=None, log=logging.getLogger(), branch="main", stages=stages
+        )
+    assert not events
+
+
+async def test_run_stages_cancels_the_running_stages(caplog: pytest.LogCaptureFixture):
+    events: list = []
+
+    async def failing(client, log, branch) -> None:
+        await asyncio.sleep(0)
+        raise ValueError("boom")
+
+    stages = {
+        "location": (failing, []),
+        "security": (recording_stage("security", events, delay=1), []),
+    }
+    with pytest.raises(ValueError):
+        await run_stages(
+            client=None, log=logging.getLogger(), branch="main", stages=stages
+        )
+
+    # The concurrent stage was stopped and awaited before returning
+    assert events == ["start security"]
+    assert not [
+        task for task in asyncio.all_tasks() if task is not asyncio.current_task()
+    ]
+    assert "location failed: boom" in caplog.text
+    assert "Cancelled security" in caplog.text
@@ -0,0 +1,65 @@
+import asyncio
+import logging
+
+from scheduler import RequestBudget, TopologyScheduler
+
+
+async def test_request_budget_serves_lowest_priority_first():
+    budget = RequestBudget(limit=1)
+    served: list = []
+
+    async def request(name: str, priority: int) -> None:
+        async with budget.slot(priority=priority):
+            served.append(name)
+            await asyncio.sleep(0)
+
+    await asyncio.gather(
+        request("first", priority=0),
+        request("late", priority=5),
+        request("early", priority=1),
+    )
+
+    assert served == ["first", "early", "late"]
+    assert budget.in_flight == 0
+
+
+class CountingClient:
+    def __init__(self) -> None:
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._request_method = self.request
+
+    async def request(self, **kwargs) -> dict:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.001)
+        self.in_flight -= 1
+        return {}
+
+    async def execute_graphql(self) -> dict:
+        return await self._request_method(url="http://infrahub/graphql")
+
+
+async def test_topology_scheduler_caps_requests():
+    client = CountingClient()
+    scheduler = TopologyScheduler(
+        client=client,
+        log=logging.getLogger(),
+        request_budget=3,
+        topology_concurrency=2,
+    )
+
+    async def generate(pod: str) -> str:
+        await asyncio.gather(*[client.execute_graphql() for _ in range(5)])
+        return pod
+
+    for pod in ("pod1", "pod2", "pod3"):
+        scheduler.add(name=pod, task=generate, pod=pod)
+    results = [name async for name, _ in scheduler.execute()]
+
+    assert sorted(results) == ["pod1", "pod2", "pod3"]
+    assert client.max_in_flight == 3
+    assert [scheduler.progress[pod].requests for pod in results] == [5, 5, 5]
+    assert all(progress.state == "done" for progress in scheduler.progress.values())
+    # The client is left as it was found
+    assert client._request_method == client.request
@@ -0,0 +1,98 @@
+from infrahub_sdk import Config, InfrahubClient
+from infrahub_sdk.node import InfrahubNode
+from infrahub_sdk.schema import NodeSchemaAPI
+from utils import NodeIndex, iter_records
+
+DEVICE_SCHEMA = NodeSchemaAPI(
+    name="Device",
+    namespace="Infra",
+    attributes=[{"name": "name", "kind": "Text"}],
+    human_friendly_id=["name__value"],
+)
+INTERFACE_SCHEMA = NodeSchemaAPI(
+    name="InterfaceL3",
+    namespace="Infra",
+    inherit_from=["InfraInterface"],
+    attributes=[{"name": "name", "kind": "Text"}],
+    relationships=[{"name": "device", "peer": "InfraDevice", "cardinality": "one"}],
+)
+
+
+def test_node_index():
+    client = InfrahubClient(config=Config(address="http://infrahub"))
+    device = InfrahubNode(
+        client=client,
+        schema=DEVICE_SCHEMA,
+        data={"id": "device-1", "name": {"value": "leaf1"}},
+    )
+    interface = InfrahubNode(
+        client=client,
+        schema=INTERFACE_SCHEMA,
+        data={
+            "id": "interface-1",
+            "name": {"value": "Ethernet1"},
+            "device": {"node": {"id": "device-1"}},
+        },
+    )
+
+    index = NodeIndex(store=client.store)
+    index.add(node=device)
+    index.add(node=interface, key="leaf1-ethernet1")
+
+    assert index.get(key="leaf1", kind="InfraDevice") is device
+    assert index.get(key=["leaf1"], kind="InfraDevice") is device
+    assert index.get(key="device-1") is device
+    # Generics and (device, name) for interfaces
+    assert index.get(key=("device-1", "Ethernet1"), kind="InfraInterface") is interface
+    assert index.all(kind="InfraInterface") == [interface]
+    assert not index.has(key="leaf1", kind="InfraInterfaceL3")
+    assert not index.has(key="leaf2")
+
+    assert client.store.get(key="leaf1-ethernet1") is interface
+    assert index.footprint()["nodes"] == 2
+
+
+class PagedClient:
+    pagination_size = 2
+
+    def __init__(self, prefixes: list) -> None:
+        self.prefixes = prefixes
+        self.queries = 0
+
+    async def execute_graphql(self, query: str, branch_name: str, tracker: str):
+        self.queries += 1
+        offset = int(tracker.rsplit("-", 1)[-1])
+        edges = [
+            {
+                "node": {
+                    "id": f"prefix-{idx}",
+                    "__typename": "InfraPrefix",
+                    "prefix": {"value": prefix},
+                    "vrf": {"node": {"id": "backbone"}},
+                }
+            }
+            for idx, prefix in enumerate(self.prefixes[offset : offset + 2], offset)
+        ]
+        return {"InfraPrefix": {"count": len(self.prefixes), "edges": edges}}
+
+
+async def test_iter_records():
+    client = PagedClient(prefixes=["10.0.0.0/31", "10.0.0.2/31", "10.0.0.4/31"])
+    index = NodeIndex()
+    async for record in iter_records(
+        client=client,
+        branch="main",
+        kind="InfraPrefix",
+        attributes=["prefix"],
+        relationships=["vrf"],
+    ):
+        index.add_record(
+            record=record, key=(record.values["vrf"], record.values["prefix"])
+        )
+
+    assert client.queries == 2
+    assert index.has(key=("backbone", "10.0.0.4/31"), kind="InfraPrefix")
+    assert index.get(key="prefix-1").values == {
+        "prefix": "10.0.0.2/31",
+        "vrf": "backbone",
+    }